@@ -4,8 +4,10 @@ import logging.config
 
 from pyrogram import Client
 
+from cache import close_cache
 from configs import TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_BOT_TOKEN
-from db import database_initialize
+from db import database_initialize, close_pool, close_replicas, close_connections_sl, close_write_buffer
+from executors import shutdown_executors
 from handlers import setup_handlers, setup_scheduler
 
 # Настройка логирования
@@ -36,3 +38,10 @@ if __name__ == '__main__':
         app.run()
     except Exception as e:
         logger.critical(f"Критическая ошибка при запуске бота: {e}")
+    finally:
+        shutdown_executors()
+        close_write_buffer()
+        close_pool()
+        close_replicas()
+        close_connections_sl()
+        close_cache()
@@ -0,0 +1,64 @@
+import logging.config
+import threading
+
+from configs import CACHE_BACKEND, CACHE_REDIS_URL, CACHE_PREFIX, CACHE_MAX_SIZE, CACHE_SOCKET_TIMEOUT
+from .base import CacheBackend, Namespace, MISSING
+from .memory import MemoryCache
+from .redis_cache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+_cache: CacheBackend | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> CacheBackend:
+    """
+    Возвращает общий кэш, выбранный в CACHE_BACKEND ('memory' или 'redis')
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if CACHE_BACKEND == 'redis':
+                    _cache = RedisCache(CACHE_REDIS_URL, prefix=CACHE_PREFIX, socket_timeout=CACHE_SOCKET_TIMEOUT)
+                else:
+                    _cache = MemoryCache(CACHE_MAX_SIZE)
+                logger.info(f'Используется кэш {type(_cache).__name__}')
+    return _cache
+
+
+def set_cache(cache: CacheBackend | None):
+    """
+    Подменяет общий кэш (None - вернуться к настройкам из конфигурации)
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is not None and _cache is not cache:
+            _cache.close()
+        _cache = cache
+
+
+def get_namespace(name: str, ttl: float | None = None) -> Namespace:
+    """
+    Возвращает пространство имен общего кэша
+    """
+    return get_cache().namespace(name, ttl)
+
+
+def get_cache_stats() -> dict:
+    """
+    Возвращает статистику общего кэша
+    """
+    return get_cache().stats()
+
+
+def close_cache():
+    """
+    Закрывает соединения общего кэша (при остановке бота)
+    """
+    set_cache(None)
+
+
+__all__ = ['CacheBackend', 'Namespace', 'MISSING', 'MemoryCache', 'RedisCache', 'get_cache', 'set_cache',
+           'get_namespace', 'get_cache_stats', 'close_cache']
@@ -0,0 +1,118 @@
+import logging.config
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# Отличает отсутствие значения в кэше от закэшированного None
+MISSING = object()
+
+
+class CacheBackend(ABC):
+    """
+    Хранилище кэша. Ключи - строки, значения - словари, списки, строки, числа и datetime.
+    Ошибки хранилища не должны ломать бота: реализация возвращает MISSING и пропускает запись.
+    """
+
+    @abstractmethod
+    def get(self, key: str):
+        """
+        Возвращает значение по ключу или MISSING
+        """
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict:
+        """
+        Возвращает словарь {ключ: значение} для найденных ключей за одно обращение к хранилищу
+        """
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: float | None = None):
+        """
+        Сохраняет значение на ttl секунд (None - без ограничения по времени)
+        """
+
+    @abstractmethod
+    def set_many(self, mapping: dict, ttl: float | None = None):
+        """
+        Сохраняет несколько значений за одно обращение к хранилищу
+        """
+
+    @abstractmethod
+    def delete(self, *keys: str):
+        """
+        Удаляет ключи
+        """
+
+    @abstractmethod
+    def clear(self):
+        """
+        Очищает хранилище и счетчики
+        """
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """
+        Возвращает счетчики попаданий, промахов и ошибок
+        """
+
+    def close(self):
+        """
+        Освобождает ресурсы хранилища (соединения)
+        """
+
+    def namespace(self, name: str, ttl: float | None = None) -> 'Namespace':
+        """
+        Возвращает пространство имен с префиксом name и TTL по умолчанию
+        """
+        return Namespace(self, name, ttl)
+
+
+class Namespace:
+    """
+    Пространство имен кэша: добавляет префикс к ключам и TTL по умолчанию.
+
+    :param backend: Хранилище кэша.
+    :param name: Имя пространства (например, 'weather'), становится префиксом ключей 'weather:'.
+    :param ttl: TTL по умолчанию в секундах.
+    """
+    __slots__ = ('backend', 'name', 'ttl', '_prefix')
+
+    def __init__(self, backend: CacheBackend, name: str, ttl: float | None = None):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self._prefix = f'{name}:'
+
+    def key(self, key) -> str:
+        return f'{self._prefix}{key}'
+
+    def get(self, key):
+        return self.backend.get(self.key(key))
+
+    def get_many(self, keys: list) -> dict:
+        found = self.backend.get_many([self.key(key) for key in keys])
+        prefix_length = len(self._prefix)
+        return {full_key[prefix_length:]: value for full_key, value in found.items()}
+
+    def set(self, key, value, ttl: float | None = None):
+        self.backend.set(self.key(key), value, self.ttl if ttl is None else ttl)
+
+    def set_many(self, mapping: dict, ttl: float | None = None):
+        self.backend.set_many({self.key(key): value for key, value in mapping.items()},
+                              self.ttl if ttl is None else ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.backend.delete(*[self.key(key) for key in keys])
+
+    def get_or_set(self, key, loader, ttl: float | None = None):
+        """
+        Возвращает значение из кэша, при промахе вызывает loader() и кэширует непустой результат
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        value = loader()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+from cache.base import CacheBackend, MISSING
+
+
+class MemoryCache(CacheBackend):
+    """
+    Потокобезопасный LRU-кэш с TTL в памяти процесса.
+
+    :param max_size: Максимальное количество записей, при превышении вытесняются давно не использованные.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+
+        self._entries: OrderedDict[str, tuple[float | None, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'deletes': 0,
+        }
+
+    def _get(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._counters['misses'] += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at is not None and expires_at < now:
+            del self._entries[key]
+            self._counters['expirations'] += 1
+            self._counters['misses'] += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self._counters['hits'] += 1
+        return value
+
+    def _set(self, key: str, value, ttl: float | None, now: float):
+        self._entries[key] = (now + ttl if ttl is not None else None, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def get(self, key: str):
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def get_many(self, keys: list[str]) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            found = {key: self._get(key, now) for key in keys}
+        return {key: value for key, value in found.items() if value is not MISSING}
+
+    def set(self, key: str, value, ttl: float | None = None):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._set(key, value, ttl, time.monotonic())
+
+    def set_many(self, mapping: dict, ttl: float | None = None):
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key, value in mapping.items():
+                self._set(key, value, ttl, now)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._counters['deletes'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for counter in self._counters:
+                self._counters[counter] = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                'backend': 'memory',
+                'max_size': self.max_size,
+                'size': len(self._entries),
+                **self._counters,
+                'hit_ratio': self._counters['hits'] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,276 @@
+import json
+import logging.config
+import socket
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from urllib.parse import urlparse
+
+from cache.base import CacheBackend, MISSING
+
+logger = logging.getLogger(__name__)
+
+
+class RedisError(Exception):
+    """
+    Ошибка, которую вернул сервер Redis
+    """
+
+
+# Сериализация значений: JSON с тегами для типов, которые возвращают функции db.db
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, dt_time):
+        return {'__time__': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'__timedelta__': value.total_seconds()}
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    raise TypeError(f'Тип {type(value).__name__} не поддерживается кэшем')
+
+
+def _decode_hook(obj: dict):
+    if len(obj) == 1:
+        (tag, value), = obj.items()
+        if tag == '__datetime__':
+            return datetime.fromisoformat(value)
+        if tag == '__date__':
+            return date.fromisoformat(value)
+        if tag == '__time__':
+            return dt_time.fromisoformat(value)
+        if tag == '__timedelta__':
+            return timedelta(seconds=value)
+        if tag == '__decimal__':
+            return Decimal(value)
+    return obj
+
+
+def encode_value(value) -> bytes:
+    return json.dumps(value, default=_encode_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def decode_value(data: bytes):
+    return json.loads(data, object_hook=_decode_hook)
+
+
+class _RespConnection:
+    """
+    Соединение с сервером по протоколу RESP (Redis serialization protocol)
+    """
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    @staticmethod
+    def _encode(command: tuple) -> bytes:
+        parts = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif isinstance(arg, (int, float)):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Соединение с Redis закрыто')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            return RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f'Неизвестный ответ Redis: {line!r}')
+
+    def pipeline(self, commands: list[tuple]) -> list:
+        """
+        Отправляет команды одним пакетом и читает ответы по порядку
+        """
+        self.sock.sendall(b''.join(self._encode(command) for command in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def execute(self, *command):
+        return self.pipeline([command])[0]
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(CacheBackend):
+    """
+    Общий для нескольких процессов кэш на сервере с протоколом Redis.
+    При недоступности сервера операции становятся промахами, а новые попытки подключения
+    выполняются не чаще, чем раз в retry_interval секунд.
+
+    :param url: Адрес вида redis://[:password@]host:port/db.
+    :param prefix: Общий префикс ключей бота.
+    :param socket_timeout: Таймаут подключения и операций в секундах.
+    :param retry_interval: Пауза после ошибки, в течение которой сервер не опрашивается.
+    :param max_idle: Сколько свободных соединений держать открытыми.
+    """
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', prefix: str = '', socket_timeout: float = 0.5,
+                 retry_interval: float = 5.0, max_idle: int = 4):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.prefix = f'{prefix}:' if prefix else ''
+        self.socket_timeout = socket_timeout
+        self.retry_interval = retry_interval
+        self.max_idle = max_idle
+
+        self._idle: list[_RespConnection] = []
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'errors': 0,
+            'round_trips': 0,
+        }
+
+    def _connect(self) -> _RespConnection:
+        conn = _RespConnection(self.host, self.port, self.socket_timeout)
+        commands = []
+        if self.password:
+            commands.append(('AUTH', self.password))
+        if self.db:
+            commands.append(('SELECT', self.db))
+        if commands:
+            conn.pipeline(commands)
+        return conn
+
+    def _pipeline(self, commands: list[tuple]):
+        """
+        Выполняет команды на свободном соединении; при ошибке возвращает None
+        """
+        if time.monotonic() < self._down_until:
+            return None
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn is None:
+                conn = self._connect()
+            replies = conn.pipeline(commands)
+        except (OSError, RedisError) as e:
+            if conn is not None:
+                conn.close()
+            with self._lock:
+                self._counters['errors'] += 1
+            if not isinstance(e, RedisError):
+                self._down_until = time.monotonic() + self.retry_interval
+            logger.warning(f'Кэш Redis {self.host}:{self.port} недоступен: {e}')
+            return None
+
+        with self._lock:
+            self._counters['round_trips'] += 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+        return replies
+
+    def _count(self, hits: int, misses: int):
+        with self._lock:
+            self._counters['hits'] += hits
+            self._counters['misses'] += misses
+
+    def get(self, key: str):
+        replies = self._pipeline([('GET', self.prefix + key)])
+        if replies is None or replies[0] is None:
+            self._count(0, 1)
+            return MISSING
+        self._count(1, 0)
+        return decode_value(replies[0])
+
+    def get_many(self, keys: list[str]) -> dict:
+        if not keys:
+            return {}
+        replies = self._pipeline([('MGET', *[self.prefix + key for key in keys])])
+        if replies is None:
+            self._count(0, len(keys))
+            return {}
+        found = {key: decode_value(data) for key, data in zip(keys, replies[0]) if data is not None}
+        self._count(len(found), len(keys) - len(found))
+        return found
+
+    def _set_command(self, key: str, value, ttl: float | None) -> tuple:
+        if ttl is None:
+            return 'SET', self.prefix + key, encode_value(value)
+        return 'SET', self.prefix + key, encode_value(value), 'PX', max(1, int(ttl * 1000))
+
+    def set(self, key: str, value, ttl: float | None = None):
+        self._pipeline([self._set_command(key, value, ttl)])
+
+    def set_many(self, mapping: dict, ttl: float | None = None):
+        if mapping:
+            self._pipeline([self._set_command(key, value, ttl) for key, value in mapping.items()])
+
+    def delete(self, *keys: str):
+        if keys:
+            self._pipeline([('DEL', *[self.prefix + key for key in keys])])
+
+    def clear(self):
+        # Удаляются только ключи бота (по префиксу), остальные данные сервера не трогаются
+        cursor = b'0'
+        while True:
+            replies = self._pipeline([('SCAN', cursor, 'MATCH', f'{self.prefix}*', 'COUNT', 1000)])
+            if replies is None:
+                break
+            cursor, keys = replies[0]
+            if keys:
+                self._pipeline([('DEL', *keys)])
+            if cursor in (b'0', 0):
+                break
+        with self._lock:
+            for counter in self._counters:
+                self._counters[counter] = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                'backend': 'redis',
+                'address': f'{self.host}:{self.port}/{self.db}',
+                'idle_connections': len(self._idle),
+                **self._counters,
+                'hit_ratio': self._counters['hits'] / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
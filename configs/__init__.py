@@ -1,3 +1,24 @@
-from .config import TELEGRAM_API_HASH, TELEGRAM_API_ID, TELEGRAM_BOT_TOKEN, OPENCAGE_API_KEY, WEATHER_API_KEY, WEATHER_BASE_URL, DATABASEPG_URL, DATABASESL_URL, POSTGRES_DATABASE, POSTGRES_HOST, POSTGRES_PASSWORD, POSTGRES_PORT, POSTGRES_USERNAME
+from .config import TELEGRAM_API_HASH, TELEGRAM_API_ID, TELEGRAM_BOT_TOKEN, OPENCAGE_API_KEY, WEATHER_API_KEY, WEATHER_BASE_URL, DATABASEPG_URL, DATABASESL_URL, POSTGRES_DATABASE, POSTGRES_HOST, POSTGRES_PASSWORD, POSTGRES_PORT, POSTGRES_USERNAME, \
+    DATABASE_BACKEND, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE, SQLITE_BUSY_TIMEOUT, SQLITE_STATEMENT_CACHE, \
+    POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE, POSTGRES_POOL_MAX_LIFETIME, POSTGRES_POOL_MAX_IDLE, \
+    POSTGRES_POOL_HEALTH_CHECK_INTERVAL, POSTGRES_POOL_TIMEOUT, POSTGRES_REPLICA_URLS, POSTGRES_REPLICA_COOLDOWN, \
+    POSTGRES_PRIMARY_READS, POSTGRES_SHARD_MAP, SLEEP_RECORDS_PARTITIONS_AHEAD, SLEEP_RECORDS_RETENTION_MONTHS, \
+    OFFLOAD_IO_WORKERS, OFFLOAD_DB_WORKERS, \
+    OFFLOAD_CPU_WORKERS, OFFLOAD_MAX_QUEUE, HTTP_TIMEOUT, CACHE_BACKEND, CACHE_REDIS_URL, \
+    CACHE_PREFIX, CACHE_MAX_SIZE, CACHE_SOCKET_TIMEOUT, USER_CACHE_TTL, WEATHER_CACHE_TTL, GEOCODE_CACHE_TTL, \
+    MIGRATION_BATCH_SIZE, EXPORT_CHUNK_SIZE, EXPORT_SPOOL_MAX_SIZE, IMPORT_BATCH_SIZE, \
+    IMPORT_MAX_FILE_SIZE, PURGE_INLINE_MAX_ROWS, PURGE_BATCH_SIZE, PURGE_MAX_BATCHES, DB_SLOW_QUERY_MS, WRITE_BEHIND_ENABLED, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_ITEMS
 
-__all__ = ['TELEGRAM_API_HASH', 'TELEGRAM_API_ID', 'TELEGRAM_BOT_TOKEN', 'OPENCAGE_API_KEY', 'WEATHER_API_KEY', 'WEATHER_BASE_URL', 'DATABASEPG_URL', 'DATABASESL_URL', 'POSTGRES_DATABASE', 'POSTGRES_HOST', 'POSTGRES_PASSWORD', 'POSTGRES_PORT', 'POSTGRES_USERNAME']
+__all__ = ['TELEGRAM_API_HASH', 'TELEGRAM_API_ID', 'TELEGRAM_BOT_TOKEN', 'OPENCAGE_API_KEY', 'WEATHER_API_KEY', 'WEATHER_BASE_URL', 'DATABASEPG_URL', 'DATABASESL_URL', 'POSTGRES_DATABASE', 'POSTGRES_HOST', 'POSTGRES_PASSWORD', 'POSTGRES_PORT', 'POSTGRES_USERNAME',
+           'DATABASE_BACKEND', 'SQLITE_MMAP_SIZE', 'SQLITE_CACHE_SIZE', 'SQLITE_BUSY_TIMEOUT', 'SQLITE_STATEMENT_CACHE',
+           'POSTGRES_POOL_MIN_SIZE', 'POSTGRES_POOL_MAX_SIZE', 'POSTGRES_POOL_MAX_LIFETIME', 'POSTGRES_POOL_MAX_IDLE',
+           'POSTGRES_POOL_HEALTH_CHECK_INTERVAL', 'POSTGRES_POOL_TIMEOUT', 'POSTGRES_REPLICA_URLS',
+           'POSTGRES_REPLICA_COOLDOWN', 'POSTGRES_PRIMARY_READS', 'POSTGRES_SHARD_MAP',
+           'SLEEP_RECORDS_PARTITIONS_AHEAD', 'SLEEP_RECORDS_RETENTION_MONTHS',
+           'OFFLOAD_IO_WORKERS', 'OFFLOAD_DB_WORKERS',
+           'OFFLOAD_CPU_WORKERS', 'OFFLOAD_MAX_QUEUE', 'HTTP_TIMEOUT', 'CACHE_BACKEND', 'CACHE_REDIS_URL',
+           'CACHE_PREFIX', 'CACHE_MAX_SIZE', 'CACHE_SOCKET_TIMEOUT', 'USER_CACHE_TTL', 'WEATHER_CACHE_TTL',
+           'GEOCODE_CACHE_TTL', 'MIGRATION_BATCH_SIZE', 'EXPORT_CHUNK_SIZE', 'EXPORT_SPOOL_MAX_SIZE',
+           'IMPORT_BATCH_SIZE', 'IMPORT_MAX_FILE_SIZE', 'PURGE_INLINE_MAX_ROWS', 'PURGE_BATCH_SIZE',
+           'PURGE_MAX_BATCHES', 'DB_SLOW_QUERY_MS',
+           'WRITE_BEHIND_ENABLED', 'WRITE_BEHIND_FLUSH_MS', 'WRITE_BEHIND_MAX_ITEMS']
@@ -21,6 +21,79 @@ POSTGRES_HOST = os.getenv('POSTGRES_HOST')
 POSTGRES_PORT = os.getenv('POSTGRES_PORT')
 POSTGRES_DATABASE = os.getenv('POSTGRES_DATABASE')
 
+# Хранилище данных бота: postgres или sqlite (файл DATABASESL_URL)
+DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'postgres')
+
+# Соединения SQLite: размер отображения файла в память и кэша страниц (байт), ожидание блокировки (мс),
+# количество скомпилированных запросов в кэше каждого соединения
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', 64 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', 256))
+
+# Пул соединений PostgreSQL
+POSTGRES_POOL_MIN_SIZE = int(os.getenv('POSTGRES_POOL_MIN_SIZE', 1))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv('POSTGRES_POOL_MAX_SIZE', 10))
+POSTGRES_POOL_MAX_LIFETIME = float(os.getenv('POSTGRES_POOL_MAX_LIFETIME', 3600))
+POSTGRES_POOL_MAX_IDLE = float(os.getenv('POSTGRES_POOL_MAX_IDLE', 300))
+POSTGRES_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('POSTGRES_POOL_HEALTH_CHECK_INTERVAL', 30))
+POSTGRES_POOL_TIMEOUT = float(os.getenv('POSTGRES_POOL_TIMEOUT', 30))
+
+# Реплики для чтения: DSN через запятую; функции из POSTGRES_PRIMARY_READS всегда читают с основного сервера
+POSTGRES_REPLICA_URLS = [url.strip() for url in os.getenv('POSTGRES_REPLICA_URLS', '').split(',') if url.strip()]
+POSTGRES_REPLICA_COOLDOWN = float(os.getenv('POSTGRES_REPLICA_COOLDOWN', 30))
+POSTGRES_PRIMARY_READS = {name.strip() for name in os.getenv('POSTGRES_PRIMARY_READS', '').split(',') if name.strip()}
+
+# Шардирование по user_id: путь к JSON-файлу карты шардов (пусто - одна база)
+POSTGRES_SHARD_MAP = os.getenv('POSTGRES_SHARD_MAP')
+
+# Месячные секции sleep_records: сколько месяцев создавать заранее и сколько хранить (0 - хранить все)
+SLEEP_RECORDS_PARTITIONS_AHEAD = int(os.getenv('SLEEP_RECORDS_PARTITIONS_AHEAD', 3))
+SLEEP_RECORDS_RETENTION_MONTHS = int(os.getenv('SLEEP_RECORDS_RETENTION_MONTHS', 0))
+
+# Исполнители блокирующих задач
+OFFLOAD_IO_WORKERS = int(os.getenv('OFFLOAD_IO_WORKERS', 8))
+OFFLOAD_DB_WORKERS = int(os.getenv('OFFLOAD_DB_WORKERS', POSTGRES_POOL_MAX_SIZE))
+OFFLOAD_CPU_WORKERS = int(os.getenv('OFFLOAD_CPU_WORKERS', 2))
+OFFLOAD_MAX_QUEUE = int(os.getenv('OFFLOAD_MAX_QUEUE', 100))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+
+# Кэш: 'memory' - в памяти процесса, 'redis' - общий для нескольких процессов бота
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_PREFIX = os.getenv('CACHE_PREFIX', 'sleep_bot')
+CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', 10000))
+CACHE_SOCKET_TIMEOUT = float(os.getenv('CACHE_SOCKET_TIMEOUT', 0.5))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))
+WEATHER_CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', 600))
+GEOCODE_CACHE_TTL = float(os.getenv('GEOCODE_CACHE_TTL', 86400))
+
+# Журнал медленных вызовов функций доступа к данным: порог, мс
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 200))
+
+# Отложенная запись изменений пользователей пачками (по умолчанию выключена)
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+WRITE_BEHIND_FLUSH_MS = float(os.getenv('WRITE_BEHIND_FLUSH_MS', 200))
+WRITE_BEHIND_MAX_ITEMS = int(os.getenv('WRITE_BEHIND_MAX_ITEMS', 500))
+
+# Миграция SQLite -> PostgreSQL: размер пачки строк на одну транзакцию
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 5000))
+
+# Экспорт данных пользователя: строк в одной порции серверного курсора,
+# размер файла в памяти (байт), после которого он переносится во временный каталог системы
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 1000))
+EXPORT_SPOOL_MAX_SIZE = int(os.getenv('EXPORT_SPOOL_MAX_SIZE', 4 * 1024 * 1024))
+
+# Загрузка истории снов из CSV: строк в одной пачке (одна команда COPY), максимальный размер файла, байт
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 5000))
+IMPORT_MAX_FILE_SIZE = int(os.getenv('IMPORT_MAX_FILE_SIZE', 20 * 1024 * 1024))
+
+# Удаление данных пользователя: история до PURGE_INLINE_MAX_ROWS записей удаляется сразу одной транзакцией,
+# большая - фоновой задачей пачками по PURGE_BATCH_SIZE строк, не больше PURGE_MAX_BATCHES пачек за запуск на шард
+PURGE_INLINE_MAX_ROWS = int(os.getenv('PURGE_INLINE_MAX_ROWS', 10000))
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 5000))
+PURGE_MAX_BATCHES = int(os.getenv('PURGE_MAX_BATCHES', 20))
+
 print(os.path.basename('./'))
 
 path = "configs/logging.json" if os.path.basename(os.path.abspath('./')) in \
@@ -1,20 +1,31 @@
 from .db import (
     get_all_reminders, get_reminder_db, get_reminder_time_db, get_all_sleep_records,
-    get_sleep_records_per_week, get_sleep_record_last_db, get_sleep_time_without_wake_db,
+    get_sleep_records_per_week, get_daily_sleep_summary, get_sleep_record_last_db, get_sleep_time_without_wake_db,
     get_wake_time_null, get_all_users, get_all_users_city_name, get_city_name, get_sleep_goal_user,
-    get_user_wake_time, get_has_provided_location, save_user_to_db, save_user_city, save_phone_number,
+    get_user_wake_time, get_has_provided_location, get_user_profile, get_all_user_profiles, get_purge_request_db,
+    save_user_to_db, save_users_bulk, save_user_city, save_phone_number,
     save_sleep_goal_db, save_wake_time_user_db, save_sleep_time_records_db, save_wake_time_records_db,
+    start_sleep_session_db, finish_sleep_session_db,
     save_sleep_quality_db, save_mood_db, save_reminder_time_db, delete_reminder_db, delete_sleep_records_db,
     delete_user_db, delete_all_data_user_db
 )
+from .cache import get_user_cache_stats
+from .execute_query import unit_of_work, get_pool_stats, close_pool, get_replica_stats, close_replicas, close_connections_sl
+from .metrics import get_query_stats, reset_query_stats
+from .write_behind import close_write_buffer, get_write_buffer_stats
 from .init import database_initialize, create_triggers_db
 from .migration import migration_sqlite_to_pg
-from .modify_table import modify_table
+from .summary import backfill_daily_summary
+from .export import export_sleep_records
+from .purge import purge_users, purge_pending_users
 
-__all__ = ['database_initialize', 'create_triggers_db','migration_sqlite_to_pg','modify_table', 'get_all_reminders', 
-           'get_reminder_db', 'get_reminder_time_db', 'get_all_sleep_records', 'get_sleep_records_per_week', 
+__all__ = ['unit_of_work', 'get_pool_stats', 'close_pool', 'get_replica_stats', 'close_replicas', 'close_connections_sl', 'get_user_cache_stats', 'get_query_stats', 'reset_query_stats',
+           'close_write_buffer', 'get_write_buffer_stats', 'database_initialize', 'create_triggers_db','migration_sqlite_to_pg', 'backfill_daily_summary', 'export_sleep_records', 'purge_users', 'purge_pending_users', 'get_all_reminders', 
+           'get_reminder_db', 'get_reminder_time_db', 'get_all_sleep_records', 'get_sleep_records_per_week', 'get_daily_sleep_summary', 
            'get_sleep_record_last_db', 'get_sleep_time_without_wake_db', 'get_wake_time_null', 'get_all_users', 
            'get_all_users_city_name', 'get_city_name', 'get_sleep_goal_user', 'get_user_wake_time', 'get_has_provided_location',
-           'save_user_to_db','save_user_city','save_phone_number','save_sleep_goal_db','save_wake_time_user_db','save_sleep_time_records_db',
-           'save_wake_time_records_db','save_sleep_quality_db','save_mood_db','save_reminder_time_db','delete_reminder_db','delete_sleep_records_db',
+           'get_user_profile', 'get_all_user_profiles', 'get_purge_request_db',
+           'save_user_to_db','save_users_bulk','save_user_city','save_phone_number','save_sleep_goal_db','save_wake_time_user_db','save_sleep_time_records_db',
+           'save_wake_time_records_db','start_sleep_session_db','finish_sleep_session_db',
+           'save_sleep_quality_db','save_mood_db','save_reminder_time_db','delete_reminder_db','delete_sleep_records_db',
            'delete_user_db','delete_all_data_user_db']
\ No newline at end of file
@@ -0,0 +1,182 @@
+import csv
+import gzip
+import io
+import logging.config
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from pytz import timezone
+
+from configs import IMPORT_BATCH_SIZE
+from db.cache import invalidates_user
+from db.db import exception_handler
+from db.execute_query import execute_query_pg, execute_copy_pg
+from db.partitions import ensure_sleep_record_partitions_between
+from db.summary import rebuild_daily_summary
+
+logger = logging.getLogger(__name__)
+
+# Столбцы, которые заполняет загрузка (id назначает последовательность)
+IMPORT_COLUMNS = ('user_id', 'sleep_time', 'wake_time', 'sleep_quality', 'mood')
+# Обязательные столбцы файла; sleep_quality и mood необязательны, прочие столбцы (например, id из экспорта) пропускаются
+REQUIRED_COLUMNS = ('sleep_time', 'wake_time')
+MAX_SESSION = timedelta(hours=24)
+# Сколько причин отказа сохраняется для ответа пользователю
+MAX_REPORTED_ERRORS = 5
+
+
+class ImportResult:
+    """
+    Итог загрузки: принятые строки, отклоненные (с первыми причинами), пропущенные повторы и время загрузки
+    """
+    __slots__ = ('accepted', 'rejected', 'duplicates', 'errors', 'elapsed')
+
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.errors: list[str] = []
+        self.elapsed = 0.0
+
+    @property
+    def rowcount(self) -> int:
+        return self.accepted
+
+    @property
+    def rate(self) -> float:
+        """
+        Скорость загрузки, строк в секунду
+        """
+        return (self.accepted + self.rejected + self.duplicates) / self.elapsed if self.elapsed else 0.0
+
+    def reject(self, line: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'строка {line}: {reason}')
+
+
+def read_batches(file, batch_size: int):
+    """
+    Читает CSV (или CSV, сжатый gzip, как в экспорте) потоком и возвращает пачки по batch_size строк
+    :return: Генератор списков (номер строки, словарь значений).
+    """
+    if file.read(2) == b'\x1f\x8b':
+        file.seek(0)
+        file = gzip.GzipFile(mode='rb', fileobj=file)
+    else:
+        file.seek(0)
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f'в файле нет столбцов: {", ".join(missing)}')
+
+    batch = []
+    for row in reader:
+        batch.append((reader.line_num, row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_time(value: str, tz) -> datetime:
+    parsed = datetime.fromisoformat(value.strip())
+    # Время без часового пояса записано в часовом поясе пользователя
+    return parsed if parsed.tzinfo else tz.localize(parsed)
+
+
+def _parse_rating(value: str | None) -> int | None:
+    if value is None or not value.strip():
+        return None
+    rating = int(value)
+    if not 1 <= rating <= 5:
+        raise ValueError(f'оценка {rating} вне диапазона 1-5')
+    return rating
+
+
+def validate_batch(user_id: int, batch: list, tz, now: datetime, result: ImportResult) -> list[tuple]:
+    """
+    Проверяет пачку строк и приводит время к UTC. Отклоненные строки учитываются в result.
+    :return: Строки для загрузки в порядке IMPORT_COLUMNS.
+    """
+    records = []
+    for line, row in batch:
+        try:
+            sleep_time = _parse_time(row['sleep_time'] or '', tz).astimezone(dt_timezone.utc)
+            wake_time = _parse_time(row['wake_time'] or '', tz).astimezone(dt_timezone.utc)
+            if not sleep_time < wake_time <= sleep_time + MAX_SESSION:
+                raise ValueError('пробуждение должно быть позже засыпания не более чем на 24 часа')
+            if wake_time > now:
+                raise ValueError('время в будущем')
+            records.append((user_id, sleep_time, wake_time,
+                            _parse_rating(row.get('sleep_quality')), _parse_rating(row.get('mood'))))
+        except ValueError as e:
+            result.reject(line, str(e))
+    return records
+
+
+def _load_batch(user_id: int, records: list[tuple], result: ImportResult):
+    """
+    Загружает пачку одной командой COPY. Сессии, которые уже есть у пользователя (то же время засыпания),
+    пропускаются, поэтому прерванную загрузку можно повторить тем же файлом.
+    """
+    first = min(record[1] for record in records)
+    last = max(record[1] for record in records)
+    cursor = execute_query_pg('''
+        SELECT sleep_time FROM public.sleep_records
+        WHERE user_id = %(user_id)s AND sleep_time >= %(first)s AND sleep_time <= %(last)s
+    ''', {'user_id': user_id, 'first': first, 'last': last})
+    if cursor is None:
+        raise RuntimeError('не удалось прочитать сохраненные записи о снах')
+    seen = {row['sleep_time'] for row in cursor.fetchall()}
+
+    new_records = []
+    for record in records:
+        if record[1] in seen:
+            result.duplicates += 1
+            continue
+        seen.add(record[1])
+        new_records.append(record)
+    if not new_records:
+        return
+
+    if not ensure_sleep_record_partitions_between(first, last):
+        raise RuntimeError('не удалось создать секции sleep_records')
+    if execute_copy_pg('public.sleep_records', IMPORT_COLUMNS, new_records) is None:
+        raise RuntimeError('не удалось загрузить записи о снах')
+    result.accepted += len(new_records)
+
+
+@invalidates_user
+@exception_handler
+def import_sleep_records(user_id: int, file, batch_size: int = IMPORT_BATCH_SIZE) -> ImportResult:
+    """
+    Загружает историю снов пользователя с id user_id из CSV (file - двоичный файл, например BytesIO).
+    Файл читается потоком, строки проверяются и приводятся к UTC пачками по batch_size,
+    каждая пачка загружается одной командой COPY. Время без часового пояса считается местным
+    временем пользователя. После загрузки дневные сводки пользователя строятся заново.
+    :return: Итог загрузки или None при ошибке (уже загруженные пачки сохраняются).
+    """
+    started = time.perf_counter()
+    result = ImportResult()
+    cursor = execute_query_pg('SELECT time_zone FROM public.users WHERE id = %(user_id)s', {'user_id': user_id})
+    user = cursor.fetchone() if cursor else None
+    tz = timezone((user or {}).get('time_zone') or 'UTC')
+    now = datetime.now(dt_timezone.utc)
+
+    try:
+        for batch in read_batches(file, batch_size):
+            records = validate_batch(user_id, batch, tz, now, result)
+            if records:
+                _load_batch(user_id, records, result)
+    except (ValueError, csv.Error, gzip.BadGzipFile) as e:
+        # Файл не читается дальше (нет нужных столбцов, не CSV, не UTF-8): загруженные пачки сохраняются
+        result.errors.append(f'файл не прочитан: {e}')
+
+    if result.accepted:
+        rebuild_daily_summary(user_id)
+    result.elapsed = time.perf_counter() - started
+    logger.info(f'Пользователь {user_id} загрузил историю снов: принято {result.accepted}, '
+                f'отклонено {result.rejected}, повторов {result.duplicates}, {result.rate:.0f} строк/с')
+    return result
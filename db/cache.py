@@ -0,0 +1,126 @@
+import inspect
+import logging.config
+import threading
+from functools import wraps
+
+from cache import MISSING, get_namespace, get_cache_stats
+from configs import USER_CACHE_TTL
+from db.execute_query.session import current_session
+
+logger = logging.getLogger(__name__)
+
+# Имена закэшированных функций чтения: при записи сбрасываются ключи пользователя для каждой из них
+_getter_names: set[str] = set()
+
+# Типы записей (db.queries.Record), которые вернули функции чтения: кэш с сериализацией в JSON (Redis)
+# хранит запись списком значений, и при чтении из кэша она собирается заново
+_record_types: dict[str, type] = {}
+
+# Увеличивается при каждом сбросе: значение, прочитанное из базы до записи, не попадет в кэш после нее
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def user_namespace():
+    """
+    Пространство имен общего кэша для данных пользователей (ключи '<user_id>:<имя функции>')
+    """
+    return get_namespace('user', USER_CACHE_TTL)
+
+
+def get_user_cache_stats() -> dict:
+    """
+    Возвращает статистику кэша, в котором хранятся данные пользователей
+    """
+    return get_cache_stats()
+
+
+def invalidate_user(user_id: int):
+    """
+    Сбрасывает все закэшированные данные пользователя с id user_id
+    """
+    invalidate_users((user_id,))
+
+
+def invalidate_users(user_ids):
+    """
+    Сбрасывает закэшированные данные нескольких пользователей одним обращением к кэшу
+    """
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    keys = [f'{user_id}:{name}' for user_id in user_ids for name in _getter_names]
+    if keys:
+        user_namespace().delete(*keys)
+
+
+def cached_user_getter(func):
+    """
+    Кэширует результат функции чтения func(user_id). Пустой результат (None) не кэшируется,
+    так как его же возвращает exception_handler при ошибке.
+    Записи (db.queries.Record) неизменяемы и хранятся в кэше как есть, строки-словари - копиями,
+    чтобы их изменение вызывающим кодом не портило кэш.
+    В единице работы (unit_of_work) кэш не используется: функция читает изменения своей транзакции,
+    которые до фиксации не должны попасть в кэш.
+    """
+    name = func.__name__
+    _getter_names.add(name)
+
+    @wraps(func)
+    def wrapper(user_id: int):
+        if current_session() is not None:
+            return func(user_id)
+        namespace = user_namespace()
+        key = f'{user_id}:{name}'
+        value = namespace.get(key)
+        if isinstance(value, list):
+            # Запись из кэша с сериализацией в JSON; без известного типа или с другим набором полей - промах
+            record_type = _record_types.get(name)
+            try:
+                return record_type._make(value)
+            except (AttributeError, TypeError):
+                value = MISSING
+        if value is not MISSING:
+            return value if isinstance(value, tuple) else dict(value)
+
+        generation = _generation
+        value = func(user_id)
+        if value is not None and generation == _generation:
+            if isinstance(value, tuple):
+                _record_types[name] = type(value)
+                namespace.set(key, value)
+            else:
+                namespace.set(key, dict(value))
+        return value
+
+    return wrapper
+
+
+def invalidates_user(func):
+    """
+    Сбрасывает кэш пользователя (первый аргумент user_id) после выполнения функции записи,
+    а внутри единицы работы - еще раз после завершения ее транзакции.
+    Поддерживает как обычные, так и асинхронные функции.
+    """
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(user_id, *args, **kwargs):
+            try:
+                return await func(user_id, *args, **kwargs)
+            finally:
+                invalidate_user(user_id)
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        try:
+            return func(user_id, *args, **kwargs)
+        finally:
+            invalidate_user(user_id)
+            # Значение, прочитанное другим запросом до фиксации единицы работы, сбрасывается после нее
+            session = current_session()
+            if session is not None:
+                session.on_finish(lambda: invalidate_user(user_id))
+
+    return wrapper
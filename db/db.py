@@ -1,20 +1,44 @@
-import inspect
 import logging.config
-from datetime import datetime
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from functools import wraps
 
 import psycopg2
 
-from db.execute_query import execute_query_pg
+from configs import PURGE_INLINE_MAX_ROWS
+from db.cache import cached_user_getter, invalidates_user, invalidate_users
+from db.execute_query import execute_query_pg, execute_prepared_pg, execute_values_pg, execute_transaction_pg, \
+    replica_read, primary_read, all_shards, user_shard, use_shard, routing_user_id, shard_for_user
+from db.metrics import CallArgs, record_call, count_rows
+from db.queries import USER_COLUMNS, Query, user_upsert_sql, users_bulk_upsert_sql
+from db.summary import refresh_daily_summary
+from db.write_behind import USERS, USER_UPDATES, SLEEP_RECORDS, write_behind, flush_pending
 
 logger = logging.getLogger(__name__)
 
 
 def exception_handler(func):
+    """
+    Перехватывает ошибки функции доступа к данным (возвращает None) и учитывает вызов в db.metrics:
+    время выполнения, количество строк и ошибки. Параметры форматируются только при записи в лог.
+    Перед вызовом дописываются отложенные изменения пользователя (db.write_behind),
+    запросы функции с user_id первым аргументом выполняются на шарде этого пользователя.
+    """
+    name = f'db.{func.__name__}'
+
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        params = ', '.join([f"{a}" for a in args] + [f"{k}={v}" for k, v in kwargs.items()])
-        logger.debug(f'Вызов функции {func.__name__} с параметрами {params}')
+        call_args = CallArgs(args, kwargs)
+        logger.debug('Вызов функции %s с параметрами %s', func.__name__, call_args)
+        started = time.perf_counter()
+        result = None
+        error = True
         try:
-            return func(*args, **kwargs)
+            flush_pending(args)
+            with user_shard(routing_user_id(args)):
+                result = func(*args, **kwargs)
+            error = False
+            return result
         except psycopg2.OperationalError as e:
             logger.error(f'Ошибка дступа к данным при выполнении функции {func.__name__}: {e}', exc_info=True)
             return
@@ -24,207 +48,419 @@ def exception_handler(func):
         except Exception as e:
             logger.error(f'Ошибка при выполнения функции {func.__name__}: {e}', exc_info=True)
             return
+        finally:
+            record_call(name, (time.perf_counter() - started) * 1000, count_rows(result), error, call_args)
 
     return wrapper
 
 
+# Столбцы профиля пользователя (get_user_profile, get_all_user_profiles)
+PROFILE_COLUMNS = ('u.id', 'u.time_zone', 'u.sleep_goal', 'u.wake_time', 'u.city_name', 'u.has_provided_location',
+                   'r.reminder_time', 'u.open_sleep_time')
+
+# Запросы чтения: каждый объявляет выбираемые столбцы и границу результата (db.queries.Query).
+# Строки читаются кортежами и возвращаются компактными записями без словаря на строку.
+# Часто выполняемые запросы (param_types) подготавливаются один раз на каждом соединении пула и выполняются по имени.
+QUERIES = {
+    query.name: query for query in (
+        Query('get_all_reminders', 'SELECT {columns} FROM public.reminders', ('user_id',), limit=None),
+        Query(
+            'get_reminder',
+            'SELECT {columns} FROM public.reminders WHERE user_id = %(user_id)s',
+            ('user_id', 'reminder_time')
+        ),
+        Query(
+            'get_reminder_time',
+            'SELECT {columns} FROM public.reminders WHERE user_id = %(user_id)s',
+            ('reminder_time',),
+            param_types={'user_id': 'bigint'}
+        ),
+        Query(
+            'get_all_sleep_records',
+            '''
+                SELECT {columns} FROM public.sleep_records
+                WHERE user_id = %(user_id)s
+                AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+                ORDER BY sleep_time DESC
+            ''',
+            ('id', 'sleep_time', 'wake_time', 'sleep_quality', 'mood'),
+            limit=None
+        ),
+        # Граница выборки - 7 последних сессий (LIMIT по индексу (user_id, sleep_time DESC))
+        Query(
+            'get_sleep_records_per_week',
+            '''
+                SELECT {columns} FROM public.sleep_records
+                WHERE user_id = %(user_id)s
+                AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+                AND wake_time IS NOT NULL
+                ORDER BY sleep_time DESC
+            ''',
+            ('sleep_time', 'wake_time'),
+            limit=7
+        ),
+        # Граница выборки - days дней
+        Query(
+            'get_daily_sleep_summary',
+            '''
+                SELECT {columns}
+                FROM public.daily_sleep_summary
+                WHERE user_id = %(user_id)s AND sleep_date >= %(since)s
+                ORDER BY sleep_date DESC
+            ''',
+            ('sleep_date', 'total_seconds', 'sessions', 'avg_quality', 'avg_mood', 'sleep_goal', 'goal_attainment'),
+            limit=None
+        ),
+        Query(
+            'get_sleep_record_last',
+            '''
+                SELECT {columns} FROM public.sleep_records
+                WHERE user_id = %(user_id)s
+                AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+                ORDER BY sleep_time DESC
+            ''',
+            ('sleep_time', 'wake_time')
+        ),
+        # Запись, которую меняет оценка сна: последняя завершенная сессия
+        Query(
+            'get_rated_sleep_record',
+            '''
+                SELECT {columns} FROM public.sleep_records
+                WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
+                ORDER BY sleep_time DESC
+            ''',
+            ('id', 'sleep_time')
+        ),
+        Query(
+            'get_sleep_time_without_wake',
+            '''
+                SELECT {columns} FROM public.users
+                WHERE id = %(user_id)s AND open_sleep_time IS NOT NULL
+            ''',
+            ('open_sleep_time AS sleep_time',),
+            param_types={'user_id': 'bigint'}
+        ),
+        # Открытая сессия сна у пользователя одна (триггер sleep_records), но старые данные могут содержать несколько
+        Query(
+            'get_wake_time_null',
+            '''
+                SELECT {columns} FROM public.sleep_records
+                WHERE user_id = %(user_id)s
+                AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+                AND wake_time IS NULL
+            ''',
+            ('wake_time',),
+            limit=None
+        ),
+        Query(
+            'get_all_users',
+            '''
+                SELECT {columns} FROM public.users u
+                WHERE NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = u.id)
+            ''',
+            ('id',) + USER_COLUMNS,
+            limit=None
+        ),
+        Query(
+            'get_all_users_city_name',
+            '''
+                SELECT {columns} FROM public.users u
+                WHERE NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = u.id)
+            ''',
+            ('id', 'city_name', 'time_zone'),
+            limit=None
+        ),
+        Query(
+            'get_user_time_zone',
+            'SELECT {columns} FROM public.users WHERE id = %(user_id)s',
+            ('time_zone',),
+            param_types={'user_id': 'bigint'}
+        ),
+        # Проверка существования пользователя: остальные столбцы не передаются
+        Query('get_user', 'SELECT {columns} FROM public.users WHERE id = %(user_id)s', ('id',)),
+        Query('get_city_name', 'SELECT {columns} FROM public.users WHERE id = %(user_id)s', ('city_name',)),
+        Query('get_sleep_goal_user', 'SELECT {columns} FROM public.users WHERE id = %(user_id)s', ('sleep_goal',)),
+        Query('get_user_wake_time', 'SELECT {columns} FROM public.users WHERE id = %(user_id)s', ('wake_time',)),
+        Query(
+            'get_has_provided_location',
+            'SELECT {columns} FROM public.users WHERE id = %(user_id)s',
+            ('has_provided_location',)
+        ),
+        # Пользователь в очереди удаления (db.purge): повторная регистрация ждет окончания удаления
+        Query(
+            'get_purge_request',
+            'SELECT {columns} FROM public.purge_queue WHERE user_id = %(user_id)s',
+            ('requested_at',)
+        ),
+        Query(
+            'get_user_profile',
+            '''
+                SELECT {columns}
+                FROM public.users u
+                LEFT JOIN public.reminders r ON r.user_id = u.id
+                WHERE u.id = %(user_id)s AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = u.id)
+            ''',
+            PROFILE_COLUMNS
+        ),
+        Query(
+            'get_all_user_profiles',
+            '''
+                SELECT {columns}
+                FROM public.users u
+                LEFT JOIN public.reminders r ON r.user_id = u.id
+                WHERE NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = u.id)
+            ''',
+            PROFILE_COLUMNS,
+            limit=None
+        ),
+        # Подсчет останавливается на limit записей: большой истории достаточно знать, что она больше порога
+        Query(
+            'count_sleep_records',
+            '''
+                SELECT {columns} FROM (
+                    SELECT 1 FROM public.sleep_records WHERE user_id = %(user_id)s LIMIT %(limit)s
+                ) AS history
+            ''',
+            ('count(*) AS records',)
+        ),
+    )
+}
+
+PREPARED_STATEMENTS = {query.name: query.statement for query in QUERIES.values() if query.statement is not None}
+
+
+def fetch(name: str, params=None):
+    """
+    Выполняет объявленный запрос QUERIES[name]
+    :return: Запись или None (limit=1), список записей или None при ошибке.
+    """
+    query = QUERIES[name]
+    if query.statement is not None:
+        cursor = execute_prepared_pg(query.statement, params, row_factory=False)
+    else:
+        cursor = execute_query_pg(query.sql, params, row_factory=False)
+    return query.load(cursor) if cursor else None
+
+
 # GET
+# Полные выборки выполняются на всех шардах (all_shards), остальные функции - на шарде пользователя.
+# Полные выборки и история читаются с реплик (replica_read). Функции, которые читают данные сразу после записи
+# или наполняют кэш после его сброса, закреплены за основным сервером (primary_read).
+# Профили, полные выборки и история снов не возвращают пользователей, чьи данные удаляются в фоне (purge_queue).
 
 # REMINDERS
 
+@replica_read
+@all_shards
 @exception_handler
 def get_all_reminders():
     """
     Возвращает список всех напоминаний
     """
-    cursor = execute_query_pg('SELECT user_id FROM public.reminders')
-
-    return cursor.fetchall() if cursor else None
+    return fetch('get_all_reminders')
 
 
+@cached_user_getter
+@primary_read
 @exception_handler
 def get_reminder_db(user_id: int):
     """
     Возвращает reminder_time для пользователя с id user_id
     """
-    cursor = execute_query_pg(
-        'SELECT * FROM public.reminders WHERE user_id = %(user_id)s',
-        {'user_id': user_id}
-    )
-
-    return cursor.fetchone() if cursor else None
+    return fetch('get_reminder', {'user_id': user_id})
 
 
+@cached_user_getter
+@primary_read
 @exception_handler
 def get_reminder_time_db(user_id: int):
     """
     Возвращает reminder_time для пользователя с id user_id
     """
-    cursor = execute_query_pg(
-        'SELECT reminder_time FROM public.reminders WHERE user_id = %(user_id)s',
-        {'user_id': user_id}
-    )
-
-    return cursor.fetchone() if cursor else None
+    return fetch('get_reminder_time', {'user_id': user_id})
 
 
 # SLEEP_RECORDS
 
+@replica_read
 @exception_handler
 def get_all_sleep_records(user_id: int):
     """
     Возвращает список всех записей о снах пользователя с id user_id
     """
-    cursor = execute_query_pg('SELECT * FROM public.sleep_records WHERE user_id = %(user_id)s',
-                      {'user_id': user_id})
-
-    return cursor.fetchall() if cursor else None
+    return fetch('get_all_sleep_records', {'user_id': user_id})
 
 
+@replica_read
 @exception_handler
 def get_sleep_records_per_week(user_id: int):
     """
-    Возвращает sleep_time и wake_time для пользователя с id user_id, если wake_time == NULL
+    Возвращает sleep_time и wake_time последних 7 завершенных записей пользователя с id user_id
     """
-    cursor = execute_query_pg('''
-        SELECT sleep_time, wake_time FROM public.sleep_records
-        WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
-        ORDER BY sleep_time DESC LIMIT 7
-    ''', {'user_id': user_id})
+    return fetch('get_sleep_records_per_week', {'user_id': user_id})
 
-    return cursor.fetchall() if cursor else None
+
+@replica_read
+@exception_handler
+def get_daily_sleep_summary(user_id: int, days: int = 7):
+    """
+    Возвращает дневные сводки сна (db.summary) пользователя с id user_id за последние days дней, новые первыми
+    """
+    return fetch('get_daily_sleep_summary', {'user_id': user_id, 'since': date.today() - timedelta(days=days)})
 
 
+@primary_read
 @exception_handler
 def get_sleep_record_last_db(user_id: int):
     """
     Возвращает sleep_time и wake_time для пользователя с id user_id
     """
-    cursor = execute_query_pg('''
-        SELECT sleep_time, wake_time FROM public.sleep_records
-        WHERE user_id = %(user_id)s
-        ORDER BY sleep_time DESC
-    ''', {'user_id': user_id})
+    return fetch('get_sleep_record_last', {'user_id': user_id})
 
-    return cursor.fetchone() if cursor else None
+
+@primary_read
+def rated_sleep_record(user_id: int):
+    """
+    Возвращает ключ (id, sleep_time) последней завершенной сессии сна пользователя с id user_id - записи,
+    к которой относится оценка (отложенная запись оценок, db.write_behind), или None
+    """
+    with user_shard(user_id):
+        return fetch('get_rated_sleep_record', {'user_id': user_id})
 
 
+@primary_read
 @exception_handler
 def get_sleep_time_without_wake_db(user_id: int):
     """
     Возвращает sleep_time для пользователя с id = user_id, если wake_time == NULL
     """
-    cursor = execute_query_pg('''
-        SELECT sleep_time FROM public.sleep_records 
-        WHERE user_id = %(user_id)s AND wake_time IS NULL
-    ''', {'user_id': user_id})
-
-    return cursor.fetchone() if cursor else None
+    return fetch('get_sleep_time_without_wake', {'user_id': user_id})
 
 
+@primary_read
 @exception_handler
 def get_wake_time_null(user_id: int):
     """
     Возвращает wake_time для пользователя с id = user_id, если wake_time == NULL
     """
-    cursor = execute_query_pg('''
-        SELECT wake_time FROM public.sleep_records
-        WHERE user_id = %(user_id)s
-        AND wake_time IS NULL
-    ''', {'user_id': user_id})
-
-    return cursor.fetchall() if cursor else None
+    return fetch('get_wake_time_null', {'user_id': user_id})
 
 # USERS
 
+@replica_read
+@all_shards
 @exception_handler
 def get_all_users():
     """
     Возвращает список всех пользователей
     """
-    cursor = execute_query_pg('SELECT * FROM public.users')
-
-    return cursor.fetchall() if cursor else None
+    return fetch('get_all_users')
 
 
+@replica_read
+@all_shards
 @exception_handler
 def get_all_users_city_name():
     """
     Возвращает список всех пользователей с их городом
     """
-    cursor = execute_query_pg('SELECT id, city_name, time_zone FROM public.users')
-
-    return cursor.fetchall() if cursor else None
+    return fetch('get_all_users_city_name')
 
 
+@cached_user_getter
+@primary_read
 @exception_handler
 def get_user_time_zone_db(user_id: int):
     """
     Возвращает time_zone для пользователя с id user_id
     """
-    cursor = execute_query_pg('SELECT time_zone FROM public.users WHERE id = %(user_id)s',
-                             {'user_id': user_id})
-
-    return cursor.fetchone() if cursor else None
+    return fetch('get_user_time_zone', {'user_id': user_id})
 
 
+@cached_user_getter
+@primary_read
 @exception_handler
 def get_user_db(user_id: int):
     """
-    Возвращает пользователя с id user_id
+    Возвращает id пользователя с id user_id (проверка существования) или None
     """
-    cursor = execute_query_pg('SELECT * FROM public.users WHERE id = %(user_id)s',
-                             {'user_id': user_id})
-
-    return cursor.fetchone() if cursor else None
+    return fetch('get_user', {'user_id': user_id})
 
 
+@cached_user_getter
+@primary_read
 @exception_handler
 def get_city_name(user_id: int):
     """
     Возвращает city_name для пользователя с id user_id
     """
-    cursor = execute_query_pg('SELECT city_name FROM public.users WHERE id = %(user_id)s',
-                             {'user_id': user_id})
-
-    return cursor.fetchone() if cursor else None
+    return fetch('get_city_name', {'user_id': user_id})
 
 
+@cached_user_getter
+@primary_read
 @exception_handler
 def get_sleep_goal_user(user_id: int):
     """
     Возвращает sleep_goal для пользователя с id user_id
     """
-    cursor = execute_query_pg('SELECT sleep_goal FROM public.users WHERE id = %(user_id)s',
-                             {'user_id': user_id})
-
-    return cursor.fetchone() if cursor else None
+    return fetch('get_sleep_goal_user', {'user_id': user_id})
 
 
+@cached_user_getter
+@primary_read
 @exception_handler
 def get_user_wake_time(user_id: int):
     """
-    Возвращает id и wake_time для пользователя с id user_id
+    Возвращает wake_time для пользователя с id user_id
     """
-    cursor = execute_query_pg('SELECT id, wake_time FROM public.users WHERE id = %(user_id)s',
-                            {'user_id': user_id})
-
-    return cursor.fetchone() if cursor else None
+    return fetch('get_user_wake_time', {'user_id': user_id})
 
 
+@cached_user_getter
+@primary_read
 @exception_handler
 def get_has_provided_location(user_id: int):
     """
     Возвращает has_provided_location для пользователя с id user_id
     """
-    cursor = execute_query_pg('SELECT id, has_provided_location FROM public.users WHERE id = %(user_id)s',
-                             {'user_id': user_id})
+    return fetch('get_has_provided_location', {'user_id': user_id})
 
-    return cursor.fetchone() if cursor else None
+
+@cached_user_getter
+@primary_read
+@exception_handler
+def get_user_profile(user_id: int):
+    """
+    Возвращает профиль пользователя с id user_id одним запросом: time_zone, sleep_goal, wake_time, city_name,
+    has_provided_location, reminder_time и sleep_time открытой сессии сна (open_sleep_time)
+    """
+    return fetch('get_user_profile', {'user_id': user_id})
+
+
+@primary_read
+@exception_handler
+def get_purge_request_db(user_id: int):
+    """
+    Возвращает requested_at, если данные пользователя с id user_id удаляются в фоне (purge_queue), иначе None
+    """
+    return fetch('get_purge_request', {'user_id': user_id})
+
+
+@replica_read
+@all_shards
+@exception_handler
+def get_all_user_profiles():
+    """
+    Возвращает профили всех пользователей (поля как в get_user_profile)
+    """
+    return fetch('get_all_user_profiles')
 
 
 # SAVE
 
+@invalidates_user
+@write_behind(USERS, lambda user_id, *args, **kwargs: {**dict(zip(USER_COLUMNS, args)), **kwargs})
 @exception_handler
 def save_user_to_db(user_id: int, 
                     username: str = None, 
@@ -240,51 +476,52 @@ def save_user_to_db(user_id: int,
     Сохраняет в базе данных пользователя с id = user_id, username, first_name, last_name, phone_number, city_name,
     sleep_goal, wake_time, has_provided_location
     """
-    
-    frame = inspect.currentframe()
-
-    args, _, _, values = inspect.getargvalues(frame)
-
-    params = {}
-    for arg in args:
-        if arg not in {'user_id', 'username', 'first_name', 
-                    'last_name', 'phone_number', 
-                    'city_name','sleep_goal', 
-                    'wake_time', 'has_provided_location', 'time_zone'}:
-            raise ValueError('Неизвестные параметры при сохранении пользователя')
-        if arg == 'sleep_goal' and values[arg] is not None and not isinstance(values[arg], float):
-            raise ValueError('Неверный тип параметра sleep_goal')
-        if arg == 'has_provided_location' and values[arg] is not None and not isinstance(values[arg], int):
-            raise ValueError('Неверный тип параметра has_provided_location')
-        if arg != 'user_id' and values[arg] is not None and not isinstance(values[arg], str):
-            raise ValueError('Неверный тип параметра ' + arg)
-        if arg != 'user_id' and values[arg] is not None:
-            params[arg] = values[arg]
-
-    insert_keys_str = ', '.join([f"{key}" for key in params.keys()])
-    insert_values_str = ', '.join([f"%({key})s" for key in params.keys()])
-    update_keys_str = ', '.join([f"{key} = %({key})s" for key in params.keys()])
-    query_str = f'''
-        INSERT INTO public.users ({'id, ' + insert_keys_str if insert_keys_str != '' else 'id'})
-        VALUES (
-            {'%(user_id)s, ' + insert_values_str if insert_values_str != '' else '%(user_id)s'}
-        )
-        ON CONFLICT(id) DO UPDATE SET
-            {update_keys_str}
-    ''' if update_keys_str != '' else f'''
-        INSERT INTO public.users ({'id, ' + insert_keys_str if insert_keys_str != '' else 'id'})
-        VALUES (
-            {'%(user_id)s, ' + insert_values_str if insert_values_str != '' else '%(user_id)s'}
-        )
-    '''
+    values = (username, first_name, last_name, phone_number, city_name,
+              sleep_goal, wake_time, has_provided_location, time_zone)
+    params = {key: value for key, value in zip(USER_COLUMNS, values) if value is not None}
+    query_str = user_upsert_sql(tuple(params))
     params['user_id'] = user_id
 
-    logger.debug(f'Параметры: {params}')
-
     execute_query_pg(query_str, params)
     logger.info(f'Пользователь  с id {user_id} сохранен в базе данных')
-    
 
+
+@exception_handler
+def save_users_bulk(users: list[dict]) -> int:
+    """
+    Сохраняет (добавляет или обновляет) нескольких пользователей.
+    Каждый элемент - словарь с ключом user_id и любыми столбцами из USER_COLUMNS;
+    пользователи одного шарда с одинаковым набором столбцов сохраняются одним запросом.
+    Повторные записи одного пользователя объединяются, более поздние значения важнее.
+    :return: Количество сохраненных пользователей.
+    """
+    merged: dict[int, dict] = {}
+    for user in users:
+        unknown = user.keys() - {'user_id', *USER_COLUMNS}
+        if unknown:
+            raise ValueError(f'Неизвестные параметры при сохранении пользователя: {", ".join(sorted(unknown))}')
+        row = merged.setdefault(user['user_id'], {})
+        row.update((key, value) for key, value in user.items() if value is not None)
+
+    groups: dict[tuple[str | None, tuple[str, ...]], list[dict]] = {}
+    for user_id, row in merged.items():
+        columns = tuple(key for key in USER_COLUMNS if key in row)
+        groups.setdefault((shard_for_user(user_id), columns), []).append(row)
+
+    try:
+        for (shard, columns), rows in groups.items():
+            query_str, template = users_bulk_upsert_sql(columns)
+            with use_shard(shard):
+                execute_values_pg(query_str, rows, template)
+    finally:
+        invalidate_users(merged)
+
+    logger.info(f'Сохранено пользователей: {len(merged)}')
+    return len(merged)
+
+
+@invalidates_user
+@write_behind(USER_UPDATES, lambda user_id, city_name: {'city_name': city_name, 'has_provided_location': 1})
 @exception_handler
 def save_user_city(user_id, city_name):
     """
@@ -300,6 +537,8 @@ def save_user_city(user_id, city_name):
     logger.info(f'Город {city_name} для пользователя с id {user_id} сохранены в базе данных')
 
 
+@invalidates_user
+@write_behind(USER_UPDATES, lambda user_id, timezone: {'time_zone': timezone})
 @exception_handler
 def save_user_time_zone_db(user_id: int, timezone: str):
     """
@@ -313,6 +552,8 @@ def save_user_time_zone_db(user_id: int, timezone: str):
     ''', {'user_id': user_id, 'timezone': timezone})
 
 
+@invalidates_user
+@write_behind(USER_UPDATES, lambda user_id, phone_number: {'phone_number': phone_number})
 @exception_handler
 def save_phone_number(user_id: int, phone_number: str):
     """
@@ -325,6 +566,8 @@ def save_phone_number(user_id: int, phone_number: str):
     ''', {'user_id': user_id, 'phone_number': phone_number})
 
 
+@invalidates_user
+@write_behind(USER_UPDATES, lambda user_id, goal: {'sleep_goal': goal})
 @exception_handler
 def save_sleep_goal_db(user_id: int, goal: float):
     """
@@ -337,6 +580,8 @@ def save_sleep_goal_db(user_id: int, goal: float):
     ''', {'user_id': user_id, 'goal': goal})
 
 
+@invalidates_user
+@write_behind(USER_UPDATES, lambda user_id, wake_time: {'wake_time': wake_time})
 @exception_handler
 def save_wake_time_user_db(user_id: int, wake_time: str):
     """
@@ -349,6 +594,7 @@ def save_wake_time_user_db(user_id: int, wake_time: str):
    ''', {'user_id': user_id, 'wake_time': wake_time})
 
 
+@invalidates_user
 @exception_handler
 def save_sleep_time_records_db(user_id: int, sleep_time: datetime):
     """
@@ -360,18 +606,59 @@ def save_sleep_time_records_db(user_id: int, sleep_time: datetime):
     ''', {'user_id': user_id, 'sleep_time': sleep_time})
 
 
+@invalidates_user
 @exception_handler
 def save_wake_time_records_db(user_id: int, wake_time: datetime):
     """
     Сохраняет wake_time для пользователя с id = user_id
     """
-    return execute_query_pg('''
+    cursor = execute_query_pg('''
         UPDATE public.sleep_records
         SET wake_time = %(wake_time)s   
         WHERE user_id = %(user_id)s AND wake_time IS NULL
     ''', {'user_id': user_id, 'wake_time': wake_time})
+    if cursor and cursor.rowcount:
+        refresh_daily_summary(user_id)
+    return cursor
 
 
+@invalidates_user
+@exception_handler
+def start_sleep_session_db(user_id: int, sleep_time: datetime):
+    """
+    Открывает сессию сна для пользователя с id = user_id, если у него нет открытой сессии.
+    Проверка и вставка выполняются одним запросом: триггер пропускает вставку, если у пользователя
+    уже отмечена открытая сессия (users.open_sleep_time).
+    :return: Курсор; rowcount == 0, если открытая сессия уже есть
+    """
+    return execute_query_pg('''
+        INSERT INTO public.sleep_records (user_id, sleep_time)
+        VALUES (%(user_id)s, %(sleep_time)s)
+        RETURNING id, sleep_time
+    ''', {'user_id': user_id, 'sleep_time': sleep_time})
+
+
+@invalidates_user
+@exception_handler
+def finish_sleep_session_db(user_id: int, wake_time: datetime):
+    """
+    Закрывает открытую сессию сна пользователя с id = user_id одним запросом.
+    sleep_time открытой сессии берется из users.open_sleep_time, поэтому читается только ее секция.
+    :return: Курсор со строкой sleep_time, wake_time, duration; rowcount == 0, если открытой сессии нет
+    """
+    cursor = execute_query_pg('''
+        UPDATE public.sleep_records
+        SET wake_time = %(wake_time)s
+        WHERE user_id = %(user_id)s AND wake_time IS NULL
+        AND sleep_time = (SELECT open_sleep_time FROM public.users WHERE id = %(user_id)s)
+        RETURNING sleep_time, wake_time, wake_time - sleep_time AS duration
+    ''', {'user_id': user_id, 'wake_time': wake_time})
+    if cursor and cursor.rowcount:
+        refresh_daily_summary(user_id)
+    return cursor
+
+
+@write_behind(SLEEP_RECORDS, lambda user_id, quality: {'sleep_quality': quality}, row=rated_sleep_record)
 @exception_handler
 def save_sleep_quality_db(user_id: int, quality: int):
         """
@@ -380,15 +667,17 @@ def save_sleep_quality_db(user_id: int, quality: int):
         execute_query_pg('''
             UPDATE public.sleep_records
             SET sleep_quality = %(quality)s
-            WHERE sleep_time IN (
-                SELECT sleep_time FROM public.sleep_records 
+            WHERE id = (
+                SELECT id FROM public.sleep_records
                 WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
-                ORDER BY sleep_time DESC 
+                ORDER BY sleep_time DESC
                 LIMIT 1
-            );
+            )
         ''', {'user_id': user_id, 'quality': quality})
+        refresh_daily_summary(user_id)
 
 
+@write_behind(SLEEP_RECORDS, lambda user_id, mood: {'mood': mood}, row=rated_sleep_record)
 @exception_handler
 def save_mood_db(user_id, mood: int):
     """
@@ -397,15 +686,17 @@ def save_mood_db(user_id, mood: int):
     execute_query_pg('''
             UPDATE public.sleep_records
             SET mood = %(mood)s
-            WHERE sleep_time IN (
-                SELECT sleep_time FROM public.sleep_records 
+            WHERE id = (
+                SELECT id FROM public.sleep_records
                 WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
-                ORDER BY sleep_time DESC 
+                ORDER BY sleep_time DESC
                 LIMIT 1
-            );
+            )
         ''', {'user_id': user_id, 'mood': mood})
+    refresh_daily_summary(user_id)
 
 
+@invalidates_user
 @exception_handler
 def save_reminder_time_db(user_id: int, reminder_time: str):
     """
@@ -421,6 +712,7 @@ def save_reminder_time_db(user_id: int, reminder_time: str):
 
 # DELETE
 
+@invalidates_user
 @exception_handler
 def delete_reminder_db(user_id: int):
     """
@@ -430,15 +722,19 @@ def delete_reminder_db(user_id: int):
                   {'user_id': user_id})
 
 
+@invalidates_user
 @exception_handler
 def delete_sleep_records_db(user_id: int):
     """
-    Удаляет записи sleep_records для пользователя с id = user_id
+    Удаляет записи sleep_records и дневные сводки сна для пользователя с id = user_id
     """
     execute_query_pg('DELETE FROM public.sleep_records WHERE user_id = %(user_id)s', 
                   {'user_id': user_id})
+    execute_query_pg('DELETE FROM public.daily_sleep_summary WHERE user_id = %(user_id)s',
+                  {'user_id': user_id})
 
 
+@invalidates_user
 @exception_handler
 def delete_user_db(user_id: int):
     """
@@ -448,12 +744,48 @@ def delete_user_db(user_id: int):
                   {'user_id': user_id})
 
 
+def hide_user_statements(user_id: int, requested_at: datetime) -> list[tuple]:
+    """
+    Запросы, которые скрывают пользователя до фонового удаления его истории (db.purge):
+    пользователь ставится в очередь purge_queue, напоминания и дневные сводки удаляются сразу
+    """
+    params = {'user_id': user_id, 'requested_at': requested_at}
+    return [
+        ('''
+            INSERT INTO public.purge_queue (user_id, requested_at)
+            SELECT id, %(requested_at)s FROM public.users WHERE id = %(user_id)s
+            ON CONFLICT (user_id) DO NOTHING
+        ''', params),
+        ('DELETE FROM public.reminders WHERE user_id = %(user_id)s', params),
+        ('DELETE FROM public.daily_sleep_summary WHERE user_id = %(user_id)s', params),
+    ]
+
+
 # MAIN
 
+@invalidates_user
+@exception_handler
 def delete_all_data_user_db(user_id: int):
-    delete_sleep_records_db(user_id)
-    delete_reminder_db(user_id)
-    delete_user_db(user_id)
+    """
+    Удаляет все данные пользователя с id = user_id. Если записей о снах не больше PURGE_INLINE_MAX_ROWS,
+    удаляется строка users, а reminders, sleep_records и daily_sleep_summary - каскадно (ON DELETE CASCADE)
+    в той же транзакции. Большая история не удаляется в обработчике: пользователь одной транзакцией
+    скрывается (purge_queue), записи о снах удаляет фоновая задача пачками (db.purge.purge_pending_users).
+    :return: True - данные удалены, False - пользователь скрыт и ждет фонового удаления, None - ошибка.
+    """
+    history = fetch('count_sleep_records', {'user_id': user_id, 'limit': PURGE_INLINE_MAX_ROWS + 1})
+    if history is None:
+        raise RuntimeError('не удалось подсчитать записи о снах')
+
+    if history.records <= PURGE_INLINE_MAX_ROWS:
+        if execute_query_pg('DELETE FROM public.users WHERE id = %(user_id)s', {'user_id': user_id}) is None:
+            raise RuntimeError('не удалось удалить пользователя')
+        return True
+
+    if execute_transaction_pg(hide_user_statements(user_id, datetime.now(dt_timezone.utc))) is None:
+        raise RuntimeError('не удалось поставить пользователя в очередь удаления')
+    logger.info(f'Пользователь {user_id} скрыт, история снов будет удалена в фоне')
+    return False
 
 
 if __name__ == "__main__":
@@ -1,4 +1,11 @@
-from .execute_pg import execute_query_pg
-from .execute_sqlite import execute_query_sl
+from .execute_pg import execute_query_pg, execute_prepared_pg, execute_values_pg, execute_copy_pg, stream_query_pg, \
+    execute_transaction_pg, unit_of_work, PreparedStatement, get_pool_stats, close_pool, get_shard_pool_stats
+from .routing import replica_read, primary_read, read_from_primary, get_replica_stats, close_replicas
+from .sharding import all_shards, user_shard, use_shard, routing_user_id, shard_for_user, shard_names
+from .session import Session, current_session
+from .execute_sqlite import execute_query_sl, connect_sl, transaction_sl, close_connections_sl
 
-__all__ = ['execute_query_sl', 'execute_query_pg']
+__all__ = ['execute_query_sl', 'connect_sl', 'transaction_sl', 'close_connections_sl', 'execute_query_pg', 'execute_prepared_pg', 'execute_values_pg', 'execute_copy_pg', 'stream_query_pg', 'execute_transaction_pg', 'unit_of_work', 'Session', 'current_session',
+           'PreparedStatement', 'get_pool_stats', 'close_pool', 'replica_read', 'primary_read', 'read_from_primary',
+           'get_replica_stats', 'close_replicas', 'get_shard_pool_stats', 'all_shards', 'user_shard', 'use_shard',
+           'routing_user_id', 'shard_for_user', 'shard_names']
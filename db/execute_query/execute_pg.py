@@ -1,16 +1,30 @@
+import csv
+import io
+import itertools
 import logging.config
 import re
+import threading
+from contextlib import contextmanager
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import errors
+from psycopg2.extensions import cursor as TupleCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
 from configs import DATABASEPG_URL, POSTGRES_USERNAME, POSTGRES_DATABASE, POSTGRES_PASSWORD, \
-    POSTGRES_HOST, POSTGRES_PORT
+    POSTGRES_HOST, POSTGRES_PORT, POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE, POSTGRES_POOL_MAX_LIFETIME, \
+    POSTGRES_POOL_MAX_IDLE, POSTGRES_POOL_HEALTH_CHECK_INTERVAL, POSTGRES_POOL_TIMEOUT, DATABASE_BACKEND
+from db.execute_query.execute_sqlite import execute_query_sl, execute_prepared_sl, execute_values_sl, stream_query_sl, \
+    execute_copy_sl, execute_transaction_sl, get_connection_sl
+from db.execute_query.pool import ConnectionPool
+from db.execute_query.routing import get_replicas, reading_from_replica
+from db.execute_query.session import Session, current_session, _session
+from db.execute_query.sharding import current_shard, shard_dsn, shard_for_user
 
 logger = logging.getLogger(__name__)
 
 
-if POSTGRES_USERNAME is None:
+if POSTGRES_USERNAME is None and DATABASEPG_URL:
     USERNAME, PASSWORD, HOST, PORT, DATABASE = re.findall(r"/(\w+):(\w+)@(\w+):(\d+)/(\w+)", DATABASEPG_URL)[0]
 else:
     USERNAME = POSTGRES_USERNAME
@@ -20,32 +34,433 @@ else:
     DATABASE = POSTGRES_DATABASE
 
 
-def execute_query_pg(query, params=None, row_factory=True):
+_PARAM_RE = re.compile(r'%\((\w+)\)s')
+
+# Значение по умолчанию get_pool: шард текущего запроса
+_CURRENT_SHARD = object()
+
+# Имена серверных курсоров stream_query_pg
+_stream_ids = itertools.count(1)
+
+# Пулы соединений по шардам; None - база из основной конфигурации
+_pools: dict[str | None, ConnectionPool] = {}
+_pool_lock = threading.Lock()
+
+
+def get_pool(shard: str | None = _CURRENT_SHARD) -> ConnectionPool:
     """
-    Execute a query on a PostgreSQL database.
-    :param query: The query to execute.
-    :param params: The parameters to use in the query.
-    :param row_factory: If True, the query will return a list of dictionaries.
-    :return: A list of dictionaries if row_factory is True, or None if row_factory is False.
+    Возвращает пул соединений шарда (по умолчанию - шарда текущего запроса), создавая его при первом обращении
+    """
+    if shard is _CURRENT_SHARD:
+        shard = current_shard()
+    pool = _pools.get(shard)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(shard)
+            if pool is None:
+                dsn = shard_dsn(shard)
+                connect_kwargs = dict(dsn=dsn, cursor_factory=RealDictCursor) if dsn else \
+                    dict(database=DATABASE, user=USERNAME, password=PASSWORD,
+                         host=HOST, port=PORT, cursor_factory=RealDictCursor)
+                pool = _pools[shard] = ConnectionPool(
+                    connect_kwargs,
+                    min_size=POSTGRES_POOL_MIN_SIZE,
+                    max_size=POSTGRES_POOL_MAX_SIZE,
+                    max_lifetime=POSTGRES_POOL_MAX_LIFETIME,
+                    max_idle=POSTGRES_POOL_MAX_IDLE,
+                    health_check_interval=POSTGRES_POOL_HEALTH_CHECK_INTERVAL,
+                    timeout=POSTGRES_POOL_TIMEOUT
+                )
+    return pool
+
+
+def get_pool_stats() -> dict:
+    """
+    Возвращает статистику пула соединений для подбора его размера
+    """
+    return get_pool(None).stats()
+
+
+def get_shard_pool_stats() -> dict:
+    """
+    Возвращает статистику пулов соединений всех открытых шардов
     """
+    with _pool_lock:
+        pools = dict(_pools)
+    return {shard: pool.stats() for shard, pool in pools.items()}
 
+
+def close_pool():
+    """
+    Закрывает пулы соединений (при остановке бота)
+    """
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+
+class PreparedStatement:
+    """
+    Серверный prepared statement, который подготавливается один раз на каждом соединении пула.
+
+    :param name: Имя statement на сервере.
+    :param query: Запрос с параметрами в формате psycopg2 (%(name)s).
+    :param param_types: Типы параметров PostgreSQL в порядке позиций, например {'user_id': 'bigint'}.
+    """
+    __slots__ = ('name', 'query', 'param_types', 'prepare_sql', 'execute_sql')
+
+    def __init__(self, name: str, query: str, param_types: dict[str, str]):
+        names = list(param_types)
+        sql = _PARAM_RE.sub(lambda match: f'${names.index(match.group(1)) + 1}', query)
+        types = ', '.join(param_types.values())
+        args = ', '.join(f'%({key})s' for key in names)
+
+        self.name = name
+        self.query = query
+        self.param_types = param_types
+        self.prepare_sql = f'PREPARE {name} ({types}) AS {sql.strip()}' if types else f'PREPARE {name} AS {sql.strip()}'
+        self.execute_sql = f'EXECUTE {name} ({args})' if args else f'EXECUTE {name}'
+
+    def __repr__(self):
+        return f'PreparedStatement({self.name!r})'
+
+
+def _prepare(conn, cursor, statement: PreparedStatement):
+    """
+    Подготавливает statement на соединении; уже существующий на сервере statement не считается ошибкой
+    """
     try:
-        with psycopg2.connect(database=DATABASE,
-                              user=USERNAME,
-                              password=PASSWORD,
-                              host=HOST, port=PORT,
-                              cursor_factory=RealDictCursor) as conn:
-            cursor = conn.cursor()
-
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+        cursor.execute(statement.prepare_sql)
+    except errors.DuplicatePreparedStatement:
+        conn.rollback()
+
+
+def _execute_prepared(conn, cursor, statement: PreparedStatement, params, prepared: set[str]):
+    """
+    Выполняет statement по имени, подготавливая его на соединении при первом обращении
+    """
+    if statement.name not in prepared:
+        _prepare(conn, cursor, statement)
+        prepared.add(statement.name)
+    try:
+        cursor.execute(statement.execute_sql, params)
+    except errors.InvalidSqlStatementName:
+        # Сессия на сервере сброшена (DISCARD ALL, переподключение прокси) - готовим заново
+        logger.warning(f'Prepared statement {statement.name} не найден на сервере, подготавливаем заново')
+        conn.rollback()
+        _prepare(conn, cursor, statement)
+        cursor.execute(statement.execute_sql, params)
+    except errors.FeatureNotSupported:
+        # План устарел после изменения схемы (cached plan must not change result type)
+        logger.warning(f'План prepared statement {statement.name} устарел, подготавливаем заново')
+        conn.rollback()
+        cursor.execute(f'DEALLOCATE {statement.name}')
+        _prepare(conn, cursor, statement)
+        cursor.execute(statement.execute_sql, params)
+
+
+def _cursor(conn, row_factory: bool = True):
+    """
+    Курсор соединения: строки-словари (RealDictCursor) или, при row_factory=False, кортежи
+    """
+    return conn.cursor() if row_factory else conn.cursor(cursor_factory=TupleCursor)
+
+
+def _execute_on_replica(run, row_factory: bool = True):
+    """
+    Выполняет run(pool, conn, cursor) на реплике, если текущий вызов помечен replica_read.
+    При ошибке на реплике запрос повторяется на следующей, сетевая ошибка исключает реплику на время.
+    :return: Курсор или None, если запрос нужно выполнить на основном сервере.
+    """
+    # Реплики настроены только для базы из основной конфигурации
+    if not reading_from_replica() or current_shard() is not None:
+        return None
+    replicas = get_replicas()
+    if replicas is None:
+        return None
+
+    tried = set()
+    while (acquired := replicas.acquire(tried)) is not None:
+        index, pool, conn = acquired
+        broken = False
+        try:
+            cursor = _cursor(conn, row_factory)
+            run(pool, conn, cursor)
             conn.commit()
             return cursor
+        except psycopg2.OperationalError as e:
+            broken = True
+            replicas.mark_down(index, e)
+        except Exception as e:
+            # Например, запрос отменен из-за конфликта с применением WAL на реплике
+            logger.warning(f"Ошибка чтения с реплики {index}: {e}")
+        finally:
+            pool.putconn(conn, close=broken)
+    return None
+
+
+def _run_on_pool(run, row_factory: bool = True):
+    """
+    Выполняет run(pool, conn, cursor) на соединении из пула основного сервера и фиксирует транзакцию.
+    Соединение возвращается в пул, после сетевой ошибки - закрывается.
+    :return: Курсор или None при ошибке.
+    """
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+    except psycopg2.OperationalError as e:
+        logger.error(f"OperationalError: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"General exception: {e}")
+        return None
+
+    broken = False
+    try:
+        cursor = _cursor(conn, row_factory)
+        run(pool, conn, cursor)
+        conn.commit()
+        return cursor
     except psycopg2.OperationalError as e:
+        broken = True
         logger.error(f"OperationalError: {e}")
         return None
     except Exception as e:
         logger.error(f"General exception: {e}")
         return None
+    finally:
+        pool.putconn(conn, close=broken)
+
+
+def _execute_in_session(session: Session, run, row_factory: bool = True):
+    """
+    Выполняет run(cursor) на соединении единицы работы, не фиксируя транзакцию.
+    После первой ошибки транзакция PostgreSQL прервана, поэтому следующие запросы не выполняются.
+    """
+    if session.failed:
+        return None
+    if current_shard() != session.shard:
+        session.fail(f'запрос к шарду {current_shard()!r} в единице работы шарда {session.shard!r}')
+        return None
+    cursor = _cursor(session.conn, row_factory)
+    try:
+        run(cursor)
+        return cursor
+    except Exception as e:
+        session.fail(e)
+        return None
+
+
+@contextmanager
+def unit_of_work(user_id: int | None = None):
+    """
+    Unit of work: the data-access functions called inside the block share one connection
+    (of the shard of user_id) and one transaction, committed once at the end of the block.
+    An error in any statement marks the session failed and the whole transaction is rolled back;
+    check session.committed after the block. A nested block joins the outer unit of work.
+    Inside the block reads go to the primary and bypass the user cache; stream_query_pg is not part of it.
+    :param user_id: The user whose shard is used (default: the current shard).
+    :return: A context manager yielding the Session.
+    """
+    outer = current_session()
+    if outer is not None:
+        yield outer
+        return
+
+    shard = shard_for_user(user_id) if user_id is not None else current_shard()
+    pool = None
+    if DATABASE_BACKEND == 'sqlite':
+        # В SQLite запросы выполняются на соединении потока: транзакция открывается на нем
+        conn = get_connection_sl()
+        conn.execute('BEGIN IMMEDIATE')
+        session = Session(shard)
+    else:
+        pool = get_pool(shard)
+        conn = pool.getconn()
+        session = Session(shard, conn)
+
+    token = _session.set(session)
+    broken = False
+    try:
+        yield session
+    except BaseException:
+        session.failed = True
+        raise
+    finally:
+        _session.reset(token)
+        try:
+            if session.failed:
+                conn.rollback()
+            else:
+                conn.commit()
+                session.committed = True
+        except psycopg2.OperationalError as e:
+            broken = True
+            logger.error(f"OperationalError: {e}")
+        except Exception as e:
+            logger.error(f"General exception: {e}")
+            if pool is None:
+                conn.rollback()
+        if pool is not None:
+            pool.putconn(conn, close=broken)
+        session.finish()
+
+
+def execute_prepared_pg(statement: PreparedStatement, params=None, row_factory=True):
+    """
+    Execute a named prepared statement on a PostgreSQL database.
+    The statement is prepared once per pooled connection and then executed by name,
+    so the server parses and plans it only once per session.
+    :param statement: The statement to execute.
+    :param params: The parameters to use in the statement.
+    :param row_factory: If True, rows are dictionaries; if False, plain tuples (see db.queries.Query).
+    :return: The cursor, or None on error.
+    """
+    if DATABASE_BACKEND == 'sqlite':
+        return execute_prepared_sl(statement, params, row_factory)
+
+    session = current_session()
+    if session is not None:
+        return _execute_in_session(session, lambda cursor: cursor.execute(statement.query, params), row_factory)
+
+    def run(pool, conn, cursor):
+        _execute_prepared(conn, cursor, statement, params, pool.prepared_statements(conn))
+
+    cursor = _execute_on_replica(run, row_factory)
+    if cursor is not None:
+        return cursor
+    return _run_on_pool(run, row_factory)
+
+
+def execute_query_pg(query, params=None, row_factory=True):
+    """
+    Execute a query on a PostgreSQL database (on SQLite when DATABASE_BACKEND is sqlite).
+    The connection is taken from the shared pool and returned to it after the commit.
+    Inside replica_read accessors the query goes to a read replica, falling back to the primary.
+    :param query: The query to execute.
+    :param params: The parameters to use in the query.
+    :param row_factory: If True, rows are dictionaries; if False, plain tuples,
+        which the declared queries of db.queries (Query) turn into compact records.
+    :return: The cursor, or None on error.
+    """
+    if DATABASE_BACKEND == 'sqlite':
+        return execute_query_sl(query, params, row_factory)
+
+    session = current_session()
+    if session is not None:
+        return _execute_in_session(
+            session, lambda cursor: cursor.execute(query, params) if params else cursor.execute(query), row_factory
+        )
+
+    def run(pool, conn, cursor):
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+
+    cursor = _execute_on_replica(run, row_factory)
+    if cursor is not None:
+        return cursor
+    return _run_on_pool(run, row_factory)
+
+
+def execute_values_pg(query, rows, template=None, page_size=1000):
+    """
+    Execute a multi-row statement (INSERT ... VALUES %s) on a PostgreSQL database with psycopg2 execute_values.
+    All pages are sent on one pooled connection and committed together.
+    :param query: The query with a single %s placeholder for the rows.
+    :param rows: Sequence of tuples, or of dictionaries when the template uses named parameters.
+    :param template: Row template, e.g. '(%(user_id)s, %(username)s)'.
+    :param page_size: Maximum number of rows in one statement.
+    :return: The cursor, or None on error.
+    """
+    if DATABASE_BACKEND == 'sqlite':
+        return execute_values_sl(query, rows, template, page_size)
+
+    def run(cursor):
+        execute_values(cursor, query, rows, template=template, page_size=page_size)
+
+    session = current_session()
+    if session is not None:
+        return _execute_in_session(session, run)
+    return _run_on_pool(lambda pool, conn, cursor: run(cursor))
+
+
+def execute_transaction_pg(statements):
+    """
+    Execute several statements in one transaction on a pooled connection: either all of them are committed or none.
+    :param statements: Sequence of (query, params) pairs, executed in order.
+    :return: The cursor of the last statement, or None on error (the transaction is rolled back).
+    """
+    if DATABASE_BACKEND == 'sqlite':
+        return execute_transaction_sl(statements)
+
+    def run(cursor):
+        for query, params in statements:
+            cursor.execute(query, params)
+
+    session = current_session()
+    if session is not None:
+        return _execute_in_session(session, run)
+    return _run_on_pool(lambda pool, conn, cursor: run(cursor))
+
+
+def execute_copy_pg(table, columns, rows):
+    """
+    Load rows into a PostgreSQL table with a single COPY ... FROM STDIN (CSV) on a pooled connection.
+    COPY skips per-statement parsing and planning, so it is the fastest way to insert many rows.
+    :param table: The table name, e.g. 'public.sleep_records'.
+    :param columns: The column names, in the order of the values in each row.
+    :param rows: Sequence of tuples; None is loaded as NULL.
+    :return: The cursor (rowcount is the number of loaded rows), or None on error.
+    """
+    if DATABASE_BACKEND == 'sqlite':
+        return execute_copy_sl(table, columns, rows)
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    def run(cursor):
+        cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    session = current_session()
+    if session is not None:
+        return _execute_in_session(session, run)
+    return _run_on_pool(lambda pool, conn, cursor: run(cursor))
+
+
+def stream_query_pg(query, params=None, chunk_size=1000):
+    """
+    Execute a query on a PostgreSQL database through a server-side (named) cursor
+    and yield the result in chunks, so only chunk_size rows are held in memory at a time.
+    The pooled connection is held until the generator is exhausted or closed.
+    Unlike execute_query_pg, errors are raised to the caller: a partly consumed stream cannot be retried.
+    :param query: The query to execute.
+    :param params: The parameters to use in the query.
+    :param chunk_size: Number of rows fetched from the server per round trip.
+    :return: A generator of lists of dictionaries.
+    """
+    if DATABASE_BACKEND == 'sqlite':
+        yield from stream_query_sl(query, params, chunk_size)
+        return
+
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        with conn.cursor(name=f'stream_{next(_stream_ids)}') as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+            while rows := cursor.fetchmany(chunk_size):
+                yield rows
+        conn.commit()
+    except psycopg2.OperationalError:
+        broken = True
+        raise
+    finally:
+        if not broken and not conn.closed:
+            # Поток прерван до конца: транзакция курсора откатывается
+            conn.rollback()
+        pool.putconn(conn, close=broken)
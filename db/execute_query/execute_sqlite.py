@@ -1,25 +1,322 @@
 import logging.config
+import re
 import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
 
-from configs import DATABASESL_URL
+from configs import DATABASESL_URL, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE, SQLITE_BUSY_TIMEOUT, SQLITE_STATEMENT_CACHE
+from db.execute_query.session import fail_current_session
 
 logger = logging.getLogger(__name__)
 
+# Настройки каждого соединения: WAL позволяет читать параллельно с записью,
+# synchronous=NORMAL в режиме WAL не теряет целостность при сбое и не ждет fsync на каждой транзакции
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA temp_store = MEMORY',
+    f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}',
+    f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE // 1024}',
+)
+
+# Перевод запросов db.db с диалекта PostgreSQL на диалект SQLite
+_TRANSLATIONS = (
+    # Схема public - единственная, в SQLite ее нет
+    (re.compile(r'\bpublic\.'), ''),
+    # Приведения типов (%(user_id)s::bigint)
+    (re.compile(r'::\w+'), ''),
+    # Параметры psycopg2 -> именованные параметры sqlite3
+    (re.compile(r'%\((\w+)\)s'), r':\1'),
+    (re.compile(r"now\(\)\s*-\s*interval\s*'(\d+) (\w+)'", re.IGNORECASE), r"datetime('now', '-\1 \2')"),
+    # Разность моментов времени - интервал (timedelta), как в PostgreSQL
+    (re.compile(r'\b(sleep_time|wake_time)\s*-\s*(sleep_time|wake_time)\s+AS\s+(\w+)', re.IGNORECASE),
+     r'timestamp_diff(\1, \2) AS "\3 [interval]"'),
+)
+
+
+def _adapt_datetime(value: datetime) -> str:
+    # Моменты времени хранятся в UTC, поэтому строки сравниваются и сортируются так же, как время
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.isoformat(sep=' ')
+
+
+def _timestamp_diff(end: str | None, start: str | None) -> float | None:
+    if end is None or start is None:
+        return None
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_adapter(date, date.isoformat)
+# Столбцы timestamptz, date и интервалы возвращаются как datetime, date и timedelta, как из psycopg2
+sqlite3.register_converter('date', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('timestamptz', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('interval', lambda value: timedelta(seconds=float(value)))
+
+
+def database_path() -> str:
+    return f'../{DATABASESL_URL}'
+
+
+def connect_sl(row_factory=True) -> sqlite3.Connection:
+    """
+    Открывает отдельное соединение с базой SQLite (для долгих операций вроде миграции)
+    """
+    conn = sqlite3.connect(database_path(), check_same_thread=False)
+    if row_factory:
+        conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _dict_row(cursor: sqlite3.Cursor, row: tuple) -> dict:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _open_connection(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        timeout=SQLITE_BUSY_TIMEOUT / 1000,
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        isolation_level=None,  # Каждый запрос - отдельная транзакция, несколько запросов - transaction_sl()
+        check_same_thread=False,
+        cached_statements=SQLITE_STATEMENT_CACHE
+    )
+    conn.row_factory = _dict_row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    conn.create_function('timestamp_diff', 2, _timestamp_diff, deterministic=True)
+    return conn
+
+
+_local = threading.local()
+_connections: set[sqlite3.Connection] = set()
+_connections_lock = threading.Lock()
+# Меняется при закрытии соединений: потоки открывают новые при следующем запросе
+_generation = 0
+
+
+def get_connection_sl() -> sqlite3.Connection:
+    """
+    Возвращает постоянное соединение текущего потока с базой SQLite, открывая его при первом обращении.
+    Скомпилированные запросы кэшируются соединением (до SQLITE_STATEMENT_CACHE), поэтому повторные
+    запросы не разбираются заново.
+    """
+    if getattr(_local, 'generation', None) != _generation:
+        conn = _open_connection(database_path())
+        with _connections_lock:
+            _connections.add(conn)
+            _local.conn, _local.generation = conn, _generation
+    return _local.conn
+
+
+def close_connections_sl():
+    """
+    Закрывает соединения с базой SQLite всех потоков (при остановке бота)
+    """
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+        _generation += 1
+
+
+@lru_cache(maxsize=None)
+def translate_sl(query: str) -> str:
+    """
+    Переводит запрос с диалекта PostgreSQL, на котором написаны запросы db.db, на диалект SQLite.
+    Результат кэшируется: одинаковый текст запроса находит готовый statement в кэше соединения.
+    """
+    for pattern, replacement in _TRANSLATIONS:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+def values_query_sl(query: str, template: str | None, width: int) -> str:
+    """
+    Запрос execute_values (VALUES %s) для построчного выполнения executemany
+    """
+    row = template or '(' + ', '.join('?' * width) + ')'
+    return translate_sl(query.replace('%s', row, 1))
+
+
+class SQLiteResult:
+    """
+    Результат запроса, прочитанный целиком, как у клиентского курсора psycopg2:
+    rowcount известен сразу (в том числе для RETURNING), а курсор не держит транзакцию чтения открытой.
+    """
+    __slots__ = ('rows', 'rowcount', 'description', 'lastrowid', '_position')
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.rows = cursor.fetchall() if cursor.description else []
+        self.rowcount = cursor.rowcount if cursor.rowcount >= 0 else len(self.rows)
+        self.description = cursor.description
+        self.lastrowid = cursor.lastrowid
+        self._position = 0
+
+    def fetchone(self):
+        if self._position >= len(self.rows):
+            return None
+        self._position += 1
+        return self.rows[self._position - 1]
+
+    def fetchmany(self, size: int = 1) -> list:
+        rows = self.rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self) -> list:
+        rows = self.rows[self._position:]
+        self._position = len(self.rows)
+        return rows
+
+    def __iter__(self):
+        while (row := self.fetchone()) is not None:
+            yield row
+
+
+@contextmanager
+def transaction_sl():
+    """
+    Выполняет запросы блока одной транзакцией на соединении текущего потока.
+    Вложенный блок становится частью внешней транзакции.
+    """
+    conn = get_connection_sl()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
 
 def execute_query_sl(query, params=None, row_factory=True):
     """
-    Принимает строку запроса и возвращает курсор, если он не None, иначе None
-    """
-    with sqlite3.connect(f'../{DATABASESL_URL}', check_same_thread=False) as conn:
-        if row_factory:
-            conn.row_factory = sqlite3.Row  # Для доступа к столбцам по имени
-        cursor = conn.cursor()
-        try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            conn.commit()
-            return cursor
-        except sqlite3.OperationalError:
-            return None
\ No newline at end of file
+    Выполняет запрос к SQLite на постоянном соединении текущего потока.
+    Запрос в диалекте PostgreSQL переводится на диалект SQLite (translate_sl), строки возвращаются словарями,
+    а при row_factory=False - кортежами (db.queries.Query).
+    :return: SQLiteResult или None при ошибке.
+    """
+    try:
+        cursor = get_connection_sl().cursor()
+        if not row_factory:
+            cursor.row_factory = None
+        cursor.execute(translate_sl(query), params or ())
+        return SQLiteResult(cursor)
+    except sqlite3.OperationalError as e:
+        logger.error(f"OperationalError: {e}")
+        fail_current_session(e)
+        return None
+    except Exception as e:
+        logger.error(f"General exception: {e}")
+        fail_current_session(e)
+        return None
+
+
+def execute_prepared_sl(statement, params=None, row_factory=True):
+    """
+    Выполняет PreparedStatement: в SQLite подготовленный запрос берется из кэша соединения по тексту
+    """
+    return execute_query_sl(statement.query, params, row_factory)
+
+
+def execute_values_sl(query, rows, template=None, page_size=1000):
+    """
+    Выполняет запрос execute_values (INSERT ... VALUES %s) для всех строк одной транзакцией.
+    SQLite выполняет подготовленный запрос построчно без обращений по сети, поэтому page_size не используется.
+    :return: SQLiteResult или None при ошибке.
+    """
+    rows = list(rows)
+    if not rows:
+        return None
+    try:
+        with transaction_sl() as conn:
+            cursor = conn.executemany(values_query_sl(query, template, len(rows[0])), rows)
+        return SQLiteResult(cursor)
+    except sqlite3.OperationalError as e:
+        logger.error(f"OperationalError: {e}")
+        fail_current_session(e)
+        return None
+    except Exception as e:
+        logger.error(f"General exception: {e}")
+        fail_current_session(e)
+        return None
+
+
+def execute_copy_sl(table: str, columns, rows):
+    """
+    Вставляет строки в таблицу одной транзакцией (замена COPY, которого в SQLite нет)
+    :return: SQLiteResult или None при ошибке.
+    """
+    query = f'INSERT INTO {table.removeprefix("public.")} ({", ".join(columns)}) ' \
+            f'VALUES ({", ".join("?" * len(columns))})'
+    try:
+        with transaction_sl() as conn:
+            cursor = conn.executemany(query, rows)
+        return SQLiteResult(cursor)
+    except sqlite3.OperationalError as e:
+        logger.error(f"OperationalError: {e}")
+        fail_current_session(e)
+        return None
+    except Exception as e:
+        logger.error(f"General exception: {e}")
+        fail_current_session(e)
+        return None
+
+
+def execute_transaction_sl(statements):
+    """
+    Выполняет запросы (query, params) по порядку одной транзакцией
+    :return: SQLiteResult последнего запроса или None при ошибке (транзакция откатывается).
+    """
+    try:
+        with transaction_sl() as conn:
+            cursor = None
+            for query, params in statements:
+                cursor = conn.execute(translate_sl(query), params or ())
+        return SQLiteResult(cursor)
+    except sqlite3.OperationalError as e:
+        logger.error(f"OperationalError: {e}")
+        fail_current_session(e)
+        return None
+    except Exception as e:
+        logger.error(f"General exception: {e}")
+        fail_current_session(e)
+        return None
+
+
+def split_script_sl(script: str) -> list[str]:
+    """
+    Разбивает скрипт SQLite на отдельные запросы: execute выполняет по одному запросу,
+    а executescript фиксирует открытую транзакцию (миграции схемы выполняются в unit_of_work)
+    """
+    statements, statement = [], ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ''
+    if statement.strip():
+        statements.append(statement.strip())
+    return statements
+
+
+def stream_query_sl(query, params=None, chunk_size: int = 1000):
+    """
+    Выполняет запрос и возвращает строки порциями по chunk_size, не загружая результат целиком.
+    :return: Генератор списков строк.
+    """
+    cursor = get_connection_sl().execute(translate_sl(query), params or {})
+    try:
+        while rows := cursor.fetchmany(chunk_size):
+            yield rows
+    finally:
+        cursor.close()
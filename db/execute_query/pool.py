@@ -0,0 +1,245 @@
+import logging.config
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(PoolError):
+    """
+    Не удалось получить соединение из пула за отведенное время
+    """
+
+
+class _PooledConnection:
+    """
+    Соединение пула, его служебные отметки времени и подготовленные на нем запросы
+    """
+    __slots__ = ('conn', 'created_at', 'last_used_at', 'prepared')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.prepared: set[str] = set()
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений PostgreSQL.
+
+    :param connect_kwargs: Параметры для psycopg2.connect.
+    :param min_size: Минимальное количество соединений, которые держит пул.
+    :param max_size: Максимальное количество соединений (свободных и занятых).
+    :param max_lifetime: Время жизни соединения в секундах, после которого оно пересоздается.
+    :param max_idle: Время простоя в секундах, после которого лишние соединения закрываются.
+    :param health_check_interval: Простой в секундах, после которого соединение проверяется
+        запросом SELECT 1 при выдаче из пула.
+    :param timeout: Время ожидания свободного соединения в секундах.
+    """
+
+    def __init__(self, connect_kwargs: dict, min_size: int = 1, max_size: int = 10,
+                 max_lifetime: float = 3600.0, max_idle: float = 300.0,
+                 health_check_interval: float = 30.0, timeout: float = 30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Неверные размеры пула соединений')
+
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        self._idle: list[_PooledConnection] = []
+        self._used: dict[int, _PooledConnection] = {}
+        self._cond = threading.Condition()
+        self._opening = 0
+        self._closed = False
+        self._counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'closed_expired': 0,
+            'closed_idle': 0,
+            'closed_broken': 0,
+        }
+
+    def _connect(self) -> _PooledConnection:
+        return _PooledConnection(psycopg2.connect(**self.connect_kwargs))
+
+    def _discard(self, pooled: _PooledConnection, reason: str):
+        self._counters[f'closed_{reason}'] += 1
+        try:
+            pooled.conn.close()
+        except Exception as e:
+            logger.debug(f'Ошибка при закрытии соединения пула: {e}')
+
+    def _is_healthy(self, pooled: _PooledConnection, now: float) -> bool:
+        conn = pooled.conn
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if now - pooled.last_used_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reap_idle(self, now: float):
+        """
+        Закрывает соединения, простаивающие дольше max_idle, не опускаясь ниже min_size
+        """
+        total = len(self._idle) + len(self._used)
+        keep = []
+        # Самые старые по использованию соединения лежат в начале списка
+        for pooled in self._idle:
+            if total > self.min_size and now - pooled.last_used_at > self.max_idle:
+                self._discard(pooled, 'idle')
+                total -= 1
+            else:
+                keep.append(pooled)
+        self._idle = keep
+
+    def getconn(self):
+        """
+        Выдает соединение из пула, при необходимости создавая новое или ожидая освобождения
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            pooled = self._reserve(deadline)
+            if pooled is None:
+                # Слот зарезервирован, соединение открывается вне блокировки
+                try:
+                    pooled = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._counters['created'] += 1
+                    return self._checkout(pooled)
+
+            # Проверка соединения выполняется вне блокировки, чтобы не задерживать другие потоки
+            now = time.monotonic()
+            if now - pooled.created_at <= self.max_lifetime and self._is_healthy(pooled, now):
+                return pooled.conn
+
+            with self._cond:
+                self._used.pop(id(pooled.conn), None)
+                reason = 'expired' if now - pooled.created_at > self.max_lifetime else 'broken'
+                self._discard(pooled, reason)
+                self._cond.notify()
+
+    def _reserve(self, deadline: float):
+        """
+        Под блокировкой берет свободное соединение или резервирует слот под новое (возвращает None)
+        """
+        with self._cond:
+            waited = False
+            while True:
+                if self._closed:
+                    raise PoolError('Пул соединений закрыт')
+
+                now = time.monotonic()
+                self._reap_idle(now)
+
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._checkout(pooled)
+                    return pooled
+
+                if len(self._used) + self._opening < self.max_size:
+                    self._opening += 1
+                    return None
+
+                if not waited:
+                    self._counters['waits'] += 1
+                    waited = True
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(f'Нет свободных соединений в пуле за {self.timeout} с')
+                self._cond.wait(remaining)
+
+    def _checkout(self, pooled: _PooledConnection):
+        self._used[id(pooled.conn)] = pooled
+        self._counters['checkouts'] += 1
+        return pooled.conn
+
+    def prepared_statements(self, conn) -> set[str]:
+        """
+        Возвращает имена prepared statements, подготовленных на выданном соединении.
+        Набор живет столько же, сколько серверная сессия соединения.
+        """
+        with self._cond:
+            pooled = self._used.get(id(conn))
+            if pooled is None:
+                raise PoolError('Соединение не принадлежит пулу')
+            return pooled.prepared
+
+    def putconn(self, conn, close: bool = False):
+        """
+        Возвращает соединение в пул.
+        :param conn: Соединение, полученное через getconn.
+        :param close: Закрыть соединение вместо возврата (например, после сетевой ошибки).
+        """
+        with self._cond:
+            pooled = self._used.pop(id(conn), None)
+            if pooled is None:
+                raise PoolError('Соединение не принадлежит пулу')
+
+            now = time.monotonic()
+            if close or self._closed or conn.closed:
+                self._discard(pooled, 'broken')
+            elif now - pooled.created_at > self.max_lifetime:
+                self._discard(pooled, 'expired')
+            else:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        self._discard(pooled, 'broken')
+                        self._cond.notify()
+                        return
+                pooled.last_used_at = now
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    def closeall(self):
+        """
+        Закрывает все свободные соединения; занятые закрываются при возврате
+        """
+        with self._cond:
+            self._closed = True
+            for pooled in self._idle:
+                self._discard(pooled, 'idle')
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Возвращает текущее состояние пула и накопленные счетчики
+        """
+        with self._cond:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': len(self._idle) + len(self._used),
+                'idle': len(self._idle),
+                'in_use': len(self._used),
+                **self._counters,
+            }
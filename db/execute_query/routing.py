@@ -0,0 +1,195 @@
+import contextvars
+import itertools
+import logging.config
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
+
+from configs import POSTGRES_REPLICA_URLS, POSTGRES_REPLICA_COOLDOWN, POSTGRES_PRIMARY_READS, \
+    POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE, POSTGRES_POOL_MAX_LIFETIME, POSTGRES_POOL_MAX_IDLE, \
+    POSTGRES_POOL_HEALTH_CHECK_INTERVAL, POSTGRES_POOL_TIMEOUT
+from db.execute_query.pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+
+# Куда направлять запросы текущего вызова: None - основной сервер, REPLICA - реплика,
+# PRIMARY - основной сервер без возможности переопределить вложенным replica_read
+_target: contextvars.ContextVar[str | None] = contextvars.ContextVar('db_read_target', default=None)
+
+
+class ReplicaSet:
+    """
+    Реплики для чтения: выбираются по кругу, недоступная реплика пропускается cooldown секунд.
+
+    :param pools: Пулы соединений реплик.
+    :param cooldown: Время в секундах, на которое реплика исключается после сетевой ошибки.
+    """
+
+    def __init__(self, pools: list[ConnectionPool], cooldown: float = 30.0):
+        self.pools = pools
+        self.cooldown = cooldown
+        self._down_until = [0.0] * len(pools)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._counters = {'reads': 0, 'failovers': 0, 'fallbacks': 0}
+
+    def acquire(self, tried: set[int]):
+        """
+        Выдает соединение следующей доступной реплики, которая еще не пробовалась в этом запросе
+        :return: (номер реплики, пул, соединение) или None, если доступных реплик нет.
+        """
+        with self._lock:
+            start = next(self._counter)
+        now = time.monotonic()
+        for offset in range(len(self.pools)):
+            index = (start + offset) % len(self.pools)
+            if index in tried or self._down_until[index] > now:
+                continue
+            tried.add(index)
+            pool = self.pools[index]
+            try:
+                conn = pool.getconn()
+            except (psycopg2.OperationalError, PoolError) as e:
+                self.mark_down(index, e)
+                continue
+            with self._lock:
+                self._counters['reads'] += 1
+            return index, pool, conn
+
+        with self._lock:
+            self._counters['fallbacks'] += 1
+        return None
+
+    def mark_down(self, index: int, error: Exception):
+        """
+        Исключает реплику из выбора на cooldown секунд
+        """
+        logger.warning(f'Реплика {index} недоступна, чтение переводится на другие серверы: {error}')
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.cooldown
+            self._counters['failovers'] += 1
+
+    def closeall(self):
+        for pool in self.pools:
+            pool.closeall()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                **self._counters,
+                'replicas': [dict(pool.stats(), down=self._down_until[index] > now)
+                             for index, pool in enumerate(self.pools)],
+            }
+
+
+_replicas: ReplicaSet | None = None
+_replicas_lock = threading.Lock()
+
+
+def get_replicas() -> ReplicaSet | None:
+    """
+    Возвращает реплики из POSTGRES_REPLICA_URLS или None, если они не настроены
+    """
+    global _replicas
+    if _replicas is None and POSTGRES_REPLICA_URLS:
+        with _replicas_lock:
+            if _replicas is None:
+                _replicas = ReplicaSet([
+                    ConnectionPool(
+                        dict(dsn=url, cursor_factory=RealDictCursor),
+                        min_size=POSTGRES_POOL_MIN_SIZE,
+                        max_size=POSTGRES_POOL_MAX_SIZE,
+                        max_lifetime=POSTGRES_POOL_MAX_LIFETIME,
+                        max_idle=POSTGRES_POOL_MAX_IDLE,
+                        health_check_interval=POSTGRES_POOL_HEALTH_CHECK_INTERVAL,
+                        timeout=POSTGRES_POOL_TIMEOUT
+                    ) for url in POSTGRES_REPLICA_URLS
+                ], cooldown=POSTGRES_REPLICA_COOLDOWN)
+    return _replicas
+
+
+def set_replicas(replicas: ReplicaSet | None):
+    """
+    Подменяет набор реплик (None - вернуться к настройкам из конфигурации); прежний набор закрывается
+    """
+    global _replicas
+    with _replicas_lock:
+        previous, _replicas = _replicas, replicas
+    if previous is not None and previous is not replicas:
+        previous.closeall()
+
+
+def close_replicas():
+    """
+    Закрывает пулы соединений реплик (при остановке бота)
+    """
+    set_replicas(None)
+
+
+def get_replica_stats() -> dict | None:
+    """
+    Возвращает статистику чтения с реплик или None, если они не настроены
+    """
+    return _replicas.stats() if _replicas is not None else None
+
+
+def reading_from_replica() -> bool:
+    """
+    Направляется ли текущий запрос на реплику
+    """
+    return _target.get() == REPLICA
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Все чтения внутри блока выполняются на основном сервере (чтение сразу после записи)
+    """
+    token = _target.set(PRIMARY)
+    try:
+        yield
+    finally:
+        _target.reset(token)
+
+
+def replica_read(func):
+    """
+    Направляет запросы функции только для чтения на реплики.
+    Функции из POSTGRES_PRIMARY_READS и вызовы внутри read_from_primary читают с основного сервера.
+    """
+    if func.__name__ in POSTGRES_PRIMARY_READS:
+        return primary_read(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _target.get() == PRIMARY:
+            return func(*args, **kwargs)
+        token = _target.set(REPLICA)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _target.reset(token)
+
+    return wrapper
+
+
+def primary_read(func):
+    """
+    Закрепляет чтение функции за основным сервером: она читает данные сразу после записи,
+    и отставание реплики вернуло бы устаревший результат
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with read_from_primary():
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,68 @@
+import contextvars
+import logging.config
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    Единица работы (execute_pg.unit_of_work): соединение шарда shard, на котором запросы функций доступа к данным
+    выполняются одной транзакцией. Ошибка запроса отмечает сессию (failed), и при выходе из блока транзакция
+    откатывается. conn - соединение PostgreSQL (None для SQLite: транзакция открыта на соединении потока).
+    """
+    __slots__ = ('shard', 'conn', 'failed', 'committed', '_callbacks', '_commit_callbacks')
+
+    def __init__(self, shard: str | None, conn=None):
+        self.shard = shard
+        self.conn = conn
+        self.failed = False
+        self.committed = False
+        self._callbacks = []
+        self._commit_callbacks = []
+
+    def fail(self, error):
+        logger.error(f'Ошибка в единице работы, транзакция будет отменена: {error}')
+        self.failed = True
+
+    def on_finish(self, callback):
+        """
+        Выполняет callback после завершения транзакции (например, сброс кэша пользователя)
+        """
+        self._callbacks.append(callback)
+
+    def on_commit(self, callback):
+        """
+        Выполняет callback после фиксации транзакции, вне ее; при откате callback не выполняется
+        """
+        self._commit_callbacks.append(callback)
+
+    def finish(self):
+        for callback in self._callbacks:
+            callback()
+        if self.committed:
+            for callback in self._commit_callbacks:
+                callback()
+        self._callbacks.clear()
+        self._commit_callbacks.clear()
+
+    def __repr__(self):
+        return f'Session(shard={self.shard!r}, failed={self.failed}, committed={self.committed})'
+
+
+_session: contextvars.ContextVar[Session | None] = contextvars.ContextVar('db_session', default=None)
+
+
+def current_session() -> Session | None:
+    """
+    Единица работы, внутри которой выполняется текущий вызов, или None
+    """
+    return _session.get()
+
+
+def fail_current_session(error):
+    """
+    Отмечает ошибку запроса в текущей единице работы, если она открыта
+    """
+    session = _session.get()
+    if session is not None:
+        session.fail(error)
@@ -0,0 +1,256 @@
+import asyncio
+import contextvars
+import json
+import logging.config
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+
+from configs import POSTGRES_SHARD_MAP
+
+logger = logging.getLogger(__name__)
+
+# Шард текущего запроса; None - база из основной конфигурации (DATABASEPG_URL / POSTGRES_*)
+_shard: contextvars.ContextVar[str | None] = contextvars.ContextVar('db_shard', default=None)
+
+
+def bucket_of(user_id: int, buckets: int) -> int:
+    """
+    Номер корзины пользователя: стабильный хэш user_id, не зависящий от процесса и версии Python
+    """
+    return zlib.crc32(int(user_id).to_bytes(8, 'big', signed=True)) % buckets
+
+
+class ShardMap:
+    """
+    Карта шардов: пользователь попадает в корзину по хэшу user_id, корзина закреплена за шардом.
+    Перенос пользователей между шардами - это перенос корзины (db.reshard).
+
+    :param shards: Имя шарда -> DSN; None - база из основной конфигурации.
+    :param assignments: Имя шарда для каждой корзины (длина списка - количество корзин).
+    """
+
+    def __init__(self, shards: dict[str, str | None], assignments: list[str]):
+        unknown = set(assignments) - set(shards)
+        if unknown:
+            raise ValueError(f'Корзины закреплены за неизвестными шардами: {", ".join(sorted(unknown))}')
+        self.shards = shards
+        self.assignments = assignments
+
+    @property
+    def buckets(self) -> int:
+        return len(self.assignments)
+
+    def shard_for(self, user_id: int) -> str:
+        return self.assignments[bucket_of(user_id, self.buckets)]
+
+    def names(self) -> list[str]:
+        return list(self.shards)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ShardMap':
+        """
+        Читает карту вида {"buckets": 256, "shards": {"s0": null, "s1": "postgresql://..."},
+        "assignments": {"s0": ["0-127"], "s1": ["128-255"]}}.
+        Без assignments корзины делятся между шардами поровну по порядку.
+        """
+        shards = data['shards']
+        buckets = int(data.get('buckets', 256))
+        assignments: list[str | None] = [None] * buckets
+        if 'assignments' in data:
+            for name, ranges in data['assignments'].items():
+                for bucket_range in ranges:
+                    first, _, last = str(bucket_range).partition('-')
+                    for bucket in range(int(first), int(last or first) + 1):
+                        assignments[bucket] = name
+        else:
+            names = list(shards)
+            assignments = [names[bucket * len(names) // buckets] for bucket in range(buckets)]
+
+        missing = [bucket for bucket, name in enumerate(assignments) if name is None]
+        if missing:
+            raise ValueError(f'Корзины {missing[:10]} не закреплены ни за одним шардом')
+        return cls(shards, assignments)
+
+    def to_dict(self) -> dict:
+        ranges: dict[str, list[str]] = {name: [] for name in self.shards}
+        start = 0
+        for bucket in range(1, self.buckets + 1):
+            if bucket == self.buckets or self.assignments[bucket] != self.assignments[start]:
+                ranges[self.assignments[start]].append(f'{start}-{bucket - 1}' if bucket - 1 > start else str(start))
+                start = bucket
+        return {'buckets': self.buckets, 'shards': self.shards, 'assignments': ranges}
+
+
+def load_shard_map(path: str) -> ShardMap:
+    with open(path, 'r', encoding='utf-8') as f:
+        return ShardMap.from_dict(json.load(f))
+
+
+def save_shard_map(shard_map: ShardMap, path: str):
+    """
+    Записывает карту атомарно: читатели видят либо старую, либо новую карту целиком
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(shard_map.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+_shard_map: ShardMap | None = None
+_shard_map_loaded = False
+_shard_map_lock = threading.Lock()
+_fan_out_executor: ThreadPoolExecutor | None = None
+
+
+def get_shard_map() -> ShardMap | None:
+    """
+    Возвращает карту шардов из файла POSTGRES_SHARD_MAP или None, если шардирование не настроено
+    """
+    global _shard_map, _shard_map_loaded
+    if not _shard_map_loaded:
+        with _shard_map_lock:
+            if not _shard_map_loaded:
+                if POSTGRES_SHARD_MAP:
+                    _shard_map = load_shard_map(POSTGRES_SHARD_MAP)
+                    logger.info(f'Шардирование: {len(_shard_map.shards)} шардов, {_shard_map.buckets} корзин')
+                _shard_map_loaded = True
+    return _shard_map
+
+
+def set_shard_map(shard_map: ShardMap | None):
+    """
+    Подменяет карту шардов (после переноса корзины или в тестах)
+    """
+    global _shard_map, _shard_map_loaded
+    with _shard_map_lock:
+        _shard_map = shard_map
+        _shard_map_loaded = shard_map is not None
+
+
+def shard_dsn(name: str | None) -> str | None:
+    """
+    DSN шарда; None - база из основной конфигурации
+    """
+    shard_map = get_shard_map()
+    return shard_map.shards[name] if shard_map is not None and name is not None else None
+
+
+def shard_for_user(user_id: int) -> str | None:
+    shard_map = get_shard_map()
+    return shard_map.shard_for(user_id) if shard_map is not None else None
+
+
+def shard_names() -> list[str | None]:
+    """
+    Все шарды; без шардирования - единственная база (None)
+    """
+    shard_map = get_shard_map()
+    return shard_map.names() if shard_map is not None else [None]
+
+
+def current_shard() -> str | None:
+    return _shard.get()
+
+
+def routing_user_id(args: tuple) -> int | None:
+    """
+    user_id функции доступа к данным - ее первый аргумент, если это целое число
+    """
+    return args[0] if args and isinstance(args[0], int) else None
+
+
+@contextmanager
+def use_shard(name: str | None):
+    """
+    Все запросы внутри блока выполняются на шарде name
+    """
+    token = _shard.set(name)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+
+@contextmanager
+def user_shard(user_id: int | None):
+    """
+    Запросы внутри блока выполняются на шарде пользователя user_id (без шардирования - на основной базе)
+    """
+    if user_id is None or get_shard_map() is None:
+        yield
+        return
+    with use_shard(shard_for_user(user_id)):
+        yield
+
+
+def group_by_shard(user_ids) -> dict[str | None, list[int]]:
+    groups: dict[str | None, list[int]] = {}
+    for user_id in user_ids:
+        groups.setdefault(shard_for_user(user_id), []).append(user_id)
+    return groups
+
+
+def _merge(results: list, name: str) -> list | None:
+    merged = []
+    failed = 0
+    for result in results:
+        if result is None:
+            failed += 1
+        else:
+            merged.extend(result)
+    if failed == len(results):
+        return None
+    if failed:
+        logger.error(f'{name}: {failed} из {len(results)} шардов не ответили, результат неполный')
+    return merged
+
+
+def _get_fan_out_executor(workers: int) -> ThreadPoolExecutor:
+    global _fan_out_executor
+    if _fan_out_executor is None:
+        with _shard_map_lock:
+            if _fan_out_executor is None:
+                _fan_out_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard')
+    return _fan_out_executor
+
+
+def all_shards(func):
+    """
+    Выполняет выборку func на всех шардах параллельно и объединяет списки строк.
+    Шард, вернувший None (ошибка), пропускается. Поддерживает обычные и асинхронные функции.
+    """
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            names = shard_names()
+            if names == [None]:
+                return await func(*args, **kwargs)
+
+            async def run(name):
+                with use_shard(name):
+                    return await func(*args, **kwargs)
+
+            return _merge(await asyncio.gather(*(run(name) for name in names)), func.__name__)
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        names = shard_names()
+        if names == [None]:
+            return func(*args, **kwargs)
+
+        def run(name):
+            with use_shard(name):
+                return func(*args, **kwargs)
+
+        executor = _get_fan_out_executor(len(names))
+        # Контекст копируется для каждого шарда: реплики, read_from_primary и т.п. действуют и в потоках
+        futures = [executor.submit(contextvars.copy_context().run, run, name) for name in names]
+        return _merge([future.result() for future in futures], func.__name__)
+
+    return wrapper
@@ -0,0 +1,144 @@
+import csv
+import gzip
+import io
+import json
+import logging.config
+from tempfile import SpooledTemporaryFile
+
+from configs import EXPORT_CHUNK_SIZE, EXPORT_SPOOL_MAX_SIZE
+from db.db import exception_handler
+from db.execute_query import stream_query_pg
+
+logger = logging.getLogger(__name__)
+
+# Столбцы экспорта записей о снах
+SLEEP_RECORD_EXPORT_COLUMNS = ('id', 'user_id', 'sleep_time', 'wake_time', 'sleep_quality', 'mood')
+
+# Уровень сжатия gzip: 9 (по умолчанию) почти не уменьшает файл, но заметно медленнее
+GZIP_LEVEL = 6
+
+# Форматы экспорта
+CSV = 'csv'
+NDJSON = 'ndjson'
+PARQUET = 'parquet'
+
+
+class ExportFile:
+    """
+    Готовый к отправке файл экспорта: file открыт и перемотан в начало.
+    Пока файл меньше EXPORT_SPOOL_MAX_SIZE, он хранится в памяти, затем - во временном каталоге системы.
+    """
+    __slots__ = ('file', 'file_name', 'rowcount')
+
+    def __init__(self, file: SpooledTemporaryFile, file_name: str, rowcount: int):
+        self.file = file
+        self.file_name = file_name
+        self.rowcount = rowcount
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _write_csv(file, chunks) -> int:
+    """
+    CSV, сжатый gzip: значения в текстовом виде
+    """
+    rowcount = 0
+    with gzip.GzipFile(mode='wb', fileobj=file, compresslevel=GZIP_LEVEL) as archive, \
+            io.TextIOWrapper(archive, encoding='utf-8', newline='') as text:
+        writer = csv.writer(text)
+        writer.writerow(SLEEP_RECORD_EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows([row[column] for column in SLEEP_RECORD_EXPORT_COLUMNS] for row in rows)
+            rowcount += len(rows)
+    return rowcount
+
+
+def _json_value(value):
+    return value.isoformat()
+
+
+def _write_ndjson(file, chunks) -> int:
+    """
+    JSON по одной записи в строке, сжатый gzip: числа остаются числами, время - в ISO 8601
+    """
+    rowcount = 0
+    with gzip.GzipFile(mode='wb', fileobj=file, compresslevel=GZIP_LEVEL) as archive:
+        for rows in chunks:
+            archive.write(''.join(
+                json.dumps({column: row[column] for column in SLEEP_RECORD_EXPORT_COLUMNS},
+                           default=_json_value, separators=(',', ':')) + '\n'
+                for row in rows
+            ).encode())
+            rowcount += len(rows)
+    return rowcount
+
+
+def _write_parquet(file, chunks) -> int:
+    """
+    Parquet со сжатием zstd: время - timestamp UTC, оценки - int16; каждая порция - отдельная группа строк
+    """
+    # pyarrow загружается только при экспорте в Parquet
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('user_id', pyarrow.int64()),
+        ('sleep_time', pyarrow.timestamp('us', tz='UTC')),
+        ('wake_time', pyarrow.timestamp('us', tz='UTC')),
+        ('sleep_quality', pyarrow.int16()),
+        ('mood', pyarrow.int16()),
+    ])
+    rowcount = 0
+    # Время и id растут почти равномерно: разностное кодирование сжимает их лучше словаря
+    with pyarrow.parquet.ParquetWriter(
+            file, schema, compression='zstd', use_dictionary=['user_id', 'sleep_quality', 'mood'],
+            column_encoding={column: 'DELTA_BINARY_PACKED' for column in ('id', 'sleep_time', 'wake_time')}
+    ) as writer:
+        for rows in chunks:
+            writer.write_batch(pyarrow.RecordBatch.from_pylist(rows, schema=schema))
+            rowcount += len(rows)
+    return rowcount
+
+
+# Формат: функция записи и расширение файла
+EXPORT_FORMATS = {
+    CSV: (_write_csv, 'csv.gz'),
+    NDJSON: (_write_ndjson, 'ndjson.gz'),
+    PARQUET: (_write_parquet, 'parquet'),
+}
+
+
+def _sleep_record_chunks(user_id: int, chunk_size: int):
+    return stream_query_pg(f'''
+        SELECT {", ".join(SLEEP_RECORD_EXPORT_COLUMNS)} FROM public.sleep_records
+        WHERE user_id = %(user_id)s
+        AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+        ORDER BY sleep_time DESC
+    ''', {'user_id': user_id}, chunk_size)
+
+
+@exception_handler
+def export_sleep_records(user_id: int, export_format: str = CSV, chunk_size: int = EXPORT_CHUNK_SIZE) -> ExportFile:
+    """
+    Экспортирует записи о снах пользователя с id user_id в формате export_format (csv, ndjson или parquet).
+    Записи читаются порциями по chunk_size и сразу записываются в файл, поэтому расход памяти
+    не зависит от длины истории; рабочий каталог не используется.
+    :return: Файл экспорта (rowcount == 0, если записей нет).
+    """
+    write, extension = EXPORT_FORMATS[export_format]
+    spool = SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)
+    try:
+        rowcount = write(spool, _sleep_record_chunks(user_id, chunk_size))
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return ExportFile(spool, f'sleep_data_{user_id}.{extension}', rowcount)
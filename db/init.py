@@ -1,106 +1,534 @@
 import logging.config
+from datetime import datetime, timezone
 
 import psycopg2
 
-from db.execute_query import execute_query_pg
+from configs import DATABASE_BACKEND, SLEEP_RECORDS_PARTITIONS_AHEAD
+from db.execute_query import execute_query_pg, unit_of_work, shard_names, use_shard
+from db.execute_query.execute_sqlite import split_script_sl
+from db.partitions import create_partition_sql, current_month, add_months, month_range, \
+    ensure_sleep_record_partitions
 
 logger = logging.getLogger(__name__)
 
+# Схема базы SQLite (DATABASE_BACKEND=sqlite), соответствует схеме PostgreSQL.
+# Тип timestamptz возвращается из sqlite3 как datetime (db.execute_query.execute_sqlite).
+SQLITE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS users(
+        id INTEGER NOT NULL PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        phone_number TEXT,
+        city_name TEXT,
+        sleep_goal REAL DEFAULT 8.0,
+        wake_time TEXT,
+        has_provided_location INTEGER DEFAULT 0,
+        time_zone TEXT,
+        open_sleep_time TIMESTAMPTZ
+    );
 
-# Инициализация базы данных
-def database_initialize():
+    CREATE TABLE IF NOT EXISTS sleep_records(
+        id INTEGER NOT NULL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        sleep_time TIMESTAMPTZ NOT NULL,
+        wake_time TIMESTAMPTZ,
+        sleep_quality INTEGER,
+        mood INTEGER
+    );
+
+    CREATE INDEX IF NOT EXISTS sleep_records_user_id_sleep_time_idx
+        ON sleep_records (user_id, sleep_time DESC);
+
+    CREATE INDEX IF NOT EXISTS sleep_records_open_idx
+        ON sleep_records (user_id)
+        WHERE wake_time IS NULL;
+
+    -- Открытая сессия сна пользователя отмечается в users.open_sleep_time, как в PostgreSQL
+    CREATE TRIGGER IF NOT EXISTS sleep_records_open_session_guard
+    BEFORE INSERT ON sleep_records
+    WHEN NEW.wake_time IS NULL AND (SELECT open_sleep_time FROM users WHERE id = NEW.user_id) IS NOT NULL
+    BEGIN
+        SELECT RAISE(IGNORE);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS sleep_records_open_session_opened
+    AFTER INSERT ON sleep_records
+    WHEN NEW.wake_time IS NULL
+    BEGIN
+        UPDATE users SET open_sleep_time = NEW.sleep_time WHERE id = NEW.user_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS sleep_records_open_session_closed
+    AFTER UPDATE OF wake_time ON sleep_records
+    WHEN OLD.wake_time IS NULL AND NEW.wake_time IS NOT NULL
+    BEGIN
+        UPDATE users SET open_sleep_time = NULL WHERE id = NEW.user_id AND open_sleep_time = OLD.sleep_time;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS sleep_records_open_session_deleted
+    AFTER DELETE ON sleep_records
+    WHEN OLD.wake_time IS NULL
+    BEGIN
+        UPDATE users SET open_sleep_time = NULL WHERE id = OLD.user_id AND open_sleep_time = OLD.sleep_time;
+    END;
+
+    CREATE TABLE IF NOT EXISTS reminders(
+        user_id INTEGER NOT NULL PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+        reminder_time TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS daily_sleep_summary(
+        user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        sleep_date DATE NOT NULL,
+        total_seconds INTEGER NOT NULL,
+        sessions INTEGER NOT NULL,
+        avg_quality REAL,
+        avg_mood REAL,
+        sleep_goal REAL,
+        goal_attainment REAL,
+        PRIMARY KEY (user_id, sleep_date)
+    );
+
+    CREATE TABLE IF NOT EXISTS purge_queue(
+        user_id INTEGER NOT NULL PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+        requested_at TIMESTAMPTZ NOT NULL
+    );
+'''
+
+# Примененные миграции схемы: номер последней - версия схемы базы
+SCHEMA_VERSION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS public.schema_version(
+        version integer NOT NULL,
+        name text NOT NULL,
+        applied_at timestamp with time zone NOT NULL,
+        CONSTRAINT schema_version_pkey PRIMARY KEY (version)
+    )
+'''
+SQLITE_SCHEMA_VERSION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_version(
+        version INTEGER NOT NULL PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL
+    )
+'''
+# Есть ли таблица версий: на новой базе ее еще нет, и чтение версии завершилось бы ошибкой
+SCHEMA_VERSION_EXISTS_SQL = "SELECT to_regclass('public.schema_version') IS NOT NULL AS present"
+SQLITE_SCHEMA_VERSION_EXISTS_SQL = \
+    "SELECT count(*) > 0 AS present FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+
+# Ключ advisory lock: миграции шарда применяет один процесс, остальные ждут и видят новую версию
+SCHEMA_MIGRATION_LOCK = 7_310_425
+
+# Таблица sleep_records секционирована по месяцам sleep_time (db.partitions).
+# Первичный ключ секционированной таблицы обязан включать ключ секционирования.
+SLEEP_RECORDS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS public.sleep_records(
+        id integer NOT NULL DEFAULT nextval('sleep_records_id_seq'::regclass),
+        user_id bigint NOT NULL,
+        sleep_time timestamp with time zone NOT NULL,
+        wake_time timestamp with time zone,
+        sleep_quality integer,
+        mood integer,
+        CONSTRAINT sleep_records_pkey PRIMARY KEY (id, sleep_time),
+        CONSTRAINT sleep_records_user_id_fkey FOREIGN KEY (user_id)
+            REFERENCES public.users (id) MATCH SIMPLE
+            ON UPDATE NO ACTION
+            ON DELETE CASCADE
+    ) PARTITION BY RANGE (sleep_time)
+'''
+
+
+USERS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS public.users(
+        id bigint NOT NULL,
+        username text COLLATE pg_catalog."default",
+        first_name text COLLATE pg_catalog."default",
+        last_name text COLLATE pg_catalog."default",
+        phone_number text COLLATE pg_catalog."default",
+        city_name text COLLATE pg_catalog."default",
+        sleep_goal real DEFAULT 8.0,
+        wake_time text COLLATE pg_catalog."default",
+        has_provided_location integer DEFAULT 0,
+        time_zone text COLLATE pg_catalog."default",
+        CONSTRAINT users_pkey PRIMARY KEY (id)
+    )
+
+    TABLESPACE pg_default;
+
+    ALTER TABLE IF EXISTS public.users
+        OWNER to postgres;
+'''
+
+SLEEP_RECORDS_SQL = f'''
+    CREATE SEQUENCE IF NOT EXISTS public.sleep_records_id_seq
+        INCREMENT 1
+        START 1
+        MINVALUE 1
+        MAXVALUE 9223372036854775807
+        CACHE 1;
+
+    ALTER SEQUENCE public.sleep_records_id_seq
+        OWNER TO postgres;
+
+    {SLEEP_RECORDS_TABLE_SQL};
+
+    ALTER TABLE IF EXISTS public.sleep_records
+        OWNER to postgres;
+
+    ALTER SEQUENCE public.sleep_records_id_seq
+        OWNED BY public.sleep_records.id;
+'''
+
+REMINDERS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS public.reminders(
+        user_id bigint NOT NULL,
+        reminder_time text COLLATE pg_catalog."default" NOT NULL,
+        CONSTRAINT reminders_pkey PRIMARY KEY (user_id),
+        CONSTRAINT reminders_user_id_fkey FOREIGN KEY (user_id)
+            REFERENCES public.users (id) MATCH SIMPLE
+            ON UPDATE NO ACTION
+            ON DELETE CASCADE
+    );
+
+    ALTER TABLE IF EXISTS public.reminders
+        OWNER to postgres;
+'''
+
+# Дневные сводки сна, поддерживаются db.summary
+DAILY_SLEEP_SUMMARY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS public.daily_sleep_summary(
+        user_id bigint NOT NULL,
+        sleep_date date NOT NULL,
+        total_seconds integer NOT NULL,
+        sessions integer NOT NULL,
+        avg_quality real,
+        avg_mood real,
+        sleep_goal real,
+        goal_attainment real,
+        CONSTRAINT daily_sleep_summary_pkey PRIMARY KEY (user_id, sleep_date),
+        CONSTRAINT daily_sleep_summary_user_id_fkey FOREIGN KEY (user_id)
+            REFERENCES public.users (id) MATCH SIMPLE
+            ON UPDATE NO ACTION
+            ON DELETE CASCADE
+    );
+
+    ALTER TABLE IF EXISTS public.daily_sleep_summary
+        OWNER to postgres;
+'''
+
+# Пользователи, чьи данные удаляются в фоне пачками (db.purge).
+# Пользователь из очереди скрыт; строка очереди удаляется каскадно вместе с users
+PURGE_QUEUE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS public.purge_queue(
+        user_id bigint NOT NULL,
+        requested_at timestamp with time zone NOT NULL DEFAULT now(),
+        CONSTRAINT purge_queue_pkey PRIMARY KEY (user_id),
+        CONSTRAINT purge_queue_user_id_fkey FOREIGN KEY (user_id)
+            REFERENCES public.users (id) MATCH SIMPLE
+            ON UPDATE NO ACTION
+            ON DELETE CASCADE
+    );
+
+    ALTER TABLE IF EXISTS public.purge_queue
+        OWNER to postgres;
+'''
+
+# Пользователи записей о снах, которых нет в users (старые базы SQLite)
+SQLITE_USERS_OF_SLEEP_RECORDS_SQL = '''
+    INSERT INTO users (id)
+    SELECT DISTINCT user_id FROM sleep_records
+    WHERE user_id NOT IN (SELECT id FROM users)
+'''
+
+
+class Migration:
     """
-    Инициализация базы данных
+    Миграция схемы: версия (порядковый номер), название и изменение - скрипт sql
+    или функция apply(), выполняющая запросы через execute_query_pg.
+    Миграция выполняется одной транзакцией вместе с записью в schema_version (unit_of_work).
+    Миграции, написанные до появления schema_version, повторяемы: уже существующие базы проходят их заново.
     """
-    try:
-        # execute_query('''
-        #     CREATE DATABASE IF NOT EXISTS sleep_bot_database
-        #         WITH
-        #         OWNER = postgres
-        #         ENCODING = 'UTF8'
-        #         LC_COLLATE = 'C'
-        #         LC_CTYPE = 'C'
-        #         TABLESPACE = pg_default
-        #         CONNECTION LIMIT = -1
-        #         IS_TEMPLATE = False;
-        # ''')
-
-        # Таблица users
-        execute_query_pg('''
-            CREATE TABLE IF NOT EXISTS public.users(
-                id bigint NOT NULL,
-                username text COLLATE pg_catalog."default",
-                first_name text COLLATE pg_catalog."default",
-                last_name text COLLATE pg_catalog."default",
-                phone_number text COLLATE pg_catalog."default",
-                city_name text COLLATE pg_catalog."default",
-                sleep_goal real DEFAULT 8.0,
-                wake_time text COLLATE pg_catalog."default",
-                has_provided_location integer DEFAULT 0,
-                CONSTRAINT users_pkey PRIMARY KEY (id)
-            )
-            
-            TABLESPACE pg_default;
-            
-            ALTER TABLE IF EXISTS public.users
-                OWNER to postgres;
-        ''')
+    __slots__ = ('version', 'name', 'sql', 'apply')
 
-        execute_query_pg('''
-            CREATE SEQUENCE IF NOT EXISTS public.sleep_records_id_seq
-                INCREMENT 1
-                START 1
-                MINVALUE 1
-                MAXVALUE 9223372036854775807
-                CACHE 1;
-
-            ALTER SEQUENCE public.sleep_records_id_seq
-                OWNER TO postgres;
-        ''')
+    def __init__(self, version: int, name: str, sql: str | None = None, apply=None):
+        if (sql is None) == (apply is None):
+            raise ValueError(f'Миграция {version} должна задавать sql или apply')
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.apply = apply
 
-        # Таблица sleep_records
-        execute_query_pg('''      
-            CREATE TABLE IF NOT EXISTS public.sleep_records(
-                id integer NOT NULL DEFAULT nextval('sleep_records_id_seq'::regclass),
-                user_id bigint NOT NULL,
-                sleep_time text COLLATE pg_catalog."default" NOT NULL,
-                wake_time text COLLATE pg_catalog."default",
-                sleep_quality integer,
-                mood integer,
-                CONSTRAINT sleep_records_pkey PRIMARY KEY (id),
-                CONSTRAINT sleep_records_user_id_fkey FOREIGN KEY (user_id)
-                    REFERENCES public.users (id) MATCH SIMPLE
-                    ON UPDATE NO ACTION
-                    ON DELETE CASCADE
-            );
-            
-            ALTER TABLE IF EXISTS public.sleep_records
-                OWNER to postgres;
-                
-            ALTER SEQUENCE public.sleep_records_id_seq
-                OWNED BY public.sleep_records.id;
-        ''')
+    def run(self):
+        if self.apply is not None:
+            self.apply()
+            return
+        # В SQLite execute выполняет по одному запросу
+        statements = split_script_sl(self.sql) if DATABASE_BACKEND == 'sqlite' else (self.sql,)
+        for statement in statements:
+            if execute_query_pg(statement) is None:
+                raise RuntimeError(f'запрос миграции {self.version} не выполнен')
 
+    def __repr__(self):
+        return f'Migration({self.version}, {self.name!r})'
 
-        # Таблица reminders
-        execute_query_pg('''
-            CREATE TABLE IF NOT EXISTS public.reminders(
-                user_id bigint NOT NULL,
-                reminder_time text COLLATE pg_catalog."default" NOT NULL,
-                CONSTRAINT reminders_pkey PRIMARY KEY (user_id),
-                CONSTRAINT reminders_user_id_fkey FOREIGN KEY (user_id)
-                    REFERENCES public.users (id) MATCH SIMPLE
-                    ON UPDATE NO ACTION
-                    ON DELETE CASCADE
-            );
-            
-            ALTER TABLE IF EXISTS public.reminders
-                OWNER to postgres;
-        ''')
-        logger.info("База данных проинициализирована")
-    except psycopg2.DatabaseError as e:
-        logger.error(f"Ошибка при создании баззы данных: {e}")   
 
+def convert_sleep_records_timestamptz_db():
+    """
+    Приводит существующую базу к текущей схеме: sleep_time и wake_time хранятся как timestamptz,
+    у пользователя не больше одной открытой сессии сна. Повторный запуск ничего не меняет.
+    """
+    # Столбец time_zone добавлялся в users вручную и отсутствует в старых базах
+    execute_query_pg('ALTER TABLE IF EXISTS public.users ADD COLUMN IF NOT EXISTS time_zone text')
+
+    # Текстовые значения записаны из datetime с часовым поясом (isoformat / str), поэтому приводятся напрямую
+    execute_query_pg('''
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'sleep_records'
+                AND column_name IN ('sleep_time', 'wake_time')
+                AND data_type <> 'timestamp with time zone'
+            ) THEN
+                ALTER TABLE public.sleep_records
+                    ALTER COLUMN sleep_time TYPE timestamp with time zone
+                        USING sleep_time::timestamp with time zone,
+                    ALTER COLUMN wake_time TYPE timestamp with time zone
+                        USING NULLIF(wake_time, '')::timestamp with time zone;
+            END IF;
+        END
+        $$;
+    ''')
+
+    # Дубли открытых сессий (повторные нажатия /sleep) сводятся к последней, как раньше делал триггер SQLite
+    execute_query_pg('''
+        DELETE FROM public.sleep_records r
+        USING public.sleep_records newer
+        WHERE r.wake_time IS NULL AND newer.wake_time IS NULL
+        AND r.user_id = newer.user_id
+        AND (r.sleep_time, r.id) < (newer.sleep_time, newer.id);
+    ''')
+
+
+def partition_sleep_records_migration():
+    """
+    sleep_records секционирована по месяцам, история пользователя читается по индексу (user_id, sleep_time DESC)
+    """
+    partition_sleep_records_db()
+    if ensure_sleep_record_partitions() is None:
+        raise RuntimeError('не удалось создать секции sleep_records')
+
+    # Индексы секционированной таблицы создаются на каждой секции
+    execute_query_pg('''
+        CREATE INDEX IF NOT EXISTS sleep_records_user_id_sleep_time_idx
+            ON public.sleep_records USING btree (user_id, sleep_time DESC);
+
+        CREATE INDEX IF NOT EXISTS sleep_records_open_idx
+            ON public.sleep_records USING btree (user_id)
+            WHERE wake_time IS NULL;
+    ''')
+
+
+def partition_sleep_records_db() -> bool:
+    """
+    Переносит данные несекционированной sleep_records в секционированную таблицу с секциями
+    по месяцам существующих записей. Выполняется одной транзакцией.
+    :return: True, если таблица была перестроена.
+    """
+    cursor = execute_query_pg(
+        "SELECT relkind FROM pg_catalog.pg_class WHERE oid = to_regclass('public.sleep_records')"
+    )
+    row = cursor.fetchone() if cursor else None
+    if row is None or row['relkind'] != 'r':
+        return False
+
+    # Границы секций считаются в UTC
+    bounds = execute_query_pg('''
+        SELECT (min(sleep_time) AT TIME ZONE 'UTC')::date AS first, (max(sleep_time) AT TIME ZONE 'UTC')::date AS last
+        FROM public.sleep_records
+    ''').fetchone()
+    last = max(bounds['last'].replace(day=1), current_month()) if bounds['last'] else current_month()
+    months = month_range(bounds['first'] or current_month(), add_months(last, SLEEP_RECORDS_PARTITIONS_AHEAD))
+    partitions_sql = ';\n'.join(create_partition_sql(month) for month in months)
+
+    # Последовательность id принадлежит старой таблице и иначе удалилась бы вместе с ней;
+    # старые индексы переименовываются, чтобы их имена заняли индексы новой таблицы
+    cursor = execute_query_pg(f'''
+        ALTER SEQUENCE public.sleep_records_id_seq OWNED BY NONE;
+        ALTER TABLE public.sleep_records RENAME TO sleep_records_unpartitioned;
+        ALTER INDEX public.sleep_records_pkey RENAME TO sleep_records_unpartitioned_pkey;
+        DROP INDEX IF EXISTS public.sleep_records_user_id_sleep_time_idx;
+        DROP INDEX IF EXISTS public.sleep_records_open_session_idx;
+
+        {SLEEP_RECORDS_TABLE_SQL};
+        {partitions_sql};
+
+        INSERT INTO public.sleep_records (id, user_id, sleep_time, wake_time, sleep_quality, mood)
+        SELECT id, user_id, sleep_time, wake_time, sleep_quality, mood FROM public.sleep_records_unpartitioned;
+
+        DROP TABLE public.sleep_records_unpartitioned;
+        ALTER SEQUENCE public.sleep_records_id_seq OWNED BY public.sleep_records.id;
+    ''')
+    if cursor is None:
+        logger.error('Не удалось секционировать sleep_records, таблица оставлена без изменений')
+        return False
+    logger.info(f'sleep_records секционирована: {len(months)} секций')
+    return True
+
+
+def create_open_session_guard_db():
+    """
+    Одна открытая сессия сна на пользователя. Уникальный индекс секционированной таблицы обязан включать
+    sleep_time, поэтому открытая сессия отмечается в users.open_sleep_time: вставка открытой сессии
+    при уже отмеченной пропускается (rowcount == 0), закрытие и удаление сессии снимают отметку.
+    Блокировка строки пользователя упорядочивает одновременные открытия сессии.
+    """
+    execute_query_pg('''
+        ALTER TABLE IF EXISTS public.users ADD COLUMN IF NOT EXISTS open_sleep_time timestamp with time zone;
+
+        UPDATE public.users u SET open_sleep_time = s.sleep_time
+        FROM public.sleep_records s
+        WHERE s.user_id = u.id AND s.wake_time IS NULL
+        AND u.open_sleep_time IS DISTINCT FROM s.sleep_time;
+
+        CREATE OR REPLACE FUNCTION public.sleep_records_open_session_guard() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                IF NEW.wake_time IS NULL THEN
+                    UPDATE public.users SET open_sleep_time = NEW.sleep_time
+                    WHERE id = NEW.user_id AND open_sleep_time IS NULL;
+                    IF NOT FOUND THEN
+                        RETURN NULL;
+                    END IF;
+                END IF;
+                RETURN NEW;
+            END IF;
+
+            UPDATE public.users SET open_sleep_time = NULL
+            WHERE id = OLD.user_id AND open_sleep_time = OLD.sleep_time;
+            RETURN NULL;
+        END
+        $$;
+
+        DROP TRIGGER IF EXISTS sleep_records_open_session_guard ON public.sleep_records;
+        CREATE TRIGGER sleep_records_open_session_guard
+            BEFORE INSERT ON public.sleep_records
+            FOR EACH ROW EXECUTE FUNCTION public.sleep_records_open_session_guard();
+
+        DROP TRIGGER IF EXISTS sleep_records_open_session_closed ON public.sleep_records;
+        CREATE TRIGGER sleep_records_open_session_closed
+            AFTER UPDATE OF wake_time ON public.sleep_records
+            FOR EACH ROW WHEN (OLD.wake_time IS NULL AND NEW.wake_time IS NOT NULL)
+            EXECUTE FUNCTION public.sleep_records_open_session_guard();
+
+        DROP TRIGGER IF EXISTS sleep_records_open_session_deleted ON public.sleep_records;
+        CREATE TRIGGER sleep_records_open_session_deleted
+            AFTER DELETE ON public.sleep_records
+            FOR EACH ROW WHEN (OLD.wake_time IS NULL)
+            EXECUTE FUNCTION public.sleep_records_open_session_guard();
+    ''')
+
+
+# Миграции схемы PostgreSQL по порядку версий. Новое изменение схемы - новая миграция в конце списка
+MIGRATIONS = (
+    Migration(1, 'users', USERS_TABLE_SQL),
+    Migration(2, 'sleep_records', SLEEP_RECORDS_SQL),
+    Migration(3, 'reminders', REMINDERS_TABLE_SQL),
+    Migration(4, 'daily_sleep_summary', DAILY_SLEEP_SUMMARY_TABLE_SQL),
+    Migration(5, 'purge_queue', PURGE_QUEUE_TABLE_SQL),
+    Migration(6, 'sleep_records_timestamptz', apply=convert_sleep_records_timestamptz_db),
+    Migration(7, 'sleep_records_partitions', apply=partition_sleep_records_migration),
+    Migration(8, 'open_session_guard', apply=create_open_session_guard_db),
+)
+
+# Миграции схемы SQLite (DATABASE_BACKEND=sqlite)
+SQLITE_MIGRATIONS = (
+    Migration(1, 'schema', SQLITE_SCHEMA),
+    Migration(2, 'users_of_sleep_records', SQLITE_USERS_OF_SLEEP_RECORDS_SQL),
+)
+
+
+def schema_version() -> int | None:
+    """
+    Версия схемы текущего шарда: номер последней примененной миграции, 0 - миграций еще не было
+    (в том числе на новой базе без таблицы schema_version).
+    :return: None, если версию прочитать не удалось.
+    """
+    cursor = execute_query_pg(
+        SQLITE_SCHEMA_VERSION_EXISTS_SQL if DATABASE_BACKEND == 'sqlite' else SCHEMA_VERSION_EXISTS_SQL
+    )
+    row = cursor.fetchone() if cursor else None
+    if row is None:
+        return None
+    if not row['present']:
+        return 0
+    cursor = execute_query_pg('SELECT max(version) AS version FROM public.schema_version')
+    row = cursor.fetchone() if cursor else None
+    return (row['version'] or 0) if row else None
+
+
+def apply_migrations(migrations=None) -> list[int]:
+    """
+    Применяет к базе текущего шарда миграции новее ее версии схемы. При актуальной схеме выполняется
+    два запроса чтения (schema_version), без DDL. Каждая миграция выполняется своей транзакцией под advisory lock:
+    одновременно запущенные процессы применяют миграцию один раз, а ошибка откатывает ее целиком
+    и останавливает применение следующих.
+    :return: Версии примененных миграций.
+    """
+    if migrations is None:
+        migrations = SQLITE_MIGRATIONS if DATABASE_BACKEND == 'sqlite' else MIGRATIONS
+    version = schema_version()
+    if version is not None and version >= migrations[-1].version:
+        return []
+
+    applied = []
+    for migration in migrations:
+        if version is not None and migration.version <= version:
+            continue
+        try:
+            with unit_of_work() as session:
+                if DATABASE_BACKEND == 'sqlite':
+                    # BEGIN IMMEDIATE единицы работы уже не пускает другие процессы к записи
+                    execute_query_pg(SQLITE_SCHEMA_VERSION_TABLE_SQL)
+                else:
+                    execute_query_pg('SELECT pg_advisory_xact_lock(%(key)s)', {'key': SCHEMA_MIGRATION_LOCK})
+                    execute_query_pg(SCHEMA_VERSION_TABLE_SQL)
+                version = schema_version()
+                if version is None:
+                    raise RuntimeError('не удалось прочитать версию схемы')
+                # Пока ждали блокировку, миграцию мог применить другой процесс
+                if migration.version <= version:
+                    continue
+                migration.run()
+                execute_query_pg('''
+                    INSERT INTO public.schema_version (version, name, applied_at)
+                    VALUES (%(version)s, %(name)s, %(applied_at)s)
+                ''', {'version': migration.version, 'name': migration.name, 'applied_at': datetime.now(timezone.utc)})
+        except Exception as e:
+            logger.error(f'Ошибка миграции схемы {migration.version} ({migration.name}): {e}', exc_info=True)
+            break
+        if not session.committed:
+            logger.error(f'Миграция схемы {migration.version} ({migration.name}) отменена')
+            break
+        version = migration.version
+        applied.append(version)
+        logger.info(f'Применена миграция схемы {version}: {migration.name}')
+    return applied
+
+
+# Инициализация базы данных
+def database_initialize():
+    """
+    Приводит схему базы данных (каждого шарда, если настроено шардирование) к последней версии:
+    при актуальной схеме - одна проверка версии без DDL, иначе применяются только новые миграции
+    """
+    for shard in shard_names() if DATABASE_BACKEND != 'sqlite' else [None]:
+        with use_shard(shard):
+            applied = apply_migrations()
+        if applied:
+            logger.info(f'База данных{f" шарда {shard}" if shard else ""} обновлена до версии {applied[-1]}')
 
 
 def create_triggers_db():
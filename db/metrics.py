@@ -0,0 +1,122 @@
+import bisect
+import logging.config
+import threading
+
+from configs import DB_SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('db.slow_queries')
+
+# Верхние границы корзин гистограммы задержек, мс (последняя корзина - всё, что дольше)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class CallArgs:
+    """
+    Аргументы вызова, которые превращаются в строку только при фактической записи в лог
+    """
+    __slots__ = ('args', 'kwargs')
+
+    def __init__(self, args: tuple, kwargs: dict):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return ', '.join([f"{a}" for a in self.args] + [f"{k}={v}" for k, v in self.kwargs.items()])
+
+
+class _AccessorStats:
+    __slots__ = ('calls', 'errors', 'rows', 'total_ms', 'max_ms', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Оценка перцентиля по гистограмме: верхняя граница корзины, в которую он попадает
+        """
+        rank = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'histogram': dict(zip([f'<={bound}' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}'],
+                                  self.buckets)),
+        }
+
+
+_stats: dict[str, _AccessorStats] = {}
+_stats_lock = threading.Lock()
+
+
+def count_rows(result) -> int:
+    """
+    Количество строк в результате функции доступа к данным (список строк, строка, запись или курсор)
+    """
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, (dict, tuple)):
+        return 1
+    rowcount = getattr(result, 'rowcount', None)
+    return rowcount if isinstance(rowcount, int) and rowcount > 0 else 0
+
+
+def record_call(name: str, elapsed_ms: float, rows: int = 0, error: bool = False, call_args: CallArgs = None):
+    """
+    Учитывает вызов функции доступа к данным; вызовы дольше DB_SLOW_QUERY_MS пишутся в журнал медленных запросов
+    """
+    index = bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = _AccessorStats()
+        stats.calls += 1
+        stats.errors += error
+        stats.rows += rows
+        stats.total_ms += elapsed_ms
+        if elapsed_ms > stats.max_ms:
+            stats.max_ms = elapsed_ms
+        stats.buckets[index] += 1
+
+    if elapsed_ms >= DB_SLOW_QUERY_MS:
+        slow_query_logger.warning('Медленный вызов %s: %.1f мс, строк: %d, параметры: %s',
+                                  name, elapsed_ms, rows, call_args)
+
+
+def get_query_stats(top: int = None) -> dict[str, dict]:
+    """
+    Возвращает статистику вызовов по функциям доступа к данным, отсортированную по суммарному времени
+    :param top: Вернуть только top самых нагружающих базу функций.
+    """
+    with _stats_lock:
+        items = sorted(_stats.items(), key=lambda item: item[1].total_ms, reverse=True)
+        return {name: stats.as_dict() for name, stats in items[:top]}
+
+
+def reset_query_stats():
+    """
+    Сбрасывает накопленную статистику вызовов
+    """
+    with _stats_lock:
+        _stats.clear()
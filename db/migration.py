@@ -1,57 +1,230 @@
 import logging.config
+import time
+from datetime import datetime, timezone
 
 import psycopg2
+from psycopg2.extras import execute_values
 
-from configs.config import logger
-from db.execute_query import execute_query_sl, execute_query_pg
+from configs import MIGRATION_BATCH_SIZE
+from db.execute_query import connect_sl
+from db.execute_query.execute_pg import get_pool
+from db.execute_query.sharding import get_shard_map
+from db.partitions import ensure_sleep_record_partitions_between
 
 logger = logging.getLogger(__name__)
 
-def migration_sqlite_to_pg():
+# Прогресс переноса по таблицам; обновляется в одной транзакции с каждой пачкой строк
+PROGRESS_TABLE = 'public.migration_progress'
+
+
+def _ident(name: str) -> str:
+    """
+    Экранирует имя таблицы или столбца (правила SQLite и PostgreSQL совпадают)
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sqlite_tables(sl_conn) -> list[str]:
+    """
+    Возвращает таблицы SQLite так, чтобы таблица шла после таблиц, на которые она ссылается
+    """
+    names = [row['name'] for row in sl_conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    depends = {name: {fk['table'] for fk in sl_conn.execute(f'PRAGMA foreign_key_list({_ident(name)})')}
+               & set(names) - {name} for name in names}
+
+    ordered = []
+    while depends:
+        ready = [name for name, parents in depends.items() if parents <= set(ordered)] or list(depends)[:1]
+        for name in ready:
+            ordered.append(name)
+            del depends[name]
+    return ordered
+
+
+def _column_definitions(sl_conn, table_name: str) -> list[str]:
+    """
+    Описание столбцов таблицы SQLite для CREATE TABLE в PostgreSQL
+    """
+    columns = sl_conn.execute(f'PRAGMA table_info({_ident(table_name)})').fetchall()
+    definitions = []
+    for column in columns:
+        # INTEGER в SQLite 64-битный (id пользователей Telegram не помещаются в integer)
+        column_type = column['type'] or 'text'
+        parts = [_ident(column['name']), 'bigint' if column_type.upper() == 'INTEGER' else column_type]
+        if column['notnull']:
+            parts.append('NOT NULL')
+        if column['dflt_value'] is not None:
+            parts.append(f"DEFAULT({column['dflt_value']})")
+        definitions.append(' '.join(parts))
+
+    primary_key = [column['name'] for column in sorted(columns, key=lambda c: c['pk']) if column['pk']]
+    if primary_key:
+        definitions.append(f"PRIMARY KEY ({', '.join(_ident(name) for name in primary_key)})")
+    return definitions
+
+
+def _create_progress_table(conn):
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE}(
+            table_name text NOT NULL,
+            last_rowid bigint,
+            rows_copied bigint NOT NULL DEFAULT 0,
+            finished boolean NOT NULL DEFAULT false,
+            updated_at timestamp with time zone NOT NULL DEFAULT now(),
+            CONSTRAINT migration_progress_pkey PRIMARY KEY (table_name)
+        )
+    ''')
+    conn.commit()
+
+
+def _reset_sequences(cursor, table_name: str):
+    """
+    Сдвигает последовательности столбцов serial за перенесенные явно значения id
+    """
+    cursor.execute(
+        'SELECT column_name, pg_get_serial_sequence(%s, column_name) AS sequence_name '
+        'FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s',
+        (_ident(table_name), table_name)
+    )
+    for row in cursor.fetchall():
+        if row['sequence_name']:
+            cursor.execute(f"SELECT setval(%s, max({_ident(row['column_name'])})) FROM {_ident(table_name)}",
+                           (row['sequence_name'],))
+
+
+def _ensure_sleep_record_partitions(sl_conn):
+    """
+    Создает секции sleep_records для всего диапазона sleep_time переносимых записей:
+    у секционированной таблицы нет секции по умолчанию, и запись без секции не вставляется
+    """
+    # datetime() SQLite приводит время со смещением к UTC, как и границы секций
+    first, last = sl_conn.execute(
+        'SELECT min(datetime(sleep_time)), max(datetime(sleep_time)) FROM sleep_records').fetchone()
+    if first is None:
+        return
+    first, last = (datetime.fromisoformat(value).replace(tzinfo=timezone.utc) for value in (first, last))
+    if not ensure_sleep_record_partitions_between(first, last):
+        raise RuntimeError('не удалось создать секции sleep_records')
+
+
+def _migrate_table(sl_conn, conn, table_name: str, batch_size: int) -> int:
+    """
+    Переносит таблицу пачками по rowid, продолжая с последней сохраненной пачки.
+    Возвращает количество строк, прочитанных в этом запуске.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT last_rowid, rows_copied, finished FROM {PROGRESS_TABLE} WHERE table_name = %s',
+                   (table_name,))
+    progress = cursor.fetchone()
+    if progress and progress['finished']:
+        logger.info(f"Таблица {table_name} уже перенесена, пропускаем")
+        return 0
+
+    columns_str = ", ".join(_column_definitions(sl_conn, table_name))
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {_ident(table_name)} ({columns_str})")
+    conn.commit()
+    if table_name == 'sleep_records':
+        _ensure_sleep_record_partitions(sl_conn)
+
+    last_rowid = progress['last_rowid'] if progress else None
+    copied = progress['rows_copied'] if progress else 0
+    total = sl_conn.execute(f'SELECT count(*) FROM {_ident(table_name)}').fetchone()[0]
+    if last_rowid is not None:
+        logger.info(f"Продолжаем перенос таблицы {table_name} с rowid {last_rowid} ({copied}/{total})")
+
+    if last_rowid is None:
+        sl_cursor = sl_conn.execute(f'SELECT rowid AS __rowid__, * FROM {_ident(table_name)} ORDER BY rowid')
+    else:
+        sl_cursor = sl_conn.execute(
+            f'SELECT rowid AS __rowid__, * FROM {_ident(table_name)} WHERE rowid > ? ORDER BY rowid', (last_rowid,))
+    columns = [description[0] for description in sl_cursor.description[1:]]
+    insert_sql = (f"INSERT INTO {_ident(table_name)} ({', '.join(_ident(name) for name in columns)}) VALUES %s "
+                  f"ON CONFLICT DO NOTHING")
+
+    started = time.monotonic()
+    migrated = 0
+    while rows := sl_cursor.fetchmany(batch_size):
+        # Пачка и отметка о ней фиксируются вместе: после прерывания перенос продолжится со следующей пачки
+        execute_values(cursor, insert_sql, [tuple(row)[1:] for row in rows], page_size=len(rows))
+        cursor.execute(f'''
+            INSERT INTO {PROGRESS_TABLE} (table_name, last_rowid, rows_copied)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (table_name) DO UPDATE
+            SET last_rowid = EXCLUDED.last_rowid,
+                rows_copied = migration_progress.rows_copied + EXCLUDED.rows_copied,
+                updated_at = now()
+        ''', (table_name, rows[-1][0], len(rows)))
+        conn.commit()
+
+        migrated += len(rows)
+        copied += len(rows)
+        rate = migrated / max(time.monotonic() - started, 1e-6)
+        logger.info(f"{table_name}: {copied}/{total} строк ({copied / max(total, 1):.0%}), {rate:.0f} строк/с")
+
+    _reset_sequences(cursor, table_name)
+    cursor.execute(f'''
+        INSERT INTO {PROGRESS_TABLE} (table_name, finished) VALUES (%s, true)
+        ON CONFLICT (table_name) DO UPDATE SET finished = true, updated_at = now()
+    ''', (table_name,))
+    conn.commit()
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Данные в таблицу {table_name} перенесены успешно: {migrated} строк за {elapsed:.1f} с "
+                f"({migrated / max(elapsed, 1e-6):.0f} строк/с)")
+    return migrated
+
+
+def migration_sqlite_to_pg(batch_size: int = MIGRATION_BATCH_SIZE) -> dict[str, int] | None:
     '''
-    Миграция базы данных SQLite на PostgreSQL
+    Миграция базы данных SQLite на PostgreSQL.
+    Таблицы читаются курсором пачками по batch_size строк и загружаются через execute_values,
+    прогресс по каждой таблице сохраняется в migration_progress, поэтому прерванная миграция продолжается
+    с места остановки. Уже существующие в PostgreSQL строки пропускаются.
+    Данные переносятся в базу из основной конфигурации, поэтому при настроенных шардах (POSTGRES_SHARD_MAP)
+    миграция не запускается: пользователи других шардов оказались бы там, где их не ищут функции доступа к данным.
+    :return: Количество перенесенных в этом запуске строк по таблицам или None при ошибке.
     '''
+    if get_shard_map() is not None:
+        logger.error("Миграция SQLite -> PostgreSQL не поддерживает шардирование: "
+                     "выполните ее без POSTGRES_SHARD_MAP, затем распределите корзины по шардам (db.reshard)")
+        return None
+
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+    except Exception as e:
+        logger.error(f"Ошибка при подключении к базе данных для миграции: {e}")
+        return None
+
+    sl_conn = connect_sl()
+    broken = False
     try:
-        tables = execute_query_sl('SELECT name FROM sqlite_master WHERE type="table";').fetchall()
-
-
-        if tables:
-            # Перенос данных
-            for table in tables:
-                table_name = table['name']
-                rows = execute_query_sl(f"SELECT * FROM {table_name}").fetchall() 
-
-                # Получение информации о столбцах
-                columns = [" ".join([str({1: 'NOT NULL', 0: ''}[v[1]]).strip() if v[0] == 2 else
-                                     str({1: 'PRIMARY KEY', 0: ''}[v[1]]).strip() if v[0] == 4 else
-                                     ('DEFAULT('+str(v[1]).strip()+')'.strip() if v[1] != None else "")
-                                     if v[0] == 3 else str(v[1]) for v in enumerate(col[1:])]).strip() for col in execute_query_sl(f"PRAGMA table_info({table_name})", row_factory=False).fetchall()]
-                columns_str = ", ".join(columns)
-
-
-                try:
-                    # Создание таблицы в PostgreSQL
-                    execute_query_pg(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns_str});")
-                except psycopg2.DatabaseError as e:
-                    logger.warning(f"В базе данных уже существует таблица {table_name} c полями {columns_str}: {e}")
-
-                # Вставка данных
-                for row in rows:
-
-                    values_str = ", ".join(
-                        f"{str(val)}" if str(val).isdigit() else f"'{str(val)}'" if str(val) != 'None' else 'NULL'
-                        for i, val in enumerate(row))
-                    try:
-                        execute_query_pg(f"INSERT INTO {table_name} ({', '.join(row.keys())}) VALUES ({values_str})")
-                    except psycopg2.DatabaseError as e:
-                        logging.warning(f"В таблице {table_name} уже есть данные {values_str}: {e}")
-
-                logger.info(f"Данные в таблицу {table_name} перенесены успешно")
-            logger.info(f"Миграция базы данных прошла успешно")
-        else:
+        tables = _sqlite_tables(sl_conn)
+        if not tables:
             logger.warning(f"Миграция не прошла так как данные не были прочитаны")
+            return None
+
+        _create_progress_table(conn)
+        started = time.monotonic()
+        result = {table_name: _migrate_table(sl_conn, conn, table_name, batch_size) for table_name in tables}
+
+        elapsed = time.monotonic() - started
+        migrated = sum(result.values())
+        logger.info(f"Миграция базы данных прошла успешно: {migrated} строк за {elapsed:.1f} с "
+                    f"({migrated / max(elapsed, 1e-6):.0f} строк/с)")
+        return result
+    except psycopg2.OperationalError as e:
+        broken = True
+        logger.error(f"Ошибка при миграции базы данных: {e}")
+        return None
     except Exception as e:
         logger.error(f"Ошибка при миграции базы данных: {e}")
+        return None
+    finally:
+        pool.putconn(conn, close=broken)
+        sl_conn.close()
 
 
 if __name__ == '__main__':
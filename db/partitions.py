@@ -0,0 +1,126 @@
+import logging.config
+import re
+from datetime import date, datetime, timezone
+
+from configs import DATABASE_BACKEND, SLEEP_RECORDS_PARTITIONS_AHEAD, SLEEP_RECORDS_RETENTION_MONTHS
+from db.cache import invalidate_users
+from db.execute_query import execute_query_pg, shard_names, use_shard
+
+logger = logging.getLogger(__name__)
+
+# Месячные секции sleep_records: sleep_records_2024_12 хранит сны, начавшиеся в декабре 2024 (UTC)
+PARTITION_RE = re.compile(r'^sleep_records_(\d{4})_(\d{2})$')
+
+
+def current_month() -> date:
+    return datetime.now(timezone.utc).date().replace(day=1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(first: date, last: date) -> list[date]:
+    """
+    Месяцы с first по last включительно
+    """
+    months = []
+    month = first.replace(day=1)
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def partition_name(month: date) -> str:
+    return f'sleep_records_{month:%Y_%m}'
+
+
+def create_partition_sql(month: date) -> str:
+    return (f'CREATE TABLE IF NOT EXISTS public.{partition_name(month)} PARTITION OF public.sleep_records '
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00')")
+
+
+def ensure_sleep_record_partitions(months_ahead: int = SLEEP_RECORDS_PARTITIONS_AHEAD) -> list[str] | None:
+    """
+    Создает секции sleep_records с текущего месяца на months_ahead месяцев вперед (уже созданные пропускаются)
+    :return: Имена секций или None при ошибке.
+    """
+    if DATABASE_BACKEND == 'sqlite':
+        return []
+    months = month_range(current_month(), add_months(current_month(), months_ahead))
+    if execute_query_pg(';\n'.join(create_partition_sql(month) for month in months)) is None:
+        logger.error('Не удалось создать секции sleep_records')
+        return None
+    return [partition_name(month) for month in months]
+
+
+def ensure_sleep_record_partitions_between(first: datetime, last: datetime) -> bool:
+    """
+    Создает секции sleep_records для месяцев (UTC) с first по last, например перед загрузкой истории
+    :return: False при ошибке.
+    """
+    if DATABASE_BACKEND == 'sqlite':
+        return True
+    months = month_range(first.astimezone(timezone.utc).date(), last.astimezone(timezone.utc).date())
+    if execute_query_pg(';\n'.join(create_partition_sql(month) for month in months)) is None:
+        logger.error(f'Не удалось создать секции sleep_records с {first} по {last}')
+        return False
+    return True
+
+
+def drop_expired_sleep_record_partitions(retention_months: int = SLEEP_RECORDS_RETENTION_MONTHS) -> list[str] | None:
+    """
+    Удаляет записи о снах старше retention_months месяцев (0 - хранить все).
+    В PostgreSQL старые секции удаляются целиком, без DELETE по строкам.
+    :return: Имена удаленных секций или None при ошибке.
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = datetime.combine(add_months(current_month(), -retention_months), datetime.min.time(), timezone.utc)
+
+    # Открытая сессия в удаляемой секции больше не блокирует начало новой
+    cursor = execute_query_pg('''
+        UPDATE public.users SET open_sleep_time = NULL
+        WHERE open_sleep_time < %(cutoff)s
+        RETURNING id
+    ''', {'cutoff': cutoff})
+    if cursor is None:
+        return None
+    invalidate_users([row['id'] for row in cursor.fetchall()])
+
+    if DATABASE_BACKEND == 'sqlite':
+        cursor = execute_query_pg('DELETE FROM public.sleep_records WHERE sleep_time < %(cutoff)s', {'cutoff': cutoff})
+        return [] if cursor is not None else None
+
+    cursor = execute_query_pg('''
+        SELECT c.relname FROM pg_catalog.pg_inherits i
+        JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.sleep_records'::regclass
+    ''')
+    if cursor is None:
+        return None
+    expired = sorted(
+        row['relname'] for row in cursor.fetchall()
+        if (match := PARTITION_RE.match(row['relname'])) and date(int(match[1]), int(match[2]), 1) < cutoff.date()
+    )
+    if expired and execute_query_pg(';\n'.join(f'DROP TABLE IF EXISTS public.{name}' for name in expired)) is None:
+        logger.error(f'Не удалось удалить секции sleep_records: {", ".join(expired)}')
+        return None
+    return expired
+
+
+def maintain_sleep_record_partitions():
+    """
+    Обслуживание sleep_records на каждом шарде (задача планировщика):
+    создание секций на следующие месяцы и удаление секций старше срока хранения
+    """
+    for shard in shard_names():
+        with use_shard(shard):
+            created = ensure_sleep_record_partitions()
+            dropped = drop_expired_sleep_record_partitions()
+        if dropped:
+            logger.info(f'Удалены секции sleep_records{f" на шарде {shard}" if shard else ""}: {", ".join(dropped)}')
+        if created is not None and dropped is not None:
+            logger.debug(f'Секции sleep_records{f" на шарде {shard}" if shard else ""} обслужены')
@@ -0,0 +1,114 @@
+import argparse
+import logging.config
+import sys
+from datetime import datetime, timezone as dt_timezone
+
+from configs import PURGE_BATCH_SIZE, PURGE_MAX_BATCHES
+from db.cache import invalidate_users
+from db.db import exception_handler, hide_user_statements
+from db.execute_query import execute_query_pg, execute_transaction_pg, shard_names, use_shard
+from db.execute_query.sharding import group_by_shard
+
+logger = logging.getLogger(__name__)
+
+# Пачка записей о снах пользователя: (id, sleep_time) - первичный ключ секционированной таблицы
+DELETE_BATCH_SQL = '''
+    DELETE FROM public.sleep_records
+    WHERE user_id = %(user_id)s AND (id, sleep_time) IN (
+        SELECT id, sleep_time FROM public.sleep_records
+        WHERE user_id = %(user_id)s
+        LIMIT %(batch_size)s
+    )
+'''
+
+
+def _delete_batch(user_id: int, batch_size: int) -> int:
+    """
+    Удаляет не больше batch_size записей о снах пользователя отдельной короткой транзакцией
+    :return: Количество удаленных записей.
+    """
+    cursor = execute_query_pg(DELETE_BATCH_SQL, {'user_id': user_id, 'batch_size': batch_size})
+    if cursor is None:
+        raise RuntimeError(f'не удалось удалить записи о снах пользователя {user_id}')
+    return cursor.rowcount
+
+
+@exception_handler
+def _purge_shard(*, batch_size: int, max_batches: int) -> list[int]:
+    """
+    Удаляет историю пользователей из очереди текущего шарда в порядке постановки в очередь.
+    Когда записей о снах не осталось, строка users удаляется вместе со строкой очереди (ON DELETE CASCADE).
+    Параметры только именованные: exception_handler выбирает шард по первому позиционному аргументу.
+    :return: id пользователей, удаленных полностью.
+    """
+    cursor = execute_query_pg('SELECT user_id FROM public.purge_queue ORDER BY requested_at')
+    if cursor is None:
+        raise RuntimeError('не удалось прочитать очередь удаления')
+
+    purged = []
+    batches = 0
+    for row in cursor.fetchall():
+        user_id = row['user_id']
+        while batches < max_batches:
+            batches += 1
+            if _delete_batch(user_id, batch_size) < batch_size:
+                break
+        else:
+            # Пачки этого запуска израсходованы: удаление продолжится при следующем запуске
+            break
+        if execute_query_pg('DELETE FROM public.users WHERE id = %(user_id)s', {'user_id': user_id}) is None:
+            raise RuntimeError(f'не удалось удалить пользователя {user_id}')
+        purged.append(user_id)
+    return purged
+
+
+def purge_pending_users(batch_size: int = PURGE_BATCH_SIZE, max_batches: int = PURGE_MAX_BATCHES) -> list[int]:
+    """
+    Фоновое удаление данных пользователей из очереди purge_queue на каждом шарде: записи о снах удаляются
+    пачками по batch_size строк, каждая пачка - отдельной транзакцией, чтобы не держать долгих блокировок;
+    на шард за запуск - не больше max_batches пачек. Задача планировщика, запускается каждую минуту.
+    :return: id пользователей, удаленных полностью.
+    """
+    purged = []
+    for shard in shard_names():
+        with use_shard(shard):
+            purged.extend(_purge_shard(batch_size=batch_size, max_batches=max_batches) or [])
+    if purged:
+        invalidate_users(purged)
+        logger.info(f'Удалены данные пользователей из очереди: {len(purged)}')
+    return purged
+
+
+@exception_handler
+def _queue_users(user_ids: list[int], requested_at: datetime) -> int:
+    statements = [statement for user_id in user_ids for statement in hide_user_statements(user_id, requested_at)]
+    if execute_transaction_pg(statements) is None:
+        raise RuntimeError('не удалось поставить пользователей в очередь удаления')
+    return len(user_ids)
+
+
+def purge_users(user_ids) -> int:
+    """
+    Удаление данных многих пользователей (администрирование): на каждом шарде пользователи одной транзакцией
+    скрываются и ставятся в очередь purge_queue, их записи о снах удаляет purge_pending_users.
+    :return: Количество пользователей, поставленных в очередь (шард с ошибкой не учитывается).
+    """
+    requested_at = datetime.now(dt_timezone.utc)
+    queued = 0
+    for shard, shard_user_ids in group_by_shard(set(user_ids)).items():
+        with use_shard(shard):
+            queued += _queue_users(sorted(shard_user_ids), requested_at) or 0
+    invalidate_users(user_ids)
+    logger.info(f'Поставлено в очередь удаления пользователей: {queued}')
+    return queued
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Удаление данных пользователей')
+    parser.add_argument('user_ids', type=int, nargs='*', help='id пользователей, которых нужно удалить')
+    parser.add_argument('--drain', action='store_true', help='удалить всю очередь сразу, не дожидаясь планировщика')
+    args = parser.parse_args()
+    if args.user_ids:
+        purge_users(args.user_ids)
+    if args.drain:
+        purge_pending_users(max_batches=sys.maxsize)
@@ -0,0 +1,176 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from db.execute_query.execute_pg import PreparedStatement
+
+# Столбцы users, которые можно передать при сохранении пользователя (кроме id)
+USER_COLUMNS = ('username', 'first_name', 'last_name', 'phone_number', 'city_name',
+                'sleep_goal', 'wake_time', 'has_provided_location', 'time_zone')
+
+# Типы столбцов users: в VALUES тип значения не выводится из столбца таблицы
+USER_COLUMN_TYPES = {'username': 'text', 'first_name': 'text', 'last_name': 'text', 'phone_number': 'text',
+                     'city_name': 'text', 'sleep_goal': 'real', 'wake_time': 'text',
+                     'has_provided_location': 'integer', 'time_zone': 'text'}
+
+
+@lru_cache(maxsize=None)
+def user_upsert_sql(columns: tuple[str, ...]) -> str:
+    """
+    Запрос сохранения пользователя для набора переданных столбцов (строится один раз на каждый набор).
+    При конфликте обновляются только переданные столбцы.
+    """
+    insert_keys_str = ''.join(f', {key}' for key in columns)
+    insert_values_str = ''.join(f', %({key})s' for key in columns)
+    update_str = (' ON CONFLICT(id) DO UPDATE SET ' + ', '.join(f'{key} = %({key})s' for key in columns)) \
+        if columns else ''
+    return f'INSERT INTO public.users (id{insert_keys_str}) VALUES (%(user_id)s{insert_values_str}){update_str}'
+
+
+@lru_cache(maxsize=None)
+def users_bulk_upsert_sql(columns: tuple[str, ...]) -> tuple[str, str]:
+    """
+    Запрос и шаблон строки для сохранения нескольких пользователей одним запросом через execute_values
+    """
+    insert_keys_str = ''.join(f', {key}' for key in columns)
+    template = '(%(user_id)s' + ''.join(f', %({key})s' for key in columns) + ')'
+    update_str = (' ON CONFLICT(id) DO UPDATE SET ' + ', '.join(f'{key} = EXCLUDED.{key}' for key in columns)) \
+        if columns else ' ON CONFLICT(id) DO NOTHING'
+    return f'INSERT INTO public.users (id{insert_keys_str}) VALUES %s{update_str}', template
+
+
+@lru_cache(maxsize=None)
+def user_update_sql(columns: tuple[str, ...]) -> str:
+    """
+    Запрос изменения столбцов существующего пользователя: строка users не создается
+    """
+    set_str = ', '.join(f'{key} = %({key})s' for key in columns)
+    return f'UPDATE public.users SET {set_str} WHERE id = %(user_id)s'
+
+
+@lru_cache(maxsize=None)
+def users_bulk_update_sql(columns: tuple[str, ...]) -> tuple[str, str]:
+    """
+    Запрос и шаблон строки для изменения столбцов нескольких существующих пользователей одним запросом
+    через execute_values. Пользователи, которых нет в users (удаленные), пропускаются: строки не создаются
+    """
+    set_str = ', '.join(f'{key} = v.{key}' for key in columns)
+    template = '(%(user_id)s::bigint' + ''.join(f', %({key})s::{USER_COLUMN_TYPES[key]}' for key in columns) + ')'
+    return (f'UPDATE public.users u SET {set_str} FROM (VALUES %s) AS v(id, {", ".join(columns)}) '
+            f'WHERE u.id = v.id', template)
+
+
+# Оценки сессий сна нескольких пользователей (отложенная запись, db.write_behind). Оцененная запись задается
+# ключом (id, sleep_time), запомненным при оценке: к записи пачки может завершиться следующая сессия.
+# Непереданная оценка (NULL) не меняет сохраненное значение.
+SLEEP_RECORD_RATINGS_SQL = '''
+    UPDATE public.sleep_records r
+    SET mood = COALESCE(v.mood, r.mood),
+        sleep_quality = COALESCE(v.sleep_quality, r.sleep_quality)
+    FROM (VALUES %s) AS v(id, sleep_time, mood, sleep_quality)
+    WHERE r.id = v.id AND r.sleep_time = v.sleep_time
+'''
+SLEEP_RECORD_RATINGS_TEMPLATE = \
+    '(%(id)s::bigint, %(sleep_time)s::timestamptz, %(mood)s::integer, %(sleep_quality)s::integer)'
+
+# Оценки одной сессии сна: в SQLite нет VALUES с именами столбцов, поэтому отложенная запись
+# выполняет этот запрос построчно
+SLEEP_RECORD_RATING_SQL = '''
+    UPDATE public.sleep_records
+    SET mood = COALESCE(%(mood)s, mood),
+        sleep_quality = COALESCE(%(sleep_quality)s, sleep_quality)
+    WHERE id = %(id)s AND sleep_time = %(sleep_time)s
+'''
+
+# Дневные сводки сна (db.summary): строки сохраняются пачкой через execute_values, пересчитанная сводка заменяет прежнюю
+DAILY_SUMMARY_COLUMNS = ('user_id', 'sleep_date', 'total_seconds', 'sessions', 'avg_quality', 'avg_mood',
+                         'sleep_goal', 'goal_attainment')
+DAILY_SUMMARY_UPSERT_SQL = (
+    f'INSERT INTO public.daily_sleep_summary ({", ".join(DAILY_SUMMARY_COLUMNS)}) VALUES %s '
+    'ON CONFLICT(user_id, sleep_date) DO UPDATE SET '
+    + ', '.join(f'{key} = EXCLUDED.{key}' for key in DAILY_SUMMARY_COLUMNS[2:])
+)
+DAILY_SUMMARY_TEMPLATE = '(' + ', '.join(f'%({key})s' for key in DAILY_SUMMARY_COLUMNS) + ')'
+
+
+class Record(tuple):
+    """
+    Строка результата объявленного запроса (Query): кортеж значений без словаря на каждую строку.
+    Значения доступны как атрибуты (row.city_name) и, как у строк RealDictCursor, по имени столбца
+    (row['city_name'], row.get('city_name')); dict(row) возвращает словарь.
+    """
+    __slots__ = ()
+    _index: dict[str, int] = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self) -> tuple[str, ...]:
+        return self._fields
+
+
+_ALIAS_RE = re.compile(r'\s+AS\s+', re.IGNORECASE)
+
+
+def record_type(name: str, fields: tuple[str, ...]) -> type[Record]:
+    """
+    Тип записи с полями fields: namedtuple с доступом к значениям по имени столбца
+    """
+    base = namedtuple(name, fields, module=__name__)
+    return type(name, (base, Record), {'__slots__': (), '_index': {field: i for i, field in enumerate(fields)}})
+
+
+class Query:
+    """
+    Объявленный запрос чтения db.db: выбираемые столбцы и граница результата.
+    {columns} в тексте запроса заменяется списком столбцов, при limit в конец добавляется LIMIT,
+    строки читаются курсором без словарей (row_factory=False) и возвращаются записями record.
+
+    :param name: Имя запроса (имя prepared statement на сервере при param_types).
+    :param sql: Запрос с параметрами в формате psycopg2 и местом {columns} для списка столбцов.
+    :param columns: Выражения столбцов, например 'u.id' или 'open_sleep_time AS sleep_time';
+        поле записи называется псевдонимом или именем столбца без таблицы.
+    :param limit: 1 - одна запись или None, n - список не длиннее n записей,
+        None - выборка без ограничения (список).
+    :param param_types: Типы параметров, например {'user_id': 'bigint'}: запрос выполняется как PreparedStatement.
+    """
+    __slots__ = ('name', 'sql', 'columns', 'limit', 'record', 'statement')
+
+    def __init__(self, name: str, sql: str, columns: tuple[str, ...], limit: int | None = 1,
+                 param_types: dict[str, str] | None = None):
+        if limit is not None and limit < 1:
+            raise ValueError(f'limit запроса {name} должен быть положительным')
+        sql = sql.format(columns=', '.join(columns)).rstrip()
+        if limit is not None:
+            # LIMIT - отдельной строкой с отступом последней строки многострочного запроса
+            *head, last = sql.split('\n')
+            sql += f'\n{last[:len(last) - len(last.lstrip())]}LIMIT {limit}' if head else f' LIMIT {limit}'
+
+        self.name = name
+        self.sql = sql
+        self.columns = columns
+        self.limit = limit
+        self.record = record_type(''.join(part.title() for part in name.split('_')) + 'Row',
+                                  tuple(_ALIAS_RE.split(column)[-1].rsplit('.', 1)[-1] for column in columns))
+        self.statement = PreparedStatement(name, sql, param_types) if param_types is not None else None
+
+    def load(self, cursor):
+        """
+        Читает результат курсора: запись или None при limit=1, иначе список записей
+        """
+        if self.limit == 1:
+            row = cursor.fetchone()
+            return self.record._make(row) if row is not None else None
+        return list(map(self.record._make, cursor.fetchall()))
+
+    def __repr__(self):
+        return f'Query({self.name!r}, limit={self.limit})'
@@ -0,0 +1,139 @@
+import argparse
+import logging.config
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from configs import POSTGRES_SHARD_MAP
+from db.cache import invalidate_users
+from db.execute_query.execute_pg import get_pool
+from db.execute_query.sharding import bucket_of, load_shard_map, save_shard_map, set_shard_map, use_shard
+from db.partitions import ensure_sleep_record_partitions_between
+
+logger = logging.getLogger(__name__)
+
+# Таблицы с данными пользователя и столбец с его id; users переносится первой из-за внешних ключей
+USER_TABLES = (('users', 'id'), ('reminders', 'user_id'), ('sleep_records', 'user_id'), ('daily_sleep_summary', 'user_id'),
+               ('purge_queue', 'user_id'))
+
+# Столбцы, значения которых назначает шард-получатель: последовательности у каждого шарда свои,
+# а отметку открытой сессии ставит триггер при копировании самой сессии
+GENERATED_COLUMNS = {'users': {'open_sleep_time'}, 'sleep_records': {'id'}}
+
+
+def users_in_bucket(conn, bucket: int, buckets: int) -> list[int]:
+    """
+    id пользователей шарда, попадающих в корзину bucket
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM public.users')
+    return [row['id'] for row in cursor.fetchall() if bucket_of(row['id'], buckets) == bucket]
+
+
+def sleep_time_range(conn, user_ids: list[int]):
+    """
+    Начало самой ранней и самой поздней сессии сна пользователей user_ids (None, None - записей нет)
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT min(sleep_time) AS first, max(sleep_time) AS last FROM public.sleep_records '
+                   'WHERE user_id = ANY(%s)', (user_ids,))
+    row = cursor.fetchone()
+    return row['first'], row['last']
+
+
+def copy_users(source_conn, target_conn, user_ids: list[int]) -> int:
+    """
+    Копирует данные пользователей user_ids на шард-получатель одной транзакцией.
+    Прежние данные этих пользователей на получателе удаляются, поэтому прерванный перенос можно повторить.
+    :return: Количество скопированных строк.
+    """
+    source = source_conn.cursor()
+    target = target_conn.cursor()
+    try:
+        # reminders, sleep_records и daily_sleep_summary удаляются каскадно
+        target.execute('DELETE FROM public.users WHERE id = ANY(%s)', (user_ids,))
+        copied = 0
+        for table, key in USER_TABLES:
+            source.execute(f'SELECT * FROM public.{table} WHERE {key} = ANY(%s)', (user_ids,))
+            rows = source.fetchall()
+            if not rows:
+                continue
+            columns = [column for column in rows[0] if column not in GENERATED_COLUMNS.get(table, ())]
+            execute_values(target, f'INSERT INTO public.{table} ({", ".join(columns)}) VALUES %s',
+                           [tuple(row[column] for column in columns) for row in rows], page_size=len(rows))
+            copied += len(rows)
+        target_conn.commit()
+        source_conn.rollback()
+        return copied
+    except Exception:
+        target_conn.rollback()
+        source_conn.rollback()
+        raise
+
+
+def move_bucket(bucket: int, target: str, map_path: str = POSTGRES_SHARD_MAP, batch_size: int = 500) -> int:
+    """
+    Переносит пользователей корзины bucket на шард target.
+    Данные копируются пачками по batch_size пользователей, затем корзина закрепляется за target в карте шардов,
+    и только после этого данные удаляются с прежнего шарда.
+    Запускать, когда бот остановлен: другие процессы перечитывают карту шардов только при запуске.
+    :return: Количество перенесенных пользователей.
+    """
+    shard_map = load_shard_map(map_path)
+    if target not in shard_map.shards:
+        raise ValueError(f'Неизвестный шард {target}')
+    source = shard_map.assignments[bucket]
+    if source == target:
+        logger.info(f'Корзина {bucket} уже на шарде {target}')
+        return 0
+
+    set_shard_map(shard_map)
+    started = time.monotonic()
+    source_pool, target_pool = get_pool(source), get_pool(target)
+    source_conn, target_conn = source_pool.getconn(), target_pool.getconn()
+    broken = False
+    try:
+        user_ids = users_in_bucket(source_conn, bucket, shard_map.buckets)
+        first, last = sleep_time_range(source_conn, user_ids)
+        source_conn.rollback()
+        # У sleep_records нет секции по умолчанию: секции на всю историю корзины создаются на получателе
+        # до копирования, вне его транзакций (создание секции ждало бы блокировок удаления в copy_users)
+        if first is not None:
+            with use_shard(target):
+                if not ensure_sleep_record_partitions_between(first, last):
+                    raise RuntimeError(f'не удалось создать секции sleep_records на шарде {target}')
+        copied = 0
+        for offset in range(0, len(user_ids), batch_size):
+            copied += copy_users(source_conn, target_conn, user_ids[offset:offset + batch_size])
+            logger.info(f'Корзина {bucket}: скопировано {min(offset + batch_size, len(user_ids))}/{len(user_ids)} '
+                        f'пользователей ({copied} строк)')
+
+        shard_map.assignments[bucket] = target
+        save_shard_map(shard_map, map_path)
+        logger.info(f'Корзина {bucket} закреплена за шардом {target}')
+
+        cursor = source_conn.cursor()
+        cursor.execute('DELETE FROM public.users WHERE id = ANY(%s)', (user_ids,))
+        source_conn.commit()
+    except psycopg2.OperationalError:
+        broken = True
+        raise
+    finally:
+        source_pool.putconn(source_conn, close=broken)
+        target_pool.putconn(target_conn, close=broken)
+
+    invalidate_users(user_ids)
+    logger.info(f'Корзина {bucket} перенесена с шарда {source} на {target}: {len(user_ids)} пользователей '
+                f'за {time.monotonic() - started:.1f} с')
+    return len(user_ids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Перенос корзины пользователей на другой шард')
+    parser.add_argument('bucket', type=int, help='номер корзины')
+    parser.add_argument('target', help='имя шарда-получателя из карты шардов')
+    parser.add_argument('--map', default=POSTGRES_SHARD_MAP, help='путь к файлу карты шардов')
+    parser.add_argument('--batch-size', type=int, default=500, help='пользователей в одной транзакции')
+    args = parser.parse_args()
+    move_bucket(args.bucket, args.target, args.map, args.batch_size)
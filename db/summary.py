@@ -0,0 +1,212 @@
+import argparse
+import logging.config
+import time as time_module
+from datetime import date, datetime, time, timedelta
+
+from pytz import timezone
+
+from db.execute_query import execute_query_pg, execute_values_pg, shard_names, use_shard, current_session
+from db.queries import DAILY_SUMMARY_UPSERT_SQL, DAILY_SUMMARY_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+USER_SUMMARY_SETTINGS_SQL = 'SELECT time_zone, sleep_goal FROM public.users WHERE id = %(user_id)s'
+# Начало последней завершенной сессии сна (дата сводки по умолчанию)
+LAST_SLEEP_TIME_SQL = '''
+    SELECT sleep_time FROM public.sleep_records
+    WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
+    ORDER BY sleep_time DESC
+    LIMIT 1
+'''
+DAY_SUMMARY_DELETE_SQL = '''
+    DELETE FROM public.daily_sleep_summary
+    WHERE user_id = %(user_id)s AND sleep_date = %(sleep_date)s
+'''
+
+# Завершенные сессии сна за местные сутки пользователя (границы суток переданы в UTC-моментах)
+DAY_RECORDS_SQL = '''
+    SELECT sleep_time, wake_time, sleep_quality, mood FROM public.sleep_records
+    WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
+    AND sleep_time >= %(start)s AND sleep_time < %(end)s
+'''
+
+
+def summarize(user_id: int, records: list[dict], time_zone: str | None, sleep_goal: float | None) -> list[dict]:
+    """
+    Сводки по местным датам начала сна: суммарная продолжительность, количество сессий,
+    средние оценки качества и настроения, доля выполнения цели сна (1.0 - цель достигнута)
+    """
+    tz = timezone(time_zone or 'UTC')
+    days: dict[date, dict] = {}
+    for record in records:
+        day = days.setdefault(record['sleep_time'].astimezone(tz).date(),
+                              {'seconds': 0.0, 'sessions': 0, 'quality': [], 'mood': []})
+        day['seconds'] += (record['wake_time'] - record['sleep_time']).total_seconds()
+        day['sessions'] += 1
+        if record['sleep_quality'] is not None:
+            day['quality'].append(record['sleep_quality'])
+        if record['mood'] is not None:
+            day['mood'].append(record['mood'])
+
+    return [{
+        'user_id': user_id,
+        'sleep_date': sleep_date,
+        'total_seconds': int(day['seconds']),
+        'sessions': day['sessions'],
+        'avg_quality': sum(day['quality']) / len(day['quality']) if day['quality'] else None,
+        'avg_mood': sum(day['mood']) / len(day['mood']) if day['mood'] else None,
+        'sleep_goal': sleep_goal,
+        'goal_attainment': round(day['seconds'] / 3600 / sleep_goal, 3) if sleep_goal else None,
+    } for sleep_date, day in sorted(days.items())]
+
+
+def day_bounds(sleep_date: date, tz) -> tuple[datetime, datetime]:
+    """
+    Начало и конец местных суток sleep_date (с учетом перехода на летнее время)
+    """
+    return (tz.localize(datetime.combine(sleep_date, time.min)),
+            tz.localize(datetime.combine(sleep_date + timedelta(days=1), time.min)))
+
+
+def refresh_daily_summary(user_id: int, sleep_time: datetime = None) -> dict | None:
+    """
+    Пересчитывает сводку пользователя за местную дату sleep_time (по умолчанию - последней завершенной сессии).
+    Читаются только сессии этих суток. Выполняется на шарде текущего вызова.
+    Ошибка записывается в лог и не прерывает вызывающую запись: сводку восстановит backfill_daily_summary.
+    Внутри единицы работы (unit_of_work) пересчет откладывается до фиксации ее транзакции:
+    ошибка запроса сводки иначе отменила бы саму запись.
+    :return: Строка сводки или None, если за дату нет завершенных сессий, произошла ошибка или пересчет отложен.
+    """
+    session = current_session()
+    if session is not None:
+        def refresh():
+            with use_shard(session.shard):
+                refresh_daily_summary(user_id, sleep_time)
+
+        session.on_commit(refresh)
+        return None
+
+    try:
+        cursor = execute_query_pg(USER_SUMMARY_SETTINGS_SQL, {'user_id': user_id})
+        user = cursor.fetchone() if cursor else None
+        if user is None:
+            return None
+        if sleep_time is None:
+            cursor = execute_query_pg(LAST_SLEEP_TIME_SQL, {'user_id': user_id})
+            last = cursor.fetchone() if cursor else None
+            if last is None:
+                return None
+            sleep_time = last['sleep_time']
+
+        tz = timezone(user['time_zone'] or 'UTC')
+        sleep_date = sleep_time.astimezone(tz).date()
+        start, end = day_bounds(sleep_date, tz)
+        cursor = execute_query_pg(DAY_RECORDS_SQL, {'user_id': user_id, 'start': start, 'end': end})
+        if cursor is None:
+            return None
+        rows = summarize(user_id, cursor.fetchall(), user['time_zone'], user['sleep_goal'])
+        if not rows:
+            execute_query_pg(DAY_SUMMARY_DELETE_SQL, {'user_id': user_id, 'sleep_date': sleep_date})
+            return None
+        execute_values_pg(DAILY_SUMMARY_UPSERT_SQL, rows, DAILY_SUMMARY_TEMPLATE)
+        return rows[0]
+    except Exception as e:
+        logger.error(f'Ошибка пересчета дневной сводки сна пользователя {user_id}: {e}', exc_info=True)
+        return None
+
+
+def rebuild_daily_summary(user_id: int) -> int | None:
+    """
+    Строит сводки пользователя заново по всей его истории (после загрузки истории из файла).
+    Выполняется на шарде текущего вызова.
+    :return: Количество строк сводки или None при ошибке.
+    """
+    cursor = execute_query_pg(USER_SUMMARY_SETTINGS_SQL, {'user_id': user_id})
+    user = cursor.fetchone() if cursor else None
+    if user is None:
+        return None
+    cursor = execute_query_pg('''
+        SELECT sleep_time, wake_time, sleep_quality, mood FROM public.sleep_records
+        WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
+    ''', {'user_id': user_id})
+    if cursor is None:
+        return None
+    rows = summarize(user_id, cursor.fetchall(), user['time_zone'], user['sleep_goal'])
+    if execute_query_pg('DELETE FROM public.daily_sleep_summary WHERE user_id = %(user_id)s',
+                        {'user_id': user_id}) is None:
+        return None
+    if rows and execute_values_pg(DAILY_SUMMARY_UPSERT_SQL, rows, DAILY_SUMMARY_TEMPLATE) is None:
+        return None
+    return len(rows)
+
+
+def _backfill_shard(batch_size: int) -> tuple[int, int]:
+    users_done = rows_done = 0
+    after = -2 ** 63
+    while True:
+        cursor = execute_query_pg('''
+            SELECT id, time_zone, sleep_goal FROM public.users
+            WHERE id > %(after)s
+            ORDER BY id
+            LIMIT %(limit)s
+        ''', {'after': after, 'limit': batch_size})
+        if cursor is None:
+            raise RuntimeError('не удалось прочитать пользователей')
+        users = cursor.fetchall()
+        if not users:
+            return users_done, rows_done
+
+        # Сессии всей пачки пользователей читаются одним запросом по диапазону id
+        params = {'after': after, 'last': users[-1]['id']}
+        cursor = execute_query_pg('''
+            SELECT user_id, sleep_time, wake_time, sleep_quality, mood FROM public.sleep_records
+            WHERE user_id > %(after)s AND user_id <= %(last)s AND wake_time IS NOT NULL
+        ''', params)
+        if cursor is None:
+            raise RuntimeError('не удалось прочитать записи о снах')
+        records: dict[int, list[dict]] = {}
+        for record in cursor.fetchall():
+            records.setdefault(record['user_id'], []).append(record)
+
+        rows = [row for user in users
+                for row in summarize(user['id'], records.get(user['id'], []), user['time_zone'], user['sleep_goal'])]
+        execute_query_pg('''
+            DELETE FROM public.daily_sleep_summary
+            WHERE user_id > %(after)s AND user_id <= %(last)s
+        ''', params)
+        if rows:
+            execute_values_pg(DAILY_SUMMARY_UPSERT_SQL, rows, DAILY_SUMMARY_TEMPLATE)
+
+        users_done += len(users)
+        rows_done += len(rows)
+        after = users[-1]['id']
+
+
+def backfill_daily_summary(batch_size: int = 500) -> int | None:
+    """
+    Строит daily_sleep_summary заново по всей истории sleep_records на каждом шарде.
+    Пользователи обрабатываются пачками по batch_size; сводки пачки заменяются целиком.
+    :return: Количество строк сводки или None при ошибке.
+    """
+    started = time_module.monotonic()
+    total_users = total_rows = 0
+    for shard in shard_names():
+        with use_shard(shard):
+            try:
+                users, rows = _backfill_shard(batch_size)
+            except Exception as e:
+                logger.error(f'Ошибка построения дневных сводок сна{f" на шарде {shard}" if shard else ""}: {e}',
+                             exc_info=True)
+                return None
+        total_users += users
+        total_rows += rows
+    logger.info(f'Дневные сводки сна построены: {total_users} пользователей, {total_rows} строк '
+                f'за {time_module.monotonic() - started:.1f} с')
+    return total_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Построение дневных сводок сна по существующей истории')
+    parser.add_argument('--batch-size', type=int, default=500, help='пользователей в одной пачке')
+    args = parser.parse_args()
+    backfill_daily_summary(args.batch_size)
@@ -0,0 +1,344 @@
+import logging.config
+import threading
+import time
+from functools import wraps
+
+import sqlite3
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from configs import WRITE_BEHIND_ENABLED, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_ITEMS, DATABASE_BACKEND
+from db.execute_query.execute_pg import get_pool
+from db.execute_query.execute_sqlite import transaction_sl, translate_sl, values_query_sl
+from db.execute_query.pool import PoolError
+from db.execute_query.session import current_session
+from db.execute_query.sharding import routing_user_id, group_by_shard, use_shard
+from db.metrics import record_call
+from db.queries import USER_COLUMNS, users_bulk_upsert_sql, users_bulk_update_sql, user_update_sql, \
+    SLEEP_RECORD_RATINGS_SQL, SLEEP_RECORD_RATINGS_TEMPLATE, SLEEP_RECORD_RATING_SQL
+from db.summary import refresh_daily_summary
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, запись в которые можно отложить: USERS - сохранение пользователя (вставка или изменение),
+# USER_UPDATES - изменение столбцов существующего пользователя (UPDATE, строка users не создается),
+# SLEEP_RECORDS - оценки сессии сна; ключ записи в буфере - (SLEEP_RECORDS, id, sleep_time) оцененной сессии
+USERS = 'users'
+USER_UPDATES = 'user_updates'
+SLEEP_RECORDS = 'sleep_records'
+
+
+def _merge(entry: dict, table, fields: dict):
+    """
+    Добавляет изменения fields таблицы table к отложенным изменениям пользователя entry так,
+    чтобы результат записи пачки совпадал с последовательной записью
+    """
+    if table == USER_UPDATES and USERS in entry:
+        # Строку создаст отложенное сохранение пользователя: изменения записываются вместе с ним
+        table = USERS
+    elif table == USERS and USER_UPDATES in entry:
+        # Сохранение пользователя записывается раньше изменений: более ранние изменения тех же столбцов отбрасываются
+        updates = entry[USER_UPDATES]
+        for key in fields:
+            updates.pop(key, None)
+        if not updates:
+            del entry[USER_UPDATES]
+    entry.setdefault(table, {}).update(fields)
+
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенной записи: изменения пользователей объединяются (более поздние значения важнее)
+    и записываются пачкой в одной транзакции каждые flush_interval_ms или при накоплении max_items пользователей.
+
+    Чтение в этом же процессе видит свои записи: db.db перед обращением к базе дописывает отложенные
+    изменения пользователя (flush_pending).
+
+    :param flush_interval_ms: Максимальная задержка записи, мс.
+    :param max_items: Количество пользователей с отложенными изменениями, при котором запись начинается сразу.
+    """
+
+    def __init__(self, flush_interval_ms: float = 200, max_items: int = 500):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_items = max_items
+
+        # user_id -> таблица (ключ записи) -> столбец -> значение
+        self._pending: dict[int, dict] = {}
+        self._in_flight: frozenset[int] = frozenset()
+        self._cond = threading.Condition()
+        # Записи пачек идут по одной: чтение, дождавшееся блокировки, видит результат предыдущей записи
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._counters = {
+            'writes': 0, 'coalesced': 0, 'flushes': 0, 'flushed_users': 0,
+            'errors': 0, 'dropped': 0, 'max_batch': 0, 'last_flush_ms': 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def put(self, user_id: int, table, fields: dict) -> bool:
+        """
+        Откладывает запись столбцов fields таблицы table (USERS, USER_UPDATES
+        или (SLEEP_RECORDS, id, sleep_time)) для пользователя user_id.
+        :return: False, если буфер уже закрыт и запись нужно выполнить сразу.
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            entry = self._pending.get(user_id)
+            if entry is None:
+                entry = self._pending[user_id] = {}
+            else:
+                self._counters['coalesced'] += 1
+            _merge(entry, table, fields)
+            self._counters['writes'] += 1
+            if len(self._pending) >= self.max_items:
+                self._cond.notify()
+        return True
+
+    def has_pending(self, user_id: int = None) -> bool:
+        """
+        Есть ли незаписанные изменения пользователя user_id (или любого пользователя).
+        Проверка без блокировки: вызывается перед каждым обращением к базе.
+        """
+        if user_id is None:
+            return bool(self._pending or self._in_flight)
+        return user_id in self._pending or user_id in self._in_flight
+
+    def flush(self, user_id: int = None) -> int:
+        """
+        Записывает отложенные изменения пользователя user_id (или всех пользователей)
+        :return: Количество записанных пользователей.
+        """
+        with self._flush_lock:
+            with self._cond:
+                if user_id is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    entry = self._pending.pop(user_id, None)
+                    batch = {user_id: entry} if entry is not None else {}
+                self._in_flight = frozenset(batch)
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            error = False
+            try:
+                self._write(batch)
+                return len(batch)
+            except (psycopg2.OperationalError, PoolError, sqlite3.OperationalError) as e:
+                # База недоступна: изменения возвращаются в буфер, более новые значения важнее
+                error = True
+                logger.error(f'Ошибка записи отложенных изменений ({len(batch)} пользователей), повторим позже: {e}')
+                self._requeue(batch)
+                return 0
+            except Exception as e:
+                # Ошибка в данных не исправится повтором
+                error = True
+                logger.error(f'Отложенные изменения {len(batch)} пользователей отброшены: {e}', exc_info=True)
+                with self._cond:
+                    self._counters['dropped'] += len(batch)
+                return 0
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                with self._cond:
+                    self._in_flight = frozenset()
+                    self._counters['flushes'] += 1
+                    self._counters['errors'] += error
+                    self._counters['flushed_users'] += 0 if error else len(batch)
+                    self._counters['max_batch'] = max(self._counters['max_batch'], len(batch))
+                    self._counters['last_flush_ms'] = round(elapsed_ms, 3)
+                record_call('write_behind.flush', elapsed_ms, len(batch), error)
+
+    @classmethod
+    def _write(cls, batch: dict[int, dict]):
+        """
+        Записывает пачку: на каждом шарде одной транзакцией. Повтор уже записанной части безопасен,
+        поэтому при ошибке на одном из шардов пачка возвращается в буфер целиком.
+        """
+        for shard, user_ids in group_by_shard(batch).items():
+            cls._write_shard(shard, {user_id: batch[user_id] for user_id in user_ids})
+            # Оценки сна входят в дневные сводки (db.summary) дат оцененных сессий
+            with use_shard(shard):
+                for user_id in user_ids:
+                    for table in batch[user_id]:
+                        if isinstance(table, tuple):
+                            refresh_daily_summary(user_id, table[2])
+
+    @staticmethod
+    def _write_shard(shard: str | None, batch: dict[int, dict]):
+        """
+        Записывает пачку одной транзакцией: пользователи с одинаковым набором столбцов - одним запросом.
+        Сохранения пользователей записываются раньше изменений столбцов существующих пользователей
+        """
+        users: dict[tuple[str, ...], list[dict]] = {}
+        updates: dict[tuple[str, ...], list[dict]] = {}
+        ratings = []
+        for user_id, entry in batch.items():
+            for table, fields in entry.items():
+                if isinstance(table, tuple):
+                    _, record_id, sleep_time = table
+                    ratings.append({'id': record_id, 'sleep_time': sleep_time, 'mood': fields.get('mood'),
+                                    'sleep_quality': fields.get('sleep_quality')})
+                    continue
+                columns = tuple(key for key in USER_COLUMNS if key in fields)
+                (users if table == USERS else updates).setdefault(columns, []).append({'user_id': user_id, **fields})
+
+        if DATABASE_BACKEND == 'sqlite':
+            with transaction_sl() as conn:
+                for columns, rows in users.items():
+                    query, template = users_bulk_upsert_sql(columns)
+                    conn.executemany(values_query_sl(query, template, len(columns) + 1), rows)
+                for columns, rows in updates.items():
+                    conn.executemany(translate_sl(user_update_sql(columns)), rows)
+                if ratings:
+                    conn.executemany(translate_sl(SLEEP_RECORD_RATING_SQL), ratings)
+            return
+
+        pool = get_pool(shard)
+        conn = pool.getconn()
+        broken = False
+        try:
+            cursor = conn.cursor()
+            for columns, rows in users.items():
+                query, template = users_bulk_upsert_sql(columns)
+                execute_values(cursor, query, rows, template, page_size=len(rows))
+            for columns, rows in updates.items():
+                query, template = users_bulk_update_sql(columns)
+                execute_values(cursor, query, rows, template, page_size=len(rows))
+            if ratings:
+                execute_values(cursor, SLEEP_RECORD_RATINGS_SQL, ratings, SLEEP_RECORD_RATINGS_TEMPLATE,
+                               page_size=len(ratings))
+            conn.commit()
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            pool.putconn(conn, close=broken)
+
+    def _requeue(self, batch: dict[int, dict]):
+        with self._cond:
+            for user_id, entry in batch.items():
+                newer = self._pending.get(user_id, {})
+                for table, fields in newer.items():
+                    _merge(entry, table, fields)
+                self._pending[user_id] = entry
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.max_items:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f'Ошибка фоновой записи отложенных изменений: {e}', exc_info=True)
+
+    def close(self):
+        """
+        Останавливает фоновую запись и записывает все отложенные изменения
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+        if self._pending:
+            logger.error(f'При остановке не записаны изменения {len(self._pending)} пользователей')
+
+    def stats(self) -> dict:
+        """
+        Возвращает размер буфера и счетчики записи (размер пачки, время последней записи)
+        """
+        with self._cond:
+            return dict(self._counters, pending=len(self._pending), closed=self._closed)
+
+
+_buffer: WriteBehindBuffer | None = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_buffer() -> WriteBehindBuffer | None:
+    """
+    Возвращает буфер отложенной записи или None, если он выключен (WRITE_BEHIND_ENABLED)
+    """
+    global _buffer
+    if _buffer is None and WRITE_BEHIND_ENABLED:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer(WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_ITEMS)
+                logger.info('Включена отложенная запись изменений пользователей')
+    return _buffer
+
+
+def set_write_buffer(buffer: WriteBehindBuffer | None):
+    """
+    Подменяет буфер отложенной записи (None - вернуться к настройкам из конфигурации); прежний буфер закрывается
+    """
+    global _buffer
+    with _buffer_lock:
+        previous, _buffer = _buffer, buffer
+    if previous is not None and previous is not buffer:
+        previous.close()
+
+
+def close_write_buffer():
+    """
+    Записывает все отложенные изменения и останавливает буфер (при остановке бота)
+    """
+    set_write_buffer(None)
+
+
+def get_write_buffer_stats() -> dict | None:
+    """
+    Возвращает статистику буфера отложенной записи или None, если он выключен
+    """
+    return _buffer.stats() if _buffer is not None else None
+
+
+def flush_pending(args: tuple):
+    """
+    Перед обращением к базе дописывает отложенные изменения пользователя args[0],
+    а для запросов не по одному пользователю - изменения всех пользователей
+    """
+    buffer = _buffer
+    if buffer is None or not buffer.has_pending():
+        return
+    user_id = routing_user_id(args)
+    if user_id is None or buffer.has_pending(user_id):
+        buffer.flush(user_id)
+
+
+def write_behind(table: str, fields, row=None):
+    """
+    Откладывает запись функции func(user_id, ...) в буфер, если он включен.
+    :param table: USERS, USER_UPDATES или SLEEP_RECORDS.
+    :param fields: Функция с той же сигнатурой, что и func, возвращающая записываемые столбцы;
+        столбцы со значением None не записываются.
+    :param row: Для SLEEP_RECORDS - функция row(user_id), возвращающая ключ (id, sleep_time) изменяемой записи
+        в момент вызова func; None вместо ключа - запись выполняется сразу.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(user_id, *args, **kwargs):
+            buffer = get_write_buffer()
+            # В единице работы запись выполняется сразу, в ее транзакции
+            if buffer is not None and current_session() is None:
+                entry_table = table
+                if row is not None:
+                    target = row(user_id)
+                    if target is None:
+                        return func(user_id, *args, **kwargs)
+                    entry_table = (table, *target)
+                values = {key: value for key, value in fields(user_id, *args, **kwargs).items() if value is not None}
+                if buffer.put(user_id, entry_table, values):
+                    return None
+            return func(user_id, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,3 @@
+from .offload import run_io, run_db, run_cpu, get_executor_stats, shutdown_executors
+
+__all__ = ['run_io', 'run_db', 'run_cpu', 'get_executor_stats', 'shutdown_executors']
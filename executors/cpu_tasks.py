@@ -0,0 +1,47 @@
+import io
+from functools import lru_cache
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+from matplotlib.figure import Figure  # noqa: E402
+from timezonefinder import TimezoneFinder  # noqa: E402
+
+
+@lru_cache(maxsize=1)
+def get_timezone_finder() -> TimezoneFinder:
+    """
+    Возвращает TimezoneFinder, созданный один раз на процесс (создание читает файлы данных)
+    """
+    return TimezoneFinder(in_memory=True)
+
+
+def timezone_at(lat: float, lng: float):
+    """
+    Определение часового пояса по координатам.
+    :param lat: float
+    :param lng: float
+    :return: str | None
+    """
+    return get_timezone_finder().timezone_at(lat=lat, lng=lng)
+
+
+def render_sleep_chart(dates: list, durations: list[float]) -> bytes:
+    """
+    Построение графика сна в PNG.
+    Используется Figure без pyplot, поэтому функция не зависит от глобального состояния matplotlib.
+    :param dates: Даты записей сна
+    :param durations: Продолжительность сна в часах
+    :return: bytes
+    """
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.plot(dates, durations, marker='o')
+    ax.set_xlabel('Дата')
+    ax.set_ylabel('Продолжительность сна (часы)')
+    ax.set_title('Ваш сон за последние 7 дней')
+    ax.grid(True)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
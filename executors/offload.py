@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import functools
+import logging.config
+import multiprocessing
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from configs import OFFLOAD_IO_WORKERS, OFFLOAD_DB_WORKERS, OFFLOAD_CPU_WORKERS, OFFLOAD_MAX_QUEUE
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+    """
+    Исполнитель блокирующих задач с ограниченной очередью и метриками загрузки.
+
+    Одновременно в исполнителе находится не более max_workers + max_queue задач,
+    остальные вызывающие корутины ждут освобождения места, не блокируя цикл событий.
+
+    :param name: Имя исполнителя для логов и метрик.
+    :param max_workers: Количество потоков или процессов.
+    :param max_queue: Максимальное количество задач, ожидающих свободного исполнителя.
+    :param processes: Использовать пул процессов вместо пула потоков.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, processes: bool = False):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.processes = processes
+
+        self._executor: Executor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._in_flight = 0
+        self._counters = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'waited': 0,
+            'max_queue_depth': 0,
+            'busy_seconds': 0.0,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes:
+                # spawn: дочерние процессы не наследуют потоки и соединения родителя
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix=f'offload-{self.name}')
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers + self.max_queue)
+        return self._semaphore
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Выполняет func(*args, **kwargs) в исполнителе и возвращает результат
+        """
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            self._counters['waited'] += 1
+            logger.warning(f'Исполнитель {self.name} перегружен, задача {func.__name__} ожидает места в очереди')
+
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            if self.processes:
+                call = functools.partial(func, *args, **kwargs)
+            else:
+                # Контекст (contextvars) переносится в поток вместе с задачей
+                call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+
+            self._counters['submitted'] += 1
+            self._in_flight += 1
+            self._counters['max_queue_depth'] = max(self._counters['max_queue_depth'], self.queue_depth)
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self._get_executor(), call)
+                self._counters['completed'] += 1
+                return result
+            except Exception:
+                self._counters['failed'] += 1
+                raise
+            finally:
+                self._in_flight -= 1
+                self._counters['busy_seconds'] += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        """
+        Возвращает глубину очереди, загрузку и накопленные счетчики исполнителя
+        """
+        busy = min(self._in_flight, self.max_workers)
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'in_flight': self._in_flight,
+            'busy': busy,
+            'queue_depth': self.queue_depth,
+            'saturation': busy / self.max_workers,
+            **self._counters,
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+
+io_executor = BoundedExecutor('io', OFFLOAD_IO_WORKERS, OFFLOAD_MAX_QUEUE)
+db_executor = BoundedExecutor('db', OFFLOAD_DB_WORKERS, OFFLOAD_MAX_QUEUE)
+cpu_executor = BoundedExecutor('cpu', OFFLOAD_CPU_WORKERS, OFFLOAD_MAX_QUEUE, processes=True)
+
+
+async def run_io(func, *args, **kwargs):
+    """
+    Выполняет сетевой вызов (HTTP-запросы к внешним API) в пуле потоков ввода-вывода
+    """
+    return await io_executor.run(func, *args, **kwargs)
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполняет синхронный вызов базы данных в пуле потоков для БД
+    """
+    return await db_executor.run(func, *args, **kwargs)
+
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Выполняет вычислительную задачу в пуле процессов.
+    Функция и аргументы должны сериализоваться pickle.
+    """
+    return await cpu_executor.run(func, *args, **kwargs)
+
+
+def get_executor_stats() -> dict:
+    """
+    Возвращает метрики всех исполнителей
+    """
+    return {executor.name: executor.stats() for executor in (io_executor, db_executor, cpu_executor)}
+
+
+def shutdown_executors(wait: bool = True):
+    """
+    Останавливает все исполнители (при остановке бота)
+    """
+    for executor in (io_executor, db_executor, cpu_executor):
+        executor.shutdown(wait=wait)
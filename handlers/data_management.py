@@ -1,48 +1,61 @@
-import csv
 import logging.config
-import os
 
 import psycopg2
 from pyrogram import Client
 from pyrogram.types import Message, User, ForceReply
 
-from db.db import delete_all_data_user_db, get_all_sleep_records
-from handlers.keyboards import data_management_keyboard, get_back_keyboard
+from db.db import delete_all_data_user_db
+from configs import IMPORT_MAX_FILE_SIZE
+from db.bulk_import import import_sleep_records
+from db.export import export_sleep_records, CSV
+from executors import run_db
+from handlers.keyboards import data_management_keyboard, export_format_keyboard, get_back_keyboard
 from handlers.states import UserStates, user_states
 from handlers.user_valid import user_valid
 
 logger = logging.getLogger(__name__)
 
 
-async def export_data(client: Client, message: Message, user: User = None):
+async def show_export_formats_menu(client: Client, user_id: int):
+    msg = await client.send_message(
+        chat_id=user_id,
+        text="Выберите формат файла:\n"
+             "CSV - для таблиц, JSON - по записи в строке, Parquet - самый компактный, для анализа данных.",
+        reply_markup=export_format_keyboard()
+    )
+
+    return msg.id
+
+
+async def export_data(client: Client, message: Message, user: User = None, export_format: str = CSV):
     is_user, valid_id = await user_valid(message, user)
     if is_user == 'False':
         return valid_id
 
     user_id = valid_id
     try:
-        records = get_all_sleep_records(user_id)
-        if records:
-            # Создание CSV файла
-            fieldnames = records[0].keys()
-            with open(f'sleep_data_{user_id}.csv', 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows([dict(record) for record in records])
-            # Отправка файла пользователю
-            await client.send_document(chat_id=user_id, document=f'sleep_data_{user_id}.csv')
-            os.remove(f'sleep_data_{user_id}.csv')  # Удаление файла после отправки
-            await message.reply_text(
-                "Данные о сне получены.",
-                reply_markup=get_back_keyboard()
-            )
-            logger.info(f"Пользователь {user_id} экспортировал свои данные")
-        else:
+        export = await run_db(export_sleep_records, user_id, export_format)
+        if export is None:
             msg = await message.reply_text(
-                "У вас нет данных для экспорта.",
+                "Произошла ошибка при обращении к базе данных.",
                 reply_markup=get_back_keyboard()
             )
             return msg.id
+        with export:
+            if export.rowcount:
+                # Файл отправляется из памяти (или временного каталога системы), без записи в рабочий каталог
+                await client.send_document(chat_id=user_id, document=export.file, file_name=export.file_name)
+                await message.reply_text(
+                    "Данные о сне получены.",
+                    reply_markup=get_back_keyboard()
+                )
+                logger.info(f"Пользователь {user_id} экспортировал свои данные в {export_format} ({export.rowcount} записей)")
+            else:
+                msg = await message.reply_text(
+                    "У вас нет данных для экспорта.",
+                    reply_markup=get_back_keyboard()
+                )
+                return msg.id
     except psycopg2.OperationalError as e:
         logger.error(f"Ошибка при обращение к базе данных для пользователя {user_id}: {e}")
         msg = await message.reply_text(
@@ -59,6 +72,78 @@ async def export_data(client: Client, message: Message, user: User = None):
         return msg.id
 
 
+async def request_import(client: Client, message: Message, user: User = None):
+    is_user, valid_id = await user_valid(message, user)
+    if is_user == 'False':
+        return valid_id
+
+    user_id = valid_id
+
+    user_states[user_id] = UserStates.STATE_WAITING_IMPORT_FILE
+    msg = await message.reply_text(
+        "Отправьте CSV-файл с историей сна (можно сжатый gzip, как при сохранении данных).\n"
+        "Обязательные столбцы: sleep_time, wake_time; необязательные: sleep_quality, mood (от 1 до 5).\n"
+        "Время - в формате ГГГГ-ММ-ДД ЧЧ:ММ; если часовой пояс не указан, используется ваш.",
+        reply_markup=get_back_keyboard()
+    )
+    return msg.id
+
+
+async def import_data(client: Client, message: Message, user: User = None):
+    is_user, valid_id = await user_valid(message, user)
+    if is_user == 'False':
+        return valid_id
+
+    user_id = valid_id
+    if user_states.get(user_id) != UserStates.STATE_WAITING_IMPORT_FILE:
+        logger.info(f"Пользователь {user_id} отправил файл без запроса загрузки")
+        return
+
+    document = message.document
+    if not (document.file_name or '').lower().endswith(('.csv', '.csv.gz')):
+        msg = await message.reply_text(
+            "Нужен файл с расширением .csv или .csv.gz.",
+            reply_markup=get_back_keyboard()
+        )
+        return msg.id
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        msg = await message.reply_text(
+            f"Файл слишком большой: не более {IMPORT_MAX_FILE_SIZE // (1024 * 1024)} МБ.",
+            reply_markup=get_back_keyboard()
+        )
+        return msg.id
+
+    user_states[user_id] = UserStates.STATE_NONE
+    try:
+        # Файл загружается в память, без записи в рабочий каталог
+        file = await client.download_media(message, in_memory=True)
+        result = await run_db(import_sleep_records, user_id, file)
+        if result is None:
+            msg = await message.reply_text(
+                "Произошла ошибка при загрузке истории. Уже загруженные записи сохранены, "
+                "повторная загрузка того же файла их не продублирует.",
+                reply_markup=get_back_keyboard()
+            )
+            return msg.id
+
+        text = (f"📥 Загрузка завершена за {result.elapsed:.1f} с ({result.rate:.0f} строк/с).\n"
+                f"Принято записей: {result.accepted}\n"
+                f"Отклонено: {result.rejected}\n"
+                f"Уже были сохранены: {result.duplicates}")
+        if result.errors:
+            text += "\n\nОшибки:\n" + "\n".join(result.errors)
+        msg = await message.reply_text(text, reply_markup=get_back_keyboard())
+        logger.info(f"Пользователь {user_id} загрузил историю сна ({result.accepted} записей)")
+        return msg.id
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке истории сна пользователя {user_id}: {e}")
+        msg = await message.reply_text(
+            "Произошла ошибка при загрузке истории.",
+            reply_markup=get_back_keyboard()
+        )
+        return msg.id
+
+
 async def delete_my_data(client: Client, message: Message, user: User = None):
     is_user, valid_id = await user_valid(message, user)
     if is_user == 'False':
@@ -95,10 +180,13 @@ async def confirm_delete(client: Client, message: Message, user: User = None):
 
         if message.text.strip().lower() == 'да':
             try:
-                delete_all_data_user_db(user_id)
+                deleted = await run_db(delete_all_data_user_db, user_id)
+                if deleted is None:
+                    raise RuntimeError('данные не удалены')
                 user_states[user_id] = UserStates.STATE_NONE
                 await message.reply_text(
-                    "Все ваши данные были удалены.",
+                    "Все ваши данные были удалены." if deleted else
+                    "Ваши данные скрыты и будут полностью удалены в течение нескольких минут.",
                     reply_markup=get_back_keyboard()
                 )
                 logger.info(f"Пользователь {user_id} удалил все свои данные")
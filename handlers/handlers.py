@@ -6,7 +6,6 @@ import random
 from datetime import datetime
 from uuid import uuid4
 
-from matplotlib import pyplot as plt
 from pyrogram import Client, filters
 from pyrogram.types import Message, User, CallbackQuery, \
     InputTextMessageContent, InlineQueryResultArticle, \
@@ -14,11 +13,14 @@ from pyrogram.types import Message, User, CallbackQuery, \
 from pytz import timezone
 
 from db import (
-    get_has_provided_location, get_sleep_records_per_week,
-    save_wake_time_records_db, save_sleep_time_records_db, get_wake_time_null
+    get_user_profile, get_daily_sleep_summary,
+    start_sleep_session_db, finish_sleep_session_db
 )
-from db.db import get_user_time_zone_db
-from handlers.data_management import delete_my_data, export_data, show_user_data_management_menu
+from db.export import EXPORT_FORMATS, CSV
+from executors import run_db, run_cpu
+from executors.cpu_tasks import render_sleep_chart
+from handlers.data_management import delete_my_data, export_data, show_user_data_management_menu, \
+    show_export_formats_menu, request_import, import_data
 from handlers.keyboards import (
     get_initial_keyboard, get_back_keyboard, main_menu_keyboard, get_request_keyboard
 )
@@ -31,7 +33,7 @@ from handlers.sleep_character.user_sleep_goal import set_sleep_goal
 from handlers.sleep_character.user_wake_time import set_wake_time
 from handlers.states import UserStates, user_states
 from handlers.user_valid import add_new_user, get_user_stats, is_valid_user, user_state_navigate, user_valid, \
-    get_local_time, get_user_time_zone, process_user
+    get_local_time, save_sleep_event_now, PURGE_IN_PROGRESS_TEXT
 from handlers.weather_advice import get_weather_advice
 
 logger = logging.getLogger(__name__)
@@ -185,10 +187,25 @@ def setup_handlers(app: Client):
         if message_id:
             message_ids.append(message_id)
 
-    # Команда /export_data
+    # Команда /export_data [csv|ndjson|parquet]
     @app.on_message(filters.command("export_data"))
     async def export_data_handler(client: Client, message: Message, user: User = None):
-        message_id = await export_data(client, message, user)
+        export_format = message.command[1].lower() if len(message.command) > 1 else CSV
+        message_id = await export_data(client, message, user, export_format if export_format in EXPORT_FORMATS else CSV)
+        if message_id:
+            message_ids.append(message_id)
+
+    # Команда /import_data
+    @app.on_message(filters.command("import_data"))
+    async def import_data_handler(client: Client, message: Message, user: User = None):
+        message_id = await request_import(client, message, user)
+        if message_id:
+            message_ids.append(message_id)
+
+    # Загрузка истории сна из файла
+    @app.on_message(filters.document)
+    async def import_document_handler(client: Client, message: Message, user: User = None):
+        message_id = await import_data(client, message, user)
         if message_id:
             message_ids.append(message_id)
 
@@ -221,26 +238,24 @@ async def start_handler(client: Client, message: Message):
     result = None
     user_timezone = None
     user_time = None
+    purging = False
     try:
-        add_new_user(user)
-        # Отправка приветственного сообщения с пользовательской клавиатурой
-        result = get_has_provided_location(user_id)
-        user_timezone_str = get_user_time_zone_db(user_id)['time_zone']
-        if user_timezone_str is None:
+        # Профиль (локация и часовой пояс) читается одним запросом
+        result = await run_db(get_user_profile, user_id)
+        if result is None:
+            # Пока прежние данные удаляются в фоне, пользователь не регистрируется заново
+            purging = await run_db(add_new_user, user) is False
+        elif result['time_zone'] is None:
             logger.debug(f"Пользователь {user_id} не предоставил локальное время.")
-            user_timezone_str = get_user_time_zone(user_id)
-            if user_timezone_str is not None:
-                user_timezone = timezone(user_timezone_str)
-                user_time = get_local_time(datetime.now(), user_id)
-
         else:
-            user_timezone = timezone(user_timezone_str)
-            user_time = get_local_time(datetime.now(), user_id)
-
+            user_timezone = timezone(result['time_zone'])
+            user_time = datetime.now(user_timezone)
     except Exception as e:
         logger.error(f"Ошибка при инициализации пользователя {user.id}: {e}")
     finally:
-        if result is None or not result['has_provided_location'] or user_timezone is None:
+        if purging:
+            msg = await message.reply_text(PURGE_IN_PROGRESS_TEXT)
+        elif result is None or not result['has_provided_location'] or user_timezone is None:
             msg = await message.reply_text(
                 "Пожалуйста, отправьте ваше местоположение, чтобы начать пользоваться ботом.",
                 reply_markup=get_request_keyboard('location_only'))
@@ -409,8 +424,14 @@ async def callback_query_handler(client: Client, callback_query: CallbackQuery,
     elif data == "delete_data":
         message_id = await delete_my_data(client, message, user)
         return message_id
+    elif data == "import_data":
+        message_id = await request_import(client, message, user)
+        return message_id
     elif data == "save_data":
-        message_id = await export_data(client, message, user)
+        message_id = await show_export_formats_menu(client, user.id)
+        return message_id
+    elif data in ("export_csv", "export_ndjson", "export_parquet"):
+        message_id = await export_data(client, message, user, data.removeprefix("export_"))
         return message_id
     elif data == "back_to_menu":
         if message_ids:
@@ -434,7 +455,7 @@ async def answer_inline_query_handler(client: Client, inline_query: InlineQuery)
     query = inline_query.query.strip()
     if query == "stats":
         # Получение статистики пользователя из базы данных
-        stats = get_user_stats(user_id)
+        stats = await run_db(get_user_stats, user_id)
         if stats:
             result = [
                 InlineQueryResultArticle(
@@ -476,15 +497,20 @@ async def force_reply_handler(client: Client, message: Message):
 
 
 async def sleep_time(client: Client, message: Message, user: User = None):
-    valid_id, user_timezone, sleep_time_dt = await process_user(message, user)
-    if user_timezone is None:
+    is_user, valid_id = await user_valid(message, user)
+    if is_user == 'False':
         return valid_id
 
     user_id = valid_id
 
     try:
-
-        if len(get_wake_time_null(user_id)) > 0:
+        # Часовой пояс читается и сессия открывается одной транзакцией;
+        # открытие сессии и проверка уже открытой выполняются одним запросом
+        result = await run_db(save_sleep_event_now, user_id, start_sleep_session_db)
+        if result is None:
+            raise RuntimeError('время сна не сохранено')
+        sleep_time_dt, cursor = result
+        if cursor.rowcount == 0:
             msg = await message.reply_text(
                 "❗️ Запись о времени сна уже отмечена. "
                 "Используйте /wake, для пробуждения.",
@@ -494,7 +520,6 @@ async def sleep_time(client: Client, message: Message, user: User = None):
                 f"Пользователь {user_id} попытался повторно отметить запись сна без записи пробуждения.")
             return msg.id
 
-        save_sleep_time_records_db(user_id, sleep_time_dt)
         await message.reply_text(
             f"🌙 Время отхода ко сну отмечено: {sleep_time_dt.strftime('%Y-%m-%d %H:%M:%S')}",
             reply_markup=get_back_keyboard()
@@ -511,14 +536,19 @@ async def sleep_time(client: Client, message: Message, user: User = None):
 
 
 async def wake_time(client: Client, message: Message, user: User = None):
-    valid_id, user_timezone, wake_time_dt = await process_user(message, user)
-    if user_timezone is None:
+    is_user, valid_id = await user_valid(message, user)
+    if is_user == 'False':
         return valid_id
 
     user_id = valid_id
 
     try:
-        if save_wake_time_records_db(user_id, wake_time_dt).rowcount == 0:
+        # Закрытие сессии и пересчет дневной сводки фиксируются одной транзакцией
+        result = await run_db(save_sleep_event_now, user_id, finish_sleep_session_db)
+        if result is None:
+            raise RuntimeError('время пробуждения не сохранено')
+        wake_time_dt, cursor = result
+        if cursor.rowcount == 0:
             msg = await message.reply_text(
                 "❗️ Нет записи о времени сна или уже отмечено пробуждение. "
                 "Используйте /sleep, чтобы начать новую запись.",
@@ -527,8 +557,10 @@ async def wake_time(client: Client, message: Message, user: User = None):
             logger.warning(f"Пользователь {user_id} попытался отметить пробуждение без активной записи сна.")
             return msg.id
 
+        hours, minutes = divmod(int(cursor.fetchone()['duration'].total_seconds()) // 60, 60)
         await message.reply_text(
-            f"☀️ Время пробуждения отмечено: {wake_time_dt.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"☀️ Время пробуждения отмечено: {wake_time_dt.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"🛌 Продолжительность сна: {hours} ч {minutes} мин",
             reply_markup=get_back_keyboard()
         )
         logger.info(f"Пользователь {user_id} отметил время пробуждения: {wake_time_dt}")
@@ -552,7 +584,7 @@ async def get_timezone(client: Client, message: Message, user: User = None):
     message_time = message.date
 
     format = '%Y-%m-%d %H:%M:%S'
-    local_time = get_local_time(message_time, user_id).strftime(format)
+    local_time = (await run_db(get_local_time, message_time, user_id)).strftime(format)
     server_time = datetime.now().strftime(format)
     if local_time:
         msg = await message.reply_text(
@@ -575,7 +607,7 @@ async def sleep_stats(client: Client, message: Message, user: User = None):
 
     user_id = valid_id
     try:
-        response = get_user_stats(user_id)
+        response = await run_db(get_user_stats, user_id)
         if response:
             await message.reply_text(
                 response,
@@ -605,38 +637,16 @@ async def sleep_chart(client: Client, message: Message, user: User = None):
     user_id = valid_id
 
     try:
-        records = get_sleep_records_per_week(user_id)
-        if records:
-            durations = []
-            dates = []
-            for record in records:
-                # sleep_time = datetime.fromisoformat(record['sleep_time'])
-                # wake_time = datetime.fromisoformat(record['wake_time'])
-                user_timezone_str = get_user_time_zone_db(user_id)['time_zone']
-                if user_timezone_str:
-                    user_timezone = timezone(user_timezone_str)
-                else:
-                    user_timezone = timezone('Europe/Moscow')
-                sleep_time = record['sleep_time'].astimezone(user_timezone)
-                wake_time = record['wake_time'].astimezone(user_timezone)
-                duration = (wake_time - sleep_time).total_seconds() / 3600  # В часах
-                durations.append(duration)
-                dates.append(sleep_time.date())
-            # Построение графика
-            plt.figure(figsize=(10, 5))
-            plt.plot(dates, durations, marker='o')
-            plt.xlabel('Дата')
-            plt.ylabel('Продолжительность сна (часы)')
-            plt.title('Ваш сон за последние 7 дней')
-            plt.grid(True)
-            # Сохранение графика в буфер
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png')
-            buf.seek(0)
+        # Дневные сводки уже сгруппированы по местным датам пользователя (db.summary)
+        summaries = await run_db(get_daily_sleep_summary, user_id)
+        if summaries:
+            dates = [summary['sleep_date'] for summary in summaries]
+            durations = [summary['total_seconds'] / 3600 for summary in summaries]  # В часах
+            # Построение графика в пуле процессов
+            buf = io.BytesIO(await run_cpu(render_sleep_chart, dates, durations))
             # Отправка графика пользователю
             await client.send_photo(chat_id=user_id, photo=buf, caption='Ваш график сна за последние 7 дней.',
                                     reply_markup=get_back_keyboard())
-            plt.close()
             logger.info(f"Пользователь {user_id} запросил график сна")
         else:
             msg = await message.reply_text(
@@ -113,12 +113,24 @@ def data_management_keyboard():
     return InlineKeyboardMarkup(
         [
             [InlineKeyboardButton("💾 Сохранение данных", callback_data="save_data")],
+            [InlineKeyboardButton("📥 Загрузка истории", callback_data="import_data")],
             [InlineKeyboardButton("🗑 Удаление данных", callback_data="delete_data")],
             [InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu")]
         ]
     )
 
 
+def export_format_keyboard():
+    return InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton("📄 CSV", callback_data="export_csv")],
+            [InlineKeyboardButton("🧾 JSON (NDJSON)", callback_data="export_ndjson")],
+            [InlineKeyboardButton("📦 Parquet", callback_data="export_parquet")],
+            [InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu")]
+        ]
+    )
+
+
 def get_request_keyboard(context: str = None):
     """
 
@@ -6,6 +6,7 @@ from pyrogram.types import Message, User, ForceReply, ReplyKeyboardRemove
 
 from db import delete_reminder_db
 from db.db import get_reminder_time_db, save_reminder_time_db
+from executors import run_db
 from handlers.keyboards import get_reminder_menu_keyboard, get_back_keyboard
 from handlers.states import UserStates, user_states
 from handlers.user_valid import user_valid, valid_time_format
@@ -47,7 +48,7 @@ async def save_reminder_time(client: Client, message: Message, user: User = None
         try:
             reminder_time = datetime.strptime(reminder_time_str, "%H:%M").time()
             # Сохранение времени напоминания в базе данных
-            save_reminder_time_db(user_id, reminder_time_str)
+            await run_db(save_reminder_time_db, user_id, reminder_time_str)
             user_states[user_id] = UserStates.STATE_NONE
             await message.reply_text(
                 f"⏰ Напоминание установлено на {reminder_time_str}.",
@@ -85,7 +86,7 @@ async def remove_reminder(client: Client, message: Message, user: User = None):
     user_id = valid_id
 
     try:
-        delete_reminder_db(user_id)
+        await run_db(delete_reminder_db, user_id)
         await message.reply_text(
             "🔕 Напоминание удалено.",
             reply_markup=get_back_keyboard()
@@ -114,7 +115,7 @@ async def show_reminders_menu(client: Client, message: Message, user: User = Non
     user_id = valid_id
 
     try:
-        reminders_record = get_reminder_time_db(user_id)
+        reminders_record = await run_db(get_reminder_time_db, user_id)
         if reminders_record:
             reminder_time = reminders_record['reminder_time']
             text = f"У вас уже есть установленное напоминания: {reminder_time}."
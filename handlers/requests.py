@@ -5,10 +5,11 @@ from pyrogram import Client
 from pyrogram.types import Message, User
 from pytz import timezone
 
-from db import get_city_name
-from db.db import save_phone_number, save_user_city
+from db.db import save_phone_number
+from executors import run_db, run_io, run_cpu
+from executors.cpu_tasks import timezone_at
 from handlers.keyboards import get_initial_keyboard, get_request_keyboard
-from handlers.user_valid import add_new_user, user_valid, get_user_time_zone
+from handlers.user_valid import add_new_user, user_valid, save_user_location
 from handlers.weather_advice.location_detect import get_city_from_coordinates
 
 logger = logging.getLogger(__name__)
@@ -46,7 +47,23 @@ async def save_location(client: Client, message: Message):
         return msg.id
 
     user_id = message.from_user.id
-    user_timezone = get_user_time_zone(user_id, lat=latitude, lng=longitude)
+    try:
+        # Город определяется запросом к внешнему сервису, часовой пояс - в пуле процессов, до открытия транзакции
+        city_name_new = await run_io(get_city_from_coordinates, latitude, longitude)
+        time_zone_new = await run_cpu(timezone_at, latitude, longitude)
+        if time_zone_new is None:
+            logger.warning(f"Не удалось определить часовой пояс пользователя {user_id} "
+                           f"по местоположению: {latitude}, {longitude}")
+        result = await run_db(save_user_location, user_id, city_name_new, time_zone_new)
+        if result is None:
+            raise RuntimeError('местоположение не сохранено')
+        user_timezone, city_name_old = result
+    except Exception as e:
+        logger.error(f"Ошибка при определении города пользователя {message.from_user.id}: {e}")
+        msg = await message.reply_text("Не удалось сохранить местоположение. Попробуйте еще раз.",
+                                       reply_markup=get_request_keyboard('location'))
+        return msg.id
+
     response = ''
     if user_timezone:
         # Отправляем текущее время
@@ -57,30 +74,20 @@ async def save_location(client: Client, message: Message):
     else:
         logger.warning(f"Не удалось определить часовой пояс пользователя {user_id}")
 
-    try:
-        city_name_new = get_city_from_coordinates(latitude, longitude)
-        city_name_old = get_city_name(user_id)['city_name']
-        if city_name_new:
-
-            if city_name_old is not None and city_name_old == city_name_new:
-                response += f"Ваш город по прежнему: {city_name_old}. Спасибо!"
-                await message.reply_text(response, reply_markup=get_request_keyboard('get_weather'))
-            else:
-                save_user_city(user_id, city_name_new)
-                response += f"Ваш город: {city_name_new}. Спасибо!"
-                await message.reply_text(response, reply_markup=get_request_keyboard('get_weather'))
-
+    if city_name_new:
+        if city_name_old is not None and city_name_old == city_name_new:
+            response += f"Ваш город по прежнему: {city_name_old}. Спасибо!"
         else:
-            if city_name_old is not None:
-                response += f"Ваш город по прежнему: {city_name_old}. Спасибо!"
-                await message.reply_text(response, reply_markup=get_request_keyboard('get_weather'))
-            else:
-                msg = await message.reply_text("Извините, не удалось определить ваш город. Попробуйте еще раз.",
-                                               reply_markup=get_request_keyboard('location'))
-                await message.delete()
-                return msg.id
-    except Exception as e:
-        logger.error(f"Ошибка при определении города пользователя {message.from_user.id}: {e}")
+            response += f"Ваш город: {city_name_new}. Спасибо!"
+        await message.reply_text(response, reply_markup=get_request_keyboard('get_weather'))
+    elif city_name_old is not None:
+        response += f"Ваш город по прежнему: {city_name_old}. Спасибо!"
+        await message.reply_text(response, reply_markup=get_request_keyboard('get_weather'))
+    else:
+        msg = await message.reply_text("Извините, не удалось определить ваш город. Попробуйте еще раз.",
+                                       reply_markup=get_request_keyboard('location'))
+        await message.delete()
+        return msg.id
 
 
 async def request_contact(client: Client, message: Message):
@@ -110,7 +117,7 @@ async def save_contact(client: Client, message: Message, user: User = None):
     if is_user == 'False':
         return valid_id
 
-    add_new_user(user)
+    await run_db(add_new_user, user)
     user_id = valid_id
     contact = message.contact
     phone_number = contact.phone_number
@@ -119,7 +126,7 @@ async def save_contact(client: Client, message: Message, user: User = None):
     if contact_user_id == user_id:
         # Сохранение номера телефона в базе данных
         try:
-            save_phone_number(user_id, phone_number)
+            await run_db(save_phone_number, user_id, phone_number)
             await message.reply_text(
                 "📞 Спасибо! Ваш номер телефона сохранен.",
                 reply_markup=get_request_keyboard('back')
@@ -4,12 +4,14 @@ from datetime import datetime, timedelta, time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from pyrogram import Client
-from pytz import timezone
+from pytz import timezone, utc
 
-from db.db import get_all_reminders, get_all_users_city_name, get_sleep_goal_user, get_reminder_time_db, \
-    get_sleep_time_without_wake_db, get_user_wake_time, get_user_time_zone_db
+from db.db import get_all_user_profiles
+from db.partitions import maintain_sleep_record_partitions
+from db.purge import purge_pending_users
+from executors import run_io, run_db
 from handlers.keyboards import get_back_keyboard
-from handlers.weather_advice import get_weather, get_sleep_advice_based_on_weather
+from handlers.weather_advice import get_weather_many, get_sleep_advice_based_on_weather
 
 logger = logging.getLogger()
 
@@ -24,21 +26,19 @@ def setup_scheduler(app: Client):
         :return:
         """
         try:
-            users = get_all_reminders()
-            now = datetime.now()
+            # Профили всех пользователей читаются одним запросом вместо нескольких запросов на пользователя;
+            # ежеминутный обход всех пользователей идет на реплики (replica_read)
+            users = await run_db(get_all_user_profiles)
+            now = datetime.now(utc)
             for user in users:
-                user_id = user['user_id']
-                if user_id:
-                    user_timezone = get_user_time_zone_db(user_id)['time_zone']
-                    if user_timezone is None:
-                        user_timezone = 'UTC'
-                    now = now.astimezone(timezone(user_timezone))
-                current_time = now.time()
-                sleep_record = get_sleep_time_without_wake_db(user_id)
-                bedtime = calculate_bedtime(user_id)
+                user_id = user['id']
+                if not user['reminder_time']:
+                    continue
+                current_time = now.astimezone(timezone(user['time_zone'] or 'UTC')).time()
+                bedtime = calculate_bedtime(user)
                 if (bedtime and current_time.hour == bedtime.hour
                         and current_time.minute == bedtime.minute
-                        and not sleep_record):
+                        and not user['open_sleep_time']):
                     try:
                         await app.send_message(chat_id=user_id,
                                                text="🌙 Пора ложиться спать, чтобы достичь вашей цели "
@@ -55,17 +55,14 @@ def setup_scheduler(app: Client):
         :return:
         """
         try:
-            users = get_all_reminders()
-            now = datetime.now()
+            users = await run_db(get_all_user_profiles)
+            now = datetime.now(utc)
             for user in users:
-                user_id = user['user_id']
-                if user_id:
-                    user_timezone = get_user_time_zone_db(user_id)['time_zone']
-                    if user_timezone is None:
-                        user_timezone = 'UTC'
-                    now = now.astimezone(timezone(user_timezone))
-                current_time = now.time()
-                wake_up_time = calculate_wake_up_time(user_id)
+                user_id = user['id']
+                if not user['reminder_time']:
+                    continue
+                current_time = now.astimezone(timezone(user['time_zone'] or 'UTC')).time()
+                wake_up_time = calculate_wake_up_time(user)
                 if (wake_up_time and current_time.hour == wake_up_time.hour
                         and current_time.minute == wake_up_time.minute):
                     try:
@@ -83,17 +80,24 @@ def setup_scheduler(app: Client):
         :return:
         """
         try:
-            # Получаем всех пользователей и их города из базы данных
-            users = get_all_users_city_name()
-            now = datetime.now()
+            # Получаем всех пользователей, их города и время напоминаний из базы данных
+            users = await run_db(get_all_user_profiles)
+            now = datetime.now(utc)
+            due_users = []
             for user in users:
-                user_id, city, user_timezone = [user['id'], user['city_name'], user['time_zone']]
-                if user_id:
-                    if user_timezone is None:
-                        user_timezone = 'UTC'
-                    now = now.astimezone(timezone(user_timezone))
-                current_time = now.time()
-                weather = get_weather(city)
+                current_time = now.astimezone(timezone(user['time_zone'] or 'UTC')).time()
+                weather_time = calculate_weather_reminder(user)
+                if (weather_time and current_time.hour == weather_time.hour and
+                        current_time.minute == weather_time.minute):
+                    due_users.append((user['id'], user['city_name'] or 'Moscow'))
+            if not due_users:
+                return
+
+            # Погода запрашивается только для пользователей, которым пора отправить напоминание,
+            # по одному разу на город; закэшированные города читаются из кэша одним запросом
+            weather_by_city = await run_io(get_weather_many, [city for _, city in due_users])
+            for user_id, city in due_users:
+                weather = weather_by_city.get(city)
                 if weather:
                     advice = get_sleep_advice_based_on_weather(weather)
                     response = (
@@ -104,80 +108,79 @@ def setup_scheduler(app: Client):
                         f"Скорость ветра: {weather['wind_speed']} м/с\n\n"
                         f"Советы по улучшению сна:\n{advice}"
                     )
-                    weather_time = calculate_weather_reminder(user_id)
-                    if weather_time and current_time.hour == weather_time.hour and \
-                            current_time.minute == weather_time.minute:
-                        try:
-                            await app.send_message(chat_id=user_id, text=response,
-                                                   reply_markup=get_back_keyboard())
-                        except Exception as e:
-                            logger.error(f"Ошибка при отправке напоминания пользователю {user_id}: {e}")
+                    try:
+                        await app.send_message(chat_id=user_id, text=response,
+                                               reply_markup=get_back_keyboard())
+                    except Exception as e:
+                        logger.error(f"Ошибка при отправке напоминания пользователю {user_id}: {e}")
         except Exception as e:
             logger.error(f"Ошибка в функции daily_weather_reminder: {e}")
 
+    async def maintain_sleep_records():
+        """
+        Создает секции sleep_records на следующие месяцы и удаляет секции старше срока хранения
+        """
+        try:
+            await run_db(maintain_sleep_record_partitions)
+        except Exception as e:
+            logger.error(f"Ошибка в функции maintain_sleep_records: {e}")
+
+    async def purge_deleted_users():
+        """
+        Удаляет пачками историю пользователей, которые удалили свои данные (очередь purge_queue)
+        """
+        try:
+            await run_db(purge_pending_users)
+        except Exception as e:
+            logger.error(f"Ошибка в функции purge_deleted_users: {e}")
+
     scheduler = AsyncIOScheduler()
     scheduler.add_job(send_sleep_reminder, CronTrigger(minute='*'))
     scheduler.add_job(send_wake_up_reminder, CronTrigger(minute='*'))
     scheduler.add_job(daily_weather_reminder, CronTrigger(minute='*'))
+    # Первый запуск - сразу при старте: секции на следующие месяцы создаются вне database_initialize
+    scheduler.add_job(maintain_sleep_records, CronTrigger(hour=3, minute=30), next_run_time=datetime.now(utc))
+    scheduler.add_job(purge_deleted_users, CronTrigger(minute='*'), max_instances=1)
     scheduler.start()
 
 
-def calculate_weather_reminder(user_id: int):
+def calculate_weather_reminder(profile):
     """
 
-    :param user_id: int
+    :param profile: профиль пользователя (get_user_profile)
     :return: time
     """
-    reminder = get_reminder_time_db(user_id)
-    if reminder and reminder["reminder_time"]:
-        reminder_time = (datetime.strptime(reminder["reminder_time"], "%H:%M").time())
-        return reminder_time
+    if profile['reminder_time']:
+        return datetime.strptime(profile['reminder_time'], "%H:%M").time()
     else:
-        return datetime.combine(datetime.now(), time(20, 00)).time()
+        return time(20, 00)
 
 
 # Функция для расчета времени отхода ко сну
-def calculate_bedtime(user_id: int):
+def calculate_bedtime(profile):
     """
-    :param user_id: id пользователя
+    :param profile: профиль пользователя (get_user_profile)
     :return: time | None
     """
-    user = get_sleep_goal_user(user_id)
-    user_timezone = get_user_time_zone_db(user_id)['time_zone']
-    sleep_record = get_user_wake_time(user_id)
-    if user and user['sleep_goal'] and sleep_record and \
-            sleep_record['wake_time'] and sleep_record['wake_time'] is None:
-        if user_timezone is None:
-            user_timezone = 'UTC'
-        sleep_goal = user['sleep_goal']
-        # wake_time_dt = datetime.strptime(wake_time['wake_time'], "%H:%M").time()
-        wake_time_dt = sleep_record['wake_time'].astimezone(timezone(user_timezone)).time()
-        # Предположим, что пользователь хочет вставать в wake_time и он определен
-        wake_up_time = datetime.combine(datetime.now(timezone(user_timezone)), wake_time_dt)
-        bedtime = wake_up_time - timedelta(hours=sleep_goal)
+    if profile['sleep_goal'] and profile['wake_time']:
+        # wake_time хранится в профиле как локальное время пользователя в формате HH:MM
+        wake_time_dt = datetime.strptime(profile['wake_time'], "%H:%M")
+        bedtime = wake_time_dt - timedelta(hours=profile['sleep_goal'])
         return bedtime.time()
     else:
         return None
 
 
-def calculate_wake_up_time(user_id: int):
+def calculate_wake_up_time(profile):
     """
-    :param user_id: id пользователя
+    :param profile: профиль пользователя (get_user_profile)
     :return: time | None
     """
-    user = get_sleep_goal_user(user_id)
-    user_timezone = get_user_time_zone_db(user_id)['time_zone']
-    sleep_record = get_sleep_time_without_wake_db(user_id)
-    if user and user['sleep_goal'] and sleep_record and sleep_record['sleep_time']:
-        if user_timezone is None:
-            user_timezone = 'UTC'
-        sleep_goal = user['sleep_goal']
-        # sleep_time_str = sleep_record['sleep_time']
-        # sleep_time = datetime.strptime(sleep_time_str[:-10], "%Y-%m-%d %H:%M")
-        sleep_time_dt = sleep_record['sleep_time'].astimezone(timezone(user_timezone)).time()
-        # Преобразовываем в datetime и плюсуем желаемую цель сна
-        sleep_datetime = datetime.combine(datetime.now(timezone(user_timezone)), sleep_time_dt)
-        wake_up_time = sleep_datetime + timedelta(hours=sleep_goal)
+    if profile['sleep_goal'] and profile['open_sleep_time']:
+        user_timezone = timezone(profile['time_zone'] or 'UTC')
+        # Время отхода ко сну открытой сессии плюс желаемая цель сна
+        sleep_datetime = profile['open_sleep_time'].astimezone(user_timezone)
+        wake_up_time = sleep_datetime + timedelta(hours=profile['sleep_goal'])
         return wake_up_time.time()
     else:
         return None
@@ -4,6 +4,7 @@ from pyrogram import Client
 from pyrogram.types import Message, User, ForceReply
 
 from db.db import save_mood_db
+from executors import run_db
 from handlers.keyboards import get_back_keyboard
 from handlers.states import UserStates, user_states
 from handlers.user_valid import user_valid
@@ -38,7 +39,7 @@ async def save_mood(client: Client, message: Message, user: User = None):
 
         try:
             if 1 <= mood <= 5:
-                save_mood_db(user_id, mood)
+                await run_db(save_mood_db, user_id, mood)
                 user_states[user_id] = UserStates.STATE_NONE
                 await message.reply_text(
                     "Спасибо! Ваше настроение сохранено.",
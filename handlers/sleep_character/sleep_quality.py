@@ -4,6 +4,7 @@ from pyrogram import Client
 from pyrogram.types import Message, User, ForceReply
 
 from db.db import save_sleep_quality_db
+from executors import run_db
 from handlers.keyboards import get_back_keyboard
 from handlers.states import UserStates, user_states
 from handlers.user_valid import is_valid_user
@@ -44,7 +45,7 @@ async def save_sleep_quality(client: Client, message: Message, user: User = None
 
         try:
             if 1 <= quality <= 5:
-                save_sleep_quality_db(user_id, quality)
+                await run_db(save_sleep_quality_db, user_id, quality)
                 user_states[user_id] = UserStates.STATE_NONE
                 await message.reply_text(
                     "Спасибо! Ваша оценка сохранена.",
@@ -4,6 +4,7 @@ from pyrogram import Client
 from pyrogram.types import Message, User, ForceReply
 
 from db.db import save_sleep_goal_db
+from executors import run_db
 from handlers.keyboards import get_back_keyboard
 from handlers.states import UserStates, user_states
 from handlers.user_valid import add_new_user, user_valid
@@ -33,13 +34,13 @@ async def save_sleep_goal(client: Client, message: Message, user: User = None):
         if is_user == 'False':
             return valid_id
 
-        add_new_user(user)
+        await run_db(add_new_user, user)
         user_id = valid_id
         goal = float(message.text.strip())
 
         try:
             if 0 < goal <= 24:
-                save_sleep_goal_db(user_id, goal)
+                await run_db(save_sleep_goal_db, user_id, goal)
                 user_states[user_id] = UserStates.STATE_NONE
                 await message.reply_text(
                     f"Ваша цель по продолжительности сна установлена на {goal} часов.",
@@ -5,6 +5,7 @@ from pyrogram import Client
 from pyrogram.types import Message, User, ForceReply
 
 from db.db import get_user_wake_time, save_wake_time_user_db
+from executors import run_db
 from handlers.keyboards import get_back_keyboard
 from handlers.states import UserStates, user_states
 from handlers.user_valid import user_valid, valid_time_format
@@ -20,7 +21,7 @@ async def set_wake_time(client: Client, message: Message, user: User = None):
     user_id = valid_id
     user_states[user_id] = UserStates.STATE_WAITING_USER_WAKE_TIME
     try:
-        wake_time_str = get_user_wake_time(user_id)
+        wake_time_str = await run_db(get_user_wake_time, user_id)
         if wake_time_str and wake_time_str['wake_time']:
             wake_time_dt = datetime.strptime(wake_time_str['wake_time'], "%H:%M")
             response = (
@@ -56,7 +57,7 @@ async def save_wake_time(client: Client, message: Message, user: User = None):
         try:
             wake_time = datetime.strptime(wake_time_str, "%H:%M").time()
             # Сохранение времени напоминания в базе данных
-            save_wake_time_user_db(user_id, wake_time_str)
+            await run_db(save_wake_time_user_db, user_id, wake_time_str)
             user_states[user_id] = UserStates.STATE_NONE
             await message.reply_text(
                 f"⏰ Время подъема установлено на {wake_time_str}.",
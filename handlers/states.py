@@ -16,4 +16,5 @@ class UserStates(Enum):
     STATE_WAITING_USER_WAKE_TIME = auto()
     STATE_WAITING_SAVE_MOOD = auto()
     STATE_WAITING_CONFIRM_DELETE = auto()
+    STATE_WAITING_IMPORT_FILE = auto()
     STATE_WAITING_PROVIDED_LOCATION = auto()
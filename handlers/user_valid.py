@@ -7,15 +7,20 @@ from datetime import datetime
 from pyrogram import Client
 from pyrogram.types import User, Message, ForceReply
 from pytz import timezone
-from timezonefinder import TimezoneFinder
 
-from db.db import get_has_provided_location, get_sleep_record_last_db, get_user_db, save_user_to_db, \
-    get_user_time_zone_db, save_user_time_zone_db
+from db.db import get_user_profile, get_sleep_record_last_db, get_user_db, get_purge_request_db, save_user_to_db, \
+    get_user_time_zone_db, save_user_time_zone_db, get_daily_sleep_summary, get_city_name, save_user_city
+from db.execute_query import unit_of_work
+from executors import run_db
 from handlers.keyboards import get_back_keyboard, get_request_keyboard
 from handlers.states import UserStates, user_states
 
 logger = logging.getLogger(__name__)
 
+# Ответ пользователю, который снова пришел в бот, пока его прежние данные удаляются в фоне (db.purge)
+PURGE_IN_PROGRESS_TEXT = ("⏳ Ваши прежние данные еще удаляются. "
+                          "Пожалуйста, повторите /start через несколько минут.")
+
 
 def is_valid_user(user: User):
     if not isinstance(user, User):
@@ -29,25 +34,39 @@ def is_valid_user(user: User):
     return True
 
 
-async def process_user(message: Message, user: User = None):
+def save_sleep_event_now(user_id: int, save):
     """
-    Проверяет пользователя, получает временную зону и текущее время.
+    Записывает событие сна save(user_id, время) (start_sleep_session_db или finish_sleep_session_db)
+    с текущим временем в часовом поясе пользователя. Часовой пояс читается, а событие и дневная сводка
+    записываются одной транзакцией (unit_of_work).
 
-    :param message: Message
-    :param user: User
-    :return: Tuple (user_id, user_timezone, wake_time_dt)
+    :param user_id: int
+    :param save: функция записи db.db
+    :return: Tuple (время события, курсор save) или None при ошибке
     """
-    is_user, valid_id = await user_valid(message, user)
-    if is_user == 'False':
-        return valid_id, None, None  # Возвращаем значения для обработки ошибки
+    with unit_of_work(user_id) as session:
+        user_timezone = (get_user_time_zone_db(user_id) or {}).get('time_zone') or 'UTC'
+        event_time_dt = datetime.now(timezone(user_timezone))
+        cursor = save(user_id, event_time_dt)
+    return (event_time_dt, cursor) if session.committed else None
 
-    user_id = valid_id
-    user_timezone = get_user_time_zone_db(user_id)['time_zone']
-    if user_timezone is None:
-        user_timezone = 'UTC'
-    current_time_dt = datetime.now(timezone(user_timezone))
 
-    return user_id, user_timezone, current_time_dt
+def save_user_location(user_id: int, city_name: str | None, time_zone: str | None):
+    """
+    Сохраняет часовой пояс и город пользователя, определенные по координатам, одной транзакцией (unit_of_work).
+    Оба определяются до вызова: город - запросом к внешнему сервису, часовой пояс - в пуле процессов (timezone_at).
+
+    :param user_id: int
+    :param city_name: город по координатам или None, если его не удалось определить
+    :param time_zone: часовой пояс по координатам или None, если его не удалось определить
+    :return: Tuple (часовой пояс, прежний город) или None при ошибке
+    """
+    with unit_of_work(user_id) as session:
+        user_timezone = get_user_time_zone(user_id, location_time_zone=time_zone)
+        city_name_old = (get_city_name(user_id) or {}).get('city_name')
+        if city_name and city_name != city_name_old:
+            save_user_city(user_id, city_name)
+    return (user_timezone, city_name_old) if session.committed else None
 
 
 def get_user_stats(user_id: int):
@@ -71,6 +90,16 @@ def get_user_stats(user_id: int):
                             f"{wake_time.strftime('%Y-%m-%d %H:%M')} — {duration}")
             else:
                 response = f"🛌 Ваша текущая запись сна:\nС {sleep_time.strftime('%Y-%m-%d %H:%M')} — Ещё не проснулись"
+
+            summaries = get_daily_sleep_summary(user_id)
+            if summaries:
+                average = sum(summary['total_seconds'] for summary in summaries) / len(summaries) / 3600
+                response += f"\n\n📊 За последние 7 дней: в среднем {average:.1f} ч сна за {len(summaries)} дн."
+                attainments = [summary['goal_attainment'] for summary in summaries
+                               if summary['goal_attainment'] is not None]
+                if attainments:
+                    reached = sum(attainment >= 1 for attainment in attainments)
+                    response += f"\n🎯 Цель сна достигнута {reached} из {len(attainments)} дн."
             logger.info(f"Пользователь {user_id} запросил статистику сна")
             return response
         else:
@@ -82,6 +111,14 @@ def get_user_stats(user_id: int):
 
 
 def add_new_user(user: User):
+    """
+    Регистрирует пользователя, если его еще нет в базе данных.
+    Пока прежние данные пользователя удаляются в фоне (purge_queue), регистрация откладывается:
+    новые записи иначе удалило бы то же фоновое удаление.
+
+    :param user: User
+    :return: False, если данные пользователя еще удаляются, иначе None
+    """
     if user is None:
         return  # Игнорируем сообщения без информации о пользователе
     try:
@@ -96,6 +133,9 @@ def add_new_user(user: User):
     last_name = user.last_name
 
     try:
+        if get_purge_request_db(user_id) is not None:
+            logger.info(f"Пользователь {user_id} ждет окончания удаления данных, регистрация отложена")
+            return False
         user_db = get_user_db(user_id)
         if user_db is not None:
             return  # Пользователь уже есть в базе данных
@@ -144,9 +184,9 @@ def requires_location(func):
 
         user_id = valid_id
         try:
-            result = get_has_provided_location(user_id)
+            result = await run_db(get_user_profile, user_id)
         except Exception as e:
-            logger.error(f"Ошибка при вызове функции get_has_provided_location пользователя {user_id}: {e}")
+            logger.error(f"Ошибка при вызове функции get_user_profile пользователя {user_id}: {e}")
             msg = await message.reply_text(
                 "Данные о раскрытии местоположения не были получены, отправьте снова или попробуйте позже",
                 reply_markup=get_request_keyboard('location')
@@ -155,13 +195,16 @@ def requires_location(func):
 
         if result is None:
             try:
-                add_new_user(user)
+                registered = await run_db(add_new_user, user)
             except Exception as e:
                 msg = await message.reply_text(
                     "Данный аккаунт не является валидным попробуйте снова с другим аккаунтом",
                     reply_markup=get_request_keyboard('back')
                 )
                 return msg.id
+            if registered is False:
+                msg = await message.reply_text(PURGE_IN_PROGRESS_TEXT, reply_markup=get_back_keyboard())
+                return msg.id
             result = {'has_provided_location': 0}
 
         has_provided_location = result['has_provided_location']
@@ -190,7 +233,7 @@ async def valid_time_format(message: Message, user: User):
     if is_user == 'False':
         return False, valid_id
 
-    add_new_user(user)
+    await run_db(add_new_user, user)
     user_id = valid_id
     _time_str = message.text.strip()
     # Валидация формата времени
@@ -204,44 +247,33 @@ async def valid_time_format(message: Message, user: User):
     return True, (_time_str, user_id)
 
 
-def get_user_time_zone(user_id: int, *, lat: float = None, lng: float = None):
+def get_user_time_zone(user_id: int, *, location_time_zone: str = None):
     """
     Получение временного пояса пользователя.
     :param user_id: int
-    :param lng: float
-    :param lat: float
+    :param location_time_zone: часовой пояс, определенный по местоположению пользователя (timezone_at), или None
     :return: str | None
     """
     logger.info(f"Получение часового пояса пользователя {user_id}")
     try:
         user_timezone: str = get_user_time_zone_db(user_id)['time_zone']
         logger.debug(f"User {user_id} time_zone: {user_timezone}")
-        if lng is not None and lat is not None: # Определяем новый часовой пояс по координатам
-            logger.debug(f"Location: {lat}, {lng}")
-            tf = TimezoneFinder()
-            user_timezone_new = tf.timezone_at(lat=lat, lng=lng)
-            if user_timezone_new is None:
-                logger.warning(f"Не удалось определить часовой пояс пользователя {user_id} "
-                               f"по местоположению: {lat}, {lng}")
-        else:
-            logger.warning(f"Не удалось определить местоположение пользователя {user_id}")
-            user_timezone_new = None
 
-        if user_timezone_new: # часовой пояс определен
+        if location_time_zone: # часовой пояс определен по местоположению
             if user_timezone is None:  # Поиск часового пояса пользователя
-                # Поиск часового пояса пользователя по местоположению
-                # Сохранение местоположения в базе данных
-                save_user_time_zone_db(user_id, timezone=user_timezone_new)
-                logger.info(f'Новый часовой пояс для пользователя {user_id} определен по координатам: {lng}, {lat}')
+                # Сохранение часового пояса в базе данных
+                save_user_time_zone_db(user_id, timezone=location_time_zone)
+                logger.info(f'Новый часовой пояс для пользователя {user_id} определен по местоположению: '
+                            f'{location_time_zone}')
             else: # часовой пояс есть у пользователя
-                if user_timezone != user_timezone_new: # обновляем часовой пояс
-                    save_user_time_zone_db(user_id, timezone=user_timezone_new)
-                    logger.info(f'Новый часовой пояс пользователя {user_id} определеный по координатам {lng}, {lat}\n'
-                                f'заменен вместо старого: {user_timezone}')
+                if user_timezone != location_time_zone: # обновляем часовой пояс
+                    save_user_time_zone_db(user_id, timezone=location_time_zone)
+                    logger.info(f'Новый часовой пояс пользователя {user_id} определеный по местоположению '
+                                f'{location_time_zone}\nзаменен вместо старого: {user_timezone}')
                 else: # часовой пояс не изменился
                     logger.info(f"Часовой пояс пользователя {user_id} остался прежним: {user_timezone}")
                     return user_timezone
-            return user_timezone_new
+            return location_time_zone
         else: # новый часовой пояс не определен
             logger.info(f"Новый часовой пояс пользователя {user_id} не был определен и остался прежним: {user_timezone}")
             return user_timezone
@@ -1,5 +1,5 @@
 from .location_detect import get_city_from_coordinates
 from .weather_advice import get_weather_advice
-from .weather_tips import get_weather, get_sleep_advice_based_on_weather
+from .weather_tips import get_weather, get_weather_many, get_sleep_advice_based_on_weather
 
-__all__ = ['get_weather', 'get_sleep_advice_based_on_weather', 'get_city_from_coordinates', 'get_weather_advice']
+__all__ = ['get_weather', 'get_weather_many', 'get_sleep_advice_based_on_weather', 'get_city_from_coordinates', 'get_weather_advice']
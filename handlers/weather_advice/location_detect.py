@@ -3,7 +3,8 @@ import logging.config
 
 import requests
 
-from configs import OPENCAGE_API_KEY
+from cache import get_namespace
+from configs import OPENCAGE_API_KEY, HTTP_TIMEOUT, GEOCODE_CACHE_TTL
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +23,16 @@ logger = logging.getLogger(__name__)
 
 
 def get_city_from_coordinates(latitude, longitude):
+    """
+    Определение города по координатам. Результат кэшируется для точки, округленной примерно до 100 м.
+    """
+    key = f'{round(float(latitude), 3)}:{round(float(longitude), 3)}'
+    return get_namespace('geocode', GEOCODE_CACHE_TTL).get_or_set(
+        key, lambda: fetch_city_from_coordinates(latitude, longitude)
+    )
+
+
+def fetch_city_from_coordinates(latitude, longitude):
     url = "https://api.opencagedata.com/geocode/v1/json"
     params = {
         "q": f"{latitude},{longitude}",
@@ -29,7 +40,7 @@ def get_city_from_coordinates(latitude, longitude):
         "language": "ru",
         "pretty": 1
     }
-    response = requests.get(url, params)
+    response = requests.get(url, params, timeout=HTTP_TIMEOUT)
     data = response.json()
 
     if response.status_code == 200 and data["results"]:
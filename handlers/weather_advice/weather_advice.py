@@ -4,6 +4,7 @@ from pyrogram import Client
 from pyrogram.types import Message, User
 
 from db.db import get_city_name
+from executors import run_db, run_io
 from handlers.keyboards import get_request_keyboard
 from handlers.user_valid import requires_location, user_valid
 from handlers.weather_advice.weather_tips import get_sleep_advice_based_on_weather, get_weather
@@ -20,13 +21,13 @@ async def get_weather_advice(client: Client, message: Message, user: User = None
     user_id = valid_id
 
     try:
-        user_city_name_record = get_city_name(user_id)
+        user_city_name_record = await run_db(get_city_name, user_id)
         if user_city_name_record and user_city_name_record['city_name']:
             user_city = user_city_name_record["city_name"]
         else:
             user_city = "Moscow"  # Здесь можно использовать город пользователя или запросить его
 
-        weather = get_weather(user_city)
+        weather = await run_io(get_weather, user_city)
 
         if weather:
             advice = get_sleep_advice_based_on_weather(weather)
@@ -2,18 +2,56 @@ import logging.config
 
 import requests
 
-from configs import WEATHER_API_KEY, WEATHER_BASE_URL
+from cache import get_namespace
+from configs import WEATHER_API_KEY, WEATHER_BASE_URL, HTTP_TIMEOUT, WEATHER_CACHE_TTL
 
 logger = logging.getLogger(__name__)
 
 
+def weather_namespace():
+    """
+    Пространство имен общего кэша для погоды (ключ - название города в нижнем регистре)
+    """
+    return get_namespace('weather', WEATHER_CACHE_TTL)
+
+
 def get_weather(city_name: str = None):
     """
-    Получение погоды по названию города.
+    Получение погоды по названию города. Ответ API кэшируется на WEATHER_CACHE_TTL секунд.
     """
     if city_name is None:
         city_name = 'Moscow'
 
+    return weather_namespace().get_or_set(city_name.lower(), lambda: fetch_weather(city_name))
+
+
+def get_weather_many(city_names: list[str]) -> dict:
+    """
+    Получение погоды для нескольких городов: закэшированные значения читаются одним запросом к кэшу,
+    API запрашивается только для остальных.
+    :return: Словарь {название города: погода}, города без данных пропускаются
+    """
+    namespace = weather_namespace()
+    keys = {city_name: city_name.lower() for city_name in city_names}
+    cached = namespace.get_many(list(set(keys.values())))
+
+    fetched = {}
+    for city_name, key in keys.items():
+        if key not in cached and key not in fetched:
+            weather = fetch_weather(city_name)
+            if weather:
+                fetched[key] = weather
+    if fetched:
+        namespace.set_many(fetched)
+
+    found = {**cached, **fetched}
+    return {city_name: found[key] for city_name, key in keys.items() if key in found}
+
+
+def fetch_weather(city_name: str):
+    """
+    Запрос погоды по названию города к API без кэша.
+    """
     params = {
         "q": city_name,
         "appid": WEATHER_API_KEY,
@@ -22,7 +60,7 @@ def get_weather(city_name: str = None):
     }
 
     try:
-        response = requests.get(WEATHER_BASE_URL, params)
+        response = requests.get(WEATHER_BASE_URL, params, timeout=HTTP_TIMEOUT)
         data = response.json()
 
         if response.status_code == 200:
@@ -0,0 +1,26 @@
+import pytest
+from unittest.mock import patch
+
+from cache import MemoryCache, set_cache
+from db.execute_query.execute_sqlite import close_connections_sl
+from db.init import database_initialize
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Тесты подменяют execute_query_pg, поэтому закэшированный ответ не должен переходить между тестами
+    set_cache(MemoryCache(1000))
+    yield
+    set_cache(None)
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    close_connections_sl()
+    with patch("db.execute_query.execute_sqlite.database_path", return_value=str(tmp_path / 'bot.sqlite')), \
+            patch("db.execute_query.execute_pg.DATABASE_BACKEND", 'sqlite'), \
+            patch("db.init.DATABASE_BACKEND", 'sqlite'), \
+            patch("db.partitions.DATABASE_BACKEND", 'sqlite'):
+        database_initialize()
+        yield
+    close_connections_sl()
@@ -0,0 +1,94 @@
+import gzip
+import io
+from datetime import date, datetime, timezone
+
+from unittest.mock import patch
+from pytz import timezone as pytz_timezone
+
+from db.bulk_import import ImportResult, read_batches, validate_batch, import_sleep_records
+from db.db import save_user_to_db, get_all_sleep_records, get_daily_sleep_summary
+from db.execute_query.execute_pg import execute_copy_pg
+
+UTC = timezone.utc
+NOW = datetime(2025, 1, 1, tzinfo=UTC)
+
+HISTORY = '''sleep_time,wake_time,sleep_quality,mood
+2024-12-01 23:30,2024-12-02 07:30,4,5
+2024-12-02T22:00:00+00:00,2024-12-03T06:00:00+00:00,,
+2024-12-03 23:00,2024-12-03 22:00,3,3
+2024-12-04 23:00,2024-12-05 07:00,9,
+вчера,2024-12-06 07:00,,
+2024-12-01 23:30,2024-12-02 07:30,4,5
+'''
+
+
+def test_read_batches_accepts_gzip_and_checks_header():
+    file = io.BytesIO(gzip.compress(HISTORY.encode()))
+    batches = list(read_batches(file, batch_size=4))
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert batches[0][0] == (2, {'sleep_time': '2024-12-01 23:30', 'wake_time': '2024-12-02 07:30',
+                                 'sleep_quality': '4', 'mood': '5'})
+
+    try:
+        list(read_batches(io.BytesIO(b'date,hours\n2024-12-01,8\n'), batch_size=10))
+    except ValueError as e:
+        assert str(e) == 'в файле нет столбцов: sleep_time, wake_time'
+    else:
+        raise AssertionError('ожидалась ошибка заголовка')
+
+
+def test_validate_batch_normalizes_time_zone_and_rejects_bad_rows():
+    result = ImportResult()
+    batch = next(read_batches(io.BytesIO(HISTORY.encode()), batch_size=100))
+
+    records = validate_batch(5, batch, pytz_timezone('Europe/Moscow'), NOW, result)
+
+    assert records[:2] == [
+        (5, datetime(2024, 12, 1, 20, 30, tzinfo=UTC), datetime(2024, 12, 2, 4, 30, tzinfo=UTC), 4, 5),
+        (5, datetime(2024, 12, 2, 22, tzinfo=UTC), datetime(2024, 12, 3, 6, tzinfo=UTC), None, None),
+    ]
+    assert len(records) == 3
+    assert result.rejected == 3
+    assert [error.split(':')[0] for error in result.errors] == ['строка 4', 'строка 5', 'строка 6']
+
+
+@patch("db.execute_query.execute_pg.get_pool")
+def test_copy_sends_one_csv_stream(mock_get_pool):
+    conn = mock_get_pool.return_value.getconn.return_value
+    cursor = conn.cursor.return_value
+    copied = []
+    cursor.copy_expert.side_effect = lambda query, file: copied.append((query, file.read()))
+
+    assert execute_copy_pg('public.sleep_records', ('user_id', 'sleep_time', 'mood'),
+                           [(5, datetime(2024, 12, 1, 20, 30, tzinfo=UTC), None)]) is cursor
+
+    assert copied == [('COPY public.sleep_records (user_id, sleep_time, mood) FROM STDIN WITH (FORMAT csv)',
+                       '5,2024-12-01 20:30:00+00:00,\r\n')]
+    conn.commit.assert_called_once()
+
+
+def test_import_on_sqlite(sqlite_backend):
+    save_user_to_db(7301, 'sleeper', time_zone='Europe/Moscow')
+
+    result = import_sleep_records(7301, io.BytesIO(HISTORY.encode()), batch_size=2)
+
+    assert (result.accepted, result.rejected, result.duplicates) == (2, 3, 1)
+    assert result.rate > 0
+    assert [record['sleep_time'] for record in get_all_sleep_records(7301)] == \
+        [datetime(2024, 12, 2, 22, tzinfo=UTC), datetime(2024, 12, 1, 20, 30, tzinfo=UTC)]
+    assert [(row['sleep_date'], row['total_seconds']) for row in get_daily_sleep_summary(7301, days=100_000)] == \
+        [(date(2024, 12, 3), 28800), (date(2024, 12, 1), 28800)]
+
+    # Повторная загрузка того же файла ничего не дублирует
+    again = import_sleep_records(7301, io.BytesIO(gzip.compress(HISTORY.encode())))
+    assert (again.accepted, again.duplicates) == (0, 3)
+    assert len(get_all_sleep_records(7301)) == 2
+
+
+def test_import_reports_unreadable_file(sqlite_backend):
+    save_user_to_db(7302, 'sleeper')
+
+    result = import_sleep_records(7302, io.BytesIO(b'\x1f\x8bnot really gzip'))
+
+    assert result.accepted == 0
+    assert result.errors[0].startswith('файл не прочитан')
@@ -0,0 +1,172 @@
+import socket
+import threading
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from pytz import utc
+
+from cache import MemoryCache, RedisCache, MISSING
+
+
+class FakeRedisServer:
+    """
+    Локальная замена сервера Redis: понимает GET, SET (PX), MGET, DEL, SCAN, PING
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        reader = conn.makefile('rb')
+        while True:
+            line = reader.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(reader.readline()[1:-2])
+                args.append(reader.read(length + 2)[:-2])
+            self.commands.append(args[0].upper())
+            conn.sendall(self._execute(args[0].upper(), args[1:]))
+
+    @staticmethod
+    def _bulk(value):
+        return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at < time.monotonic():
+            return None
+        return value
+
+    def _execute(self, command, args):
+        if command == b'PING':
+            return b'+PONG\r\n'
+        if command == b'GET':
+            return self._bulk(self._get(args[0]))
+        if command == b'MGET':
+            return b'*%d\r\n' % len(args) + b''.join(self._bulk(self._get(key)) for key in args)
+        if command == b'SET':
+            expires_at = time.monotonic() + int(args[3]) / 1000 if len(args) > 3 else None
+            self.data[args[0]] = (args[1], expires_at)
+            return b'+OK\r\n'
+        if command == b'DEL':
+            return b':%d\r\n' % sum(self.data.pop(key, None) is not None for key in args)
+        if command == b'SCAN':
+            prefix = args[2].rstrip(b'*')
+            keys = [key for key in self.data if key.startswith(prefix)]
+            return b'*2\r\n$1\r\n0\r\n*%d\r\n' % len(keys) + b''.join(self._bulk(key) for key in keys)
+        return b'-ERR unknown command\r\n'
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer()
+    yield server
+    server.close()
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+
+    cache.set('c', 3)
+
+    assert cache.get('b') is MISSING
+    assert cache.get_many(['a', 'b', 'c']) == {'a': 1, 'c': 3}
+    assert cache.stats()['evictions'] == 1
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache()
+    with patch('cache.memory.time.monotonic', return_value=100.0):
+        cache.set('a', 1, ttl=60)
+    with patch('cache.memory.time.monotonic', return_value=161.0):
+        assert cache.get('a') is MISSING
+
+    assert cache.stats()['expirations'] == 1
+
+
+def test_namespace_prefixes_keys():
+    cache = MemoryCache()
+    weather = cache.namespace('weather', ttl=60)
+    weather.set('moscow', {'temperature': 1})
+
+    assert cache.get('weather:moscow') == {'temperature': 1}
+    assert weather.get_many(['moscow', 'kazan']) == {'moscow': {'temperature': 1}}
+    assert cache.namespace('geocode').get('moscow') is MISSING
+
+
+def test_redis_cache_round_trip(redis_server):
+    cache = RedisCache(f'redis://127.0.0.1:{redis_server.port}/0', prefix='test')
+    value = {'sleep_time': datetime(2024, 12, 1, 23, 0, tzinfo=utc), 'sleep_goal': 8.0, 'city': 'Москва'}
+
+    cache.set('user:1', value, ttl=60)
+
+    assert cache.get('user:1') == value
+    assert b'test:user:1' in redis_server.data
+    assert cache.get('user:2') is MISSING
+    cache.close()
+
+
+def test_redis_cache_pipelines_many_keys(redis_server):
+    cache = RedisCache(f'redis://127.0.0.1:{redis_server.port}/0')
+    namespace = cache.namespace('weather', ttl=60)
+
+    namespace.set_many({'moscow': {'t': 1}, 'kazan': {'t': 2}})
+    found = namespace.get_many(['moscow', 'kazan', 'sochi'])
+
+    assert found == {'moscow': {'t': 1}, 'kazan': {'t': 2}}
+    assert cache.stats()['round_trips'] == 2
+    assert redis_server.commands == [b'SET', b'SET', b'MGET']
+
+    cache.clear()
+    assert redis_server.data == {}
+    cache.close()
+
+
+def test_redis_cache_unavailable_is_a_miss():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    cache = RedisCache(f'redis://127.0.0.1:{port}/0', retry_interval=60)
+
+    assert cache.get('key') is MISSING
+    cache.set('key', 1)
+    assert cache.get_many(['key']) == {}
+    # После ошибки сервер не опрашивается до истечения retry_interval
+    assert cache.stats()['errors'] == 1
+
+
+@patch("handlers.weather_advice.weather_tips.fetch_weather")
+def test_get_weather_many_fetches_each_missing_city_once(mock_fetch_weather):
+    from handlers.weather_advice.weather_tips import get_weather, get_weather_many
+
+    mock_fetch_weather.side_effect = lambda city: {'city': city}
+    get_weather('Moscow')
+
+    result = get_weather_many(['Moscow', 'Kazan', 'kazan'])
+
+    assert result == {'Moscow': {'city': 'Moscow'}, 'Kazan': {'city': 'Kazan'}, 'kazan': {'city': 'Kazan'}}
+    assert [call.args[0] for call in mock_fetch_weather.call_args_list] == ['Moscow', 'Kazan']
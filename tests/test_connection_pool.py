@@ -0,0 +1,82 @@
+from unittest.mock import patch, MagicMock
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+from db.execute_query.pool import ConnectionPool, PoolTimeout
+
+
+def make_connection():
+    conn = MagicMock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+@patch("psycopg2.connect", side_effect=lambda **kwargs: make_connection())
+def test_pool_reuses_idle_connection(mock_connect):
+    pool = ConnectionPool({'database': 'test'}, min_size=1, max_size=2)
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+
+    mock_connect.assert_called_once_with(database='test')
+    stats = pool.stats()
+    assert stats['checkouts'] == 2
+    assert stats['created'] == 1
+    assert stats['in_use'] == 1
+
+
+@patch("psycopg2.connect", side_effect=lambda **kwargs: make_connection())
+def test_pool_timeout_when_exhausted(mock_connect):
+    pool = ConnectionPool({}, min_size=0, max_size=1, timeout=0.01)
+    pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert stats['timeouts'] == 1
+
+
+@patch("psycopg2.connect", side_effect=lambda **kwargs: make_connection())
+def test_pool_replaces_expired_connection(mock_connect):
+    pool = ConnectionPool({}, max_lifetime=0)
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+    new_conn = pool.getconn()
+
+    assert new_conn is not conn
+    conn.close.assert_called_once()
+    assert pool.stats()['closed_expired'] == 1
+
+
+@patch("psycopg2.connect", side_effect=lambda **kwargs: make_connection())
+def test_pool_health_check_discards_dead_connection(mock_connect):
+    pool = ConnectionPool({}, health_check_interval=0)
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError()
+    new_conn = pool.getconn()
+
+    assert new_conn is not conn
+    assert pool.stats()['closed_broken'] == 1
+
+
+@patch("psycopg2.connect", side_effect=lambda **kwargs: make_connection())
+def test_pool_reaps_idle_connections_above_min_size(mock_connect):
+    pool = ConnectionPool({}, min_size=1, max_size=3, max_idle=0)
+
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    pool.getconn()
+
+    stats = pool.stats()
+    assert stats['closed_idle'] == 1
+    assert stats['size'] == 1
@@ -0,0 +1,109 @@
+from datetime import date, datetime, timedelta, timezone
+
+from unittest.mock import patch, MagicMock
+
+from db.db import save_user_to_db, start_sleep_session_db, finish_sleep_session_db, save_sleep_quality_db, \
+    save_mood_db, get_daily_sleep_summary, delete_sleep_records_db
+from db.queries import DAILY_SUMMARY_UPSERT_SQL, DAILY_SUMMARY_TEMPLATE
+from db.summary import summarize, refresh_daily_summary, backfill_daily_summary
+
+UTC = timezone.utc
+
+
+def record(sleep_time, hours, quality=None, mood=None):
+    return {'sleep_time': sleep_time, 'wake_time': sleep_time + timedelta(hours=hours),
+            'sleep_quality': quality, 'mood': mood}
+
+
+def test_summarize_groups_by_local_date():
+    records = [
+        # 23:30 по Москве 1 декабря - это 20:30 UTC
+        record(datetime(2024, 12, 1, 20, 30, tzinfo=UTC), 7.5, quality=4, mood=3),
+        record(datetime(2024, 12, 2, 11, 0, tzinfo=UTC), 0.5, quality=2),
+        # 01:00 по Москве 3 декабря - это 22:00 UTC 2 декабря
+        record(datetime(2024, 12, 2, 22, 0, tzinfo=UTC), 9),
+    ]
+
+    assert summarize(5, records, 'Europe/Moscow', 8.0) == [
+        {'user_id': 5, 'sleep_date': date(2024, 12, 1), 'total_seconds': 27000, 'sessions': 1,
+         'avg_quality': 4.0, 'avg_mood': 3.0, 'sleep_goal': 8.0, 'goal_attainment': 0.938},
+        {'user_id': 5, 'sleep_date': date(2024, 12, 2), 'total_seconds': 1800, 'sessions': 1,
+         'avg_quality': 2.0, 'avg_mood': None, 'sleep_goal': 8.0, 'goal_attainment': 0.062},
+        {'user_id': 5, 'sleep_date': date(2024, 12, 3), 'total_seconds': 32400, 'sessions': 1,
+         'avg_quality': None, 'avg_mood': None, 'sleep_goal': 8.0, 'goal_attainment': 1.125},
+    ]
+    assert summarize(5, records[:1], None, None)[0]['goal_attainment'] is None
+
+
+@patch("db.summary.execute_values_pg")
+@patch("db.summary.execute_query_pg")
+def test_refresh_reads_only_the_sessions_day(mock_execute_query_pg, mock_execute_values_pg):
+    sleep_time = datetime(2024, 12, 1, 20, 30, tzinfo=UTC)
+    user, last, day = MagicMock(), MagicMock(), MagicMock()
+    user.fetchone.return_value = {'time_zone': 'Europe/Moscow', 'sleep_goal': 8.0}
+    last.fetchone.return_value = {'sleep_time': sleep_time}
+    day.fetchall.return_value = [record(sleep_time, 8, quality=5)]
+    mock_execute_query_pg.side_effect = [user, last, day]
+
+    row = refresh_daily_summary(5)
+
+    assert row['sleep_date'] == date(2024, 12, 1) and row['goal_attainment'] == 1.0
+    assert mock_execute_query_pg.call_args_list[2].args[1] == {
+        'user_id': 5,
+        'start': datetime(2024, 11, 30, 21, tzinfo=UTC),
+        'end': datetime(2024, 12, 1, 21, tzinfo=UTC),
+    }
+    mock_execute_values_pg.assert_called_once_with(DAILY_SUMMARY_UPSERT_SQL, [row], DAILY_SUMMARY_TEMPLATE)
+
+
+@patch("db.summary.execute_query_pg", side_effect=Exception('connection lost'))
+def test_refresh_never_raises(mock_execute_query_pg):
+    assert refresh_daily_summary(5) is None
+
+
+@patch("db.summary.execute_values_pg")
+@patch("db.summary.execute_query_pg")
+def test_backfill_pages_users_by_id(mock_execute_query_pg, mock_execute_values_pg):
+    sleep_time = datetime(2024, 12, 1, 20, 30, tzinfo=UTC)
+    first_users, first_records, last_users = MagicMock(), MagicMock(), MagicMock()
+    first_users.fetchall.return_value = [{'id': 1, 'time_zone': 'UTC', 'sleep_goal': 8.0},
+                                         {'id': 2, 'time_zone': None, 'sleep_goal': None}]
+    first_records.fetchall.return_value = [{'user_id': 2, **record(sleep_time, 6)}]
+    last_users.fetchall.return_value = []
+    mock_execute_query_pg.side_effect = [first_users, first_records, MagicMock(), last_users]
+
+    assert backfill_daily_summary(batch_size=2) == 1
+
+    assert mock_execute_query_pg.call_args_list[1].args[1] == {'after': -2 ** 63, 'last': 2}
+    assert mock_execute_query_pg.call_args_list[3].args[1] == {'after': 2, 'limit': 2}
+    rows = mock_execute_values_pg.call_args.args[1]
+    assert [(row['user_id'], row['total_seconds']) for row in rows] == [(2, 21600)]
+
+
+def test_summary_follows_session_and_ratings_on_sqlite(sqlite_backend):
+    # 23:30 по Москве, восемь часов сна
+    sleep_time = datetime(2024, 12, 1, 20, 30, tzinfo=UTC)
+    save_user_to_db(7101, 'sleeper', time_zone='Europe/Moscow')
+    start_sleep_session_db(7101, sleep_time)
+    finish_sleep_session_db(7101, sleep_time + timedelta(hours=8))
+    save_sleep_quality_db(7101, 5)
+    save_mood_db(7101, 4)
+
+    assert [dict(row) for row in get_daily_sleep_summary(7101, days=100_000)] == [{
+        'sleep_date': date(2024, 12, 1), 'total_seconds': 28800, 'sessions': 1, 'avg_quality': 5.0,
+        'avg_mood': 4.0, 'sleep_goal': 8.0, 'goal_attainment': 1.0,
+    }]
+
+    # Дневной сон в тот же день дополняет сводку
+    start_sleep_session_db(7101, sleep_time + timedelta(hours=15))
+    finish_sleep_session_db(7101, sleep_time + timedelta(hours=17))
+    summary = get_daily_sleep_summary(7101, days=100_000)
+    assert [(row['sleep_date'], row['total_seconds'], row['sessions']) for row in summary] == \
+        [(date(2024, 12, 2), 7200, 1), (date(2024, 12, 1), 28800, 1)]
+
+    # Построение заново дает те же строки
+    assert backfill_daily_summary() == 2
+    assert get_daily_sleep_summary(7101, days=100_000) == summary
+
+    delete_sleep_records_db(7101)
+    assert get_daily_sleep_summary(7101, days=100_000) == []
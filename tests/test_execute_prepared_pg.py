@@ -0,0 +1,72 @@
+import pytest
+from unittest.mock import patch, MagicMock, call
+from psycopg2 import errors, extensions
+
+from db.execute_query.execute_pg import execute_prepared_pg, close_pool, PreparedStatement
+
+
+@pytest.fixture(autouse=True)
+def reset_pool():
+    close_pool()
+    yield
+    close_pool()
+
+
+def make_connection(mock_cursor):
+    mock_connection = MagicMock()
+    mock_connection.closed = 0
+    mock_connection.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    mock_connection.cursor.return_value = mock_cursor
+    return mock_connection
+
+
+statement = PreparedStatement(
+    'get_user_time_zone',
+    'SELECT time_zone FROM public.users WHERE id = %(user_id)s',
+    {'user_id': 'bigint'}
+)
+
+
+def test_prepared_statement_sql():
+    assert statement.prepare_sql == \
+        'PREPARE get_user_time_zone (bigint) AS SELECT time_zone FROM public.users WHERE id = $1'
+    assert statement.execute_sql == 'EXECUTE get_user_time_zone (%(user_id)s)'
+
+
+@patch("psycopg2.connect")
+def test_execute_prepared_pg_prepares_once_per_connection(mock_connect):
+    mock_cursor = MagicMock()
+    mock_connection = make_connection(mock_cursor)
+    mock_connect.return_value = mock_connection
+
+    assert execute_prepared_pg(statement, {'user_id': 1}) == mock_cursor
+    assert execute_prepared_pg(statement, {'user_id': 2}) == mock_cursor
+
+    assert mock_cursor.execute.call_args_list == [
+        call(statement.prepare_sql),
+        call(statement.execute_sql, {'user_id': 1}),
+        call(statement.execute_sql, {'user_id': 2}),
+    ]
+    assert mock_connection.commit.call_count == 2
+
+
+@patch("psycopg2.connect")
+def test_execute_prepared_pg_reprepares_missing_statement(mock_connect):
+    mock_cursor = MagicMock()
+    mock_connection = make_connection(mock_cursor)
+    mock_connect.return_value = mock_connection
+
+    execute_prepared_pg(statement, {'user_id': 1})
+    # Сервер потерял подготовленный запрос (например, после DISCARD ALL)
+    mock_cursor.execute.side_effect = [errors.InvalidSqlStatementName(), None, None]
+    mock_cursor.execute.reset_mock()
+
+    result = execute_prepared_pg(statement, {'user_id': 1})
+
+    assert result == mock_cursor
+    mock_connection.rollback.assert_called_once()
+    assert mock_cursor.execute.call_args_list == [
+        call(statement.execute_sql, {'user_id': 1}),
+        call(statement.prepare_sql),
+        call(statement.execute_sql, {'user_id': 1}),
+    ]
@@ -1,16 +1,31 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from db.execute_query.execute_pg import execute_query_pg
+from db.execute_query.execute_pg import execute_query_pg, execute_values_pg, close_pool
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 
+
+@pytest.fixture(autouse=True)
+def reset_pool():
+    close_pool()
+    yield
+    close_pool()
+
+
+def make_connection(mock_cursor):
+    mock_connection = MagicMock()
+    mock_connection.closed = 0
+    mock_connection.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    mock_connection.cursor.return_value = mock_cursor
+    return mock_connection
+
 @patch("psycopg2.connect")
 def test_execute_query_pg_success(mock_connect):
     # Mock the connection and cursor
     mock_cursor = MagicMock()
-    mock_connection = MagicMock()
-    mock_connect.return_value.__enter__.return_value = mock_connection
-    mock_connection.cursor.return_value = mock_cursor
+    mock_connection = make_connection(mock_cursor)
+    mock_connect.return_value = mock_connection
 
     # Define the test query and parameters
     query = "SELECT * FROM public.users WHERE id = %(user_id)s"
@@ -34,9 +49,8 @@ def test_execute_query_pg_success(mock_connect):
 def test_execute_query_pg_no_params(mock_connect):
     # Mock the connection and cursor
     mock_cursor = MagicMock()
-    mock_connection = MagicMock()
-    mock_connect.return_value.__enter__.return_value = mock_connection
-    mock_connection.cursor.return_value = mock_cursor
+    mock_connection = make_connection(mock_cursor)
+    mock_connect.return_value = mock_connection
 
     # Define the test query
     query = "SELECT * FROM public.users"
@@ -76,9 +90,8 @@ def test_execute_query_pg_operational_error(mock_connect):
 def test_execute_query_pg_general_exception(mock_connect):
     # Mock the connection and cursor
     mock_cursor = MagicMock()
-    mock_connection = MagicMock()
-    mock_connect.return_value.__enter__.return_value = mock_connection
-    mock_connection.cursor.return_value = mock_cursor
+    mock_connection = make_connection(mock_cursor)
+    mock_connect.return_value = mock_connection
 
     # Mock the cursor to raise an exception on execute
     mock_cursor.execute.side_effect = Exception("Query failed")
@@ -92,4 +105,48 @@ def test_execute_query_pg_general_exception(mock_connect):
     # Assert that the connection and cursor were used as expected
     mock_connect.assert_called_once()
     mock_connection.cursor.assert_called_once()
-    mock_cursor.execute.assert_called_once_with("SELECT 1")
\ No newline at end of file
+    mock_cursor.execute.assert_called_once_with("SELECT 1")
+
+@patch("psycopg2.connect")
+def test_execute_query_pg_reuses_pooled_connection(mock_connect):
+    mock_cursor = MagicMock()
+    mock_connect.return_value = make_connection(mock_cursor)
+
+    execute_query_pg("SELECT 1")
+    execute_query_pg("SELECT 2")
+
+    # Второй запрос выполняется на том же соединении из пула
+    mock_connect.assert_called_once()
+    assert mock_cursor.execute.call_count == 2
+
+
+@patch("psycopg2.connect")
+def test_execute_query_pg_discards_broken_connection(mock_connect):
+    mock_cursor = MagicMock()
+    mock_cursor.execute.side_effect = psycopg2.OperationalError("Server closed the connection")
+    broken_connection = make_connection(mock_cursor)
+    mock_connect.return_value = broken_connection
+
+    assert execute_query_pg("SELECT 1") is None
+    broken_connection.close.assert_called_once()
+
+    # После сетевой ошибки открывается новое соединение
+    mock_cursor.execute.side_effect = None
+    execute_query_pg("SELECT 1")
+    assert mock_connect.call_count == 2
+
+
+@patch("db.execute_query.execute_pg.execute_values")
+@patch("psycopg2.connect")
+def test_execute_values_pg_commits_once(mock_connect, mock_execute_values):
+    mock_cursor = MagicMock()
+    mock_connection = make_connection(mock_cursor)
+    mock_connect.return_value = mock_connection
+
+    query = "INSERT INTO public.users (id) VALUES %s"
+    rows = [{'user_id': 1}, {'user_id': 2}]
+    result = execute_values_pg(query, rows, '(%(user_id)s)')
+
+    mock_execute_values.assert_called_once_with(mock_cursor, query, rows, template='(%(user_id)s)', page_size=1000)
+    mock_connection.commit.assert_called_once()
+    assert result == mock_cursor
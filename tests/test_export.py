@@ -0,0 +1,123 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from unittest.mock import patch
+
+from db.db import save_user_to_db, start_sleep_session_db, finish_sleep_session_db
+from db.execute_query.execute_pg import stream_query_pg
+from db.export import export_sleep_records, NDJSON, PARQUET
+
+
+def read_csv(export):
+    return list(csv.reader(io.TextIOWrapper(gzip.GzipFile(mode='rb', fileobj=export.file), encoding='utf-8', newline='')))
+
+
+@patch("db.execute_query.execute_pg.get_pool")
+def test_stream_uses_server_side_cursor(mock_get_pool):
+    conn = mock_get_pool.return_value.getconn.return_value
+    conn.closed = 0
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchmany.side_effect = [[{'id': 1}, {'id': 2}], [{'id': 3}], []]
+
+    assert list(stream_query_pg('SELECT id FROM public.sleep_records', None, chunk_size=2)) == \
+        [[{'id': 1}, {'id': 2}], [{'id': 3}]]
+
+    assert conn.cursor.call_args.kwargs['name'].startswith('stream_')
+    assert cursor.itersize == 2
+    cursor.fetchmany.assert_called_with(2)
+    conn.commit.assert_called_once()
+    mock_get_pool.return_value.putconn.assert_called_once_with(conn, close=False)
+
+
+@patch("db.execute_query.execute_pg.get_pool")
+def test_abandoned_stream_returns_connection(mock_get_pool):
+    conn = mock_get_pool.return_value.getconn.return_value
+    conn.closed = 0
+    conn.cursor.return_value.__enter__.return_value.fetchmany.return_value = [{'id': 1}]
+
+    stream = stream_query_pg('SELECT id FROM public.sleep_records')
+    next(stream)
+    stream.close()
+
+    conn.commit.assert_not_called()
+    conn.rollback.assert_called_once()
+    mock_get_pool.return_value.putconn.assert_called_once_with(conn, close=False)
+
+
+@patch("db.export.stream_query_pg")
+def test_export_writes_chunks_to_gzip_csv(mock_stream_query_pg):
+    sleep_time = datetime(2024, 12, 1, 20, 30, tzinfo=timezone.utc)
+    mock_stream_query_pg.return_value = iter([
+        [{'id': 2, 'user_id': 5, 'sleep_time': sleep_time, 'wake_time': None, 'sleep_quality': None, 'mood': None}],
+        [{'id': 1, 'user_id': 5, 'sleep_time': sleep_time - timedelta(days=1),
+          'wake_time': sleep_time - timedelta(hours=16), 'sleep_quality': 4, 'mood': 3}],
+    ])
+
+    with export_sleep_records(5, chunk_size=1) as export:
+        assert export.rowcount == 2
+        assert export.file_name == 'sleep_data_5.csv.gz'
+        assert read_csv(export) == [
+            ['id', 'user_id', 'sleep_time', 'wake_time', 'sleep_quality', 'mood'],
+            ['2', '5', '2024-12-01 20:30:00+00:00', '', '', ''],
+            ['1', '5', '2024-11-30 20:30:00+00:00', '2024-12-01 04:30:00+00:00', '4', '3'],
+        ]
+    assert mock_stream_query_pg.call_args.args[1:] == ({'user_id': 5}, 1)
+
+
+@patch("db.export.stream_query_pg")
+def test_export_ndjson_and_parquet_keep_types(mock_stream_query_pg):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    sleep_time = datetime(2024, 12, 1, 20, 30, tzinfo=timezone.utc)
+    rows = [
+        {'id': 2, 'user_id': 5, 'sleep_time': sleep_time, 'wake_time': None, 'sleep_quality': None, 'mood': None},
+        {'id': 1, 'user_id': 5, 'sleep_time': sleep_time - timedelta(days=1),
+         'wake_time': sleep_time - timedelta(hours=16), 'sleep_quality': 4, 'mood': 3},
+    ]
+
+    mock_stream_query_pg.return_value = iter([rows[:1], rows[1:]])
+    with export_sleep_records(5, NDJSON) as export:
+        assert export.file_name == 'sleep_data_5.ndjson.gz'
+        lines = gzip.GzipFile(mode='rb', fileobj=export.file).read().decode().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'id': 2, 'user_id': 5, 'sleep_time': '2024-12-01T20:30:00+00:00', 'wake_time': None,
+         'sleep_quality': None, 'mood': None},
+        {'id': 1, 'user_id': 5, 'sleep_time': '2024-11-30T20:30:00+00:00', 'wake_time': '2024-12-01T04:30:00+00:00',
+         'sleep_quality': 4, 'mood': 3},
+    ]
+
+    mock_stream_query_pg.return_value = iter([rows[:1], rows[1:]])
+    with export_sleep_records(5, PARQUET) as export:
+        assert export.rowcount == 2 and export.file_name == 'sleep_data_5.parquet'
+        parquet = pyarrow_parquet.ParquetFile(export.file)
+        assert parquet.metadata.num_row_groups == 2
+        assert str(parquet.schema_arrow.field('sleep_time').type) == 'timestamp[us, tz=UTC]'
+        assert str(parquet.schema_arrow.field('mood').type) == 'int16'
+        assert parquet.read().to_pylist() == rows
+
+
+@patch("db.export.stream_query_pg", side_effect=Exception('connection lost'))
+def test_export_error_returns_none(mock_stream_query_pg):
+    assert export_sleep_records(5) is None
+
+
+def test_export_on_sqlite(sqlite_backend, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sleep_time = datetime(2024, 12, 1, 20, 30, tzinfo=timezone.utc)
+    save_user_to_db(7201, 'sleeper')
+    for day in range(3):
+        start_sleep_session_db(7201, sleep_time + timedelta(days=day))
+        finish_sleep_session_db(7201, sleep_time + timedelta(days=day, hours=8))
+
+    with export_sleep_records(7201, chunk_size=2) as export:
+        rows = read_csv(export)
+    assert export.rowcount == 3
+    assert [row[2] for row in rows[1:]] == [str(sleep_time + timedelta(days=day)) for day in (2, 1, 0)]
+    # Рабочий каталог не используется
+    assert all(path.name.startswith('bot.sqlite') for path in tmp_path.iterdir())
+
+    with export_sleep_records(7202) as export:
+        assert export.rowcount == 0
@@ -0,0 +1,145 @@
+from datetime import datetime, timezone
+import sqlite3
+
+import pytest
+from unittest.mock import patch, MagicMock
+from psycopg2 import extensions
+
+from db.execute_query.execute_pg import close_pool
+from db.execute_query.sharding import ShardMap, set_shard_map
+from db.migration import migration_sqlite_to_pg
+
+
+@pytest.fixture(autouse=True)
+def reset_pool():
+    close_pool()
+    yield
+    close_pool()
+
+
+@pytest.fixture
+def sqlite_db():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript('''
+        CREATE TABLE sleep_records (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id), sleep_time TEXT, wake_time TEXT
+        );
+        CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, sleep_goal REAL DEFAULT 8.0);
+    ''')
+    conn.executemany('INSERT INTO users (id, username) VALUES (?, ?)',
+                     [(1, "o'brien"), (2, 'bob'), (3, None)])
+    conn.executemany('INSERT INTO sleep_records (id, user_id, sleep_time) VALUES (?, ?, ?)',
+                     [(10, 1, '2024-01-01 23:00:00+03:00'), (11, 2, '2024-01-02 23:00:00+03:00')])
+    # Секции sleep_records создаются на основном сервере через пул (test_migration_creates_partitions_for_history)
+    with patch('db.migration.connect_sl', return_value=conn), \
+            patch('db.migration.ensure_sleep_record_partitions_between', return_value=True):
+        yield conn
+
+
+def make_connection(progress=None):
+    mock_cursor = MagicMock()
+    mock_cursor.fetchone.side_effect = lambda: progress.pop(0) if progress else None
+    mock_connection = MagicMock()
+    mock_connection.closed = 0
+    mock_connection.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    mock_connection.cursor.return_value = mock_cursor
+    return mock_connection, mock_cursor
+
+
+def progress_updates(mock_cursor):
+    return [c.args[1] for c in mock_cursor.execute.call_args_list
+            if 'INSERT INTO public.migration_progress (table_name, last_rowid' in c.args[0]]
+
+
+@patch('db.migration.execute_values')
+@patch('psycopg2.connect')
+def test_migration_copies_tables_in_batches(mock_connect, mock_execute_values, sqlite_db):
+    mock_connection, mock_cursor = make_connection()
+    mock_connect.return_value = mock_connection
+
+    assert migration_sqlite_to_pg(batch_size=2) == {'users': 3, 'sleep_records': 2}
+
+    # Родительская таблица переносится раньше ссылающейся на нее, значения передаются параметрами
+    batches = [(c.args[1], c.args[2]) for c in mock_execute_values.call_args_list]
+    assert batches == [
+        ('INSERT INTO "users" ("id", "username", "sleep_goal") VALUES %s ON CONFLICT DO NOTHING',
+         [(1, "o'brien", 8.0), (2, 'bob', 8.0)]),
+        ('INSERT INTO "users" ("id", "username", "sleep_goal") VALUES %s ON CONFLICT DO NOTHING',
+         [(3, None, 8.0)]),
+        ('INSERT INTO "sleep_records" ("id", "user_id", "sleep_time", "wake_time") VALUES %s ON CONFLICT DO NOTHING',
+         [(10, 1, '2024-01-01 23:00:00+03:00', None), (11, 2, '2024-01-02 23:00:00+03:00', None)]),
+    ]
+    assert progress_updates(mock_cursor) == [('users', 2, 2), ('users', 3, 1), ('sleep_records', 11, 2)]
+    # Каждая пачка фиксируется вместе с отметкой о прогрессе
+    assert mock_connection.commit.call_count >= 3
+
+
+@patch('db.migration.execute_values')
+@patch('psycopg2.connect')
+def test_migration_resumes_after_interruption(mock_connect, mock_execute_values, sqlite_db):
+    mock_connection, mock_cursor = make_connection([
+        {'last_rowid': 2, 'rows_copied': 2, 'finished': False},
+        {'last_rowid': None, 'rows_copied': 0, 'finished': True},
+    ])
+    mock_connect.return_value = mock_connection
+
+    assert migration_sqlite_to_pg(batch_size=2) == {'users': 1, 'sleep_records': 0}
+
+    assert [c.args[2] for c in mock_execute_values.call_args_list] == [[(3, None, 8.0)]]
+    assert progress_updates(mock_cursor) == [('users', 3, 1)]
+
+
+@patch('db.migration.execute_values', side_effect=Exception('connection lost'))
+@patch('psycopg2.connect')
+def test_migration_error_returns_none(mock_connect, mock_execute_values, sqlite_db):
+    mock_connection, mock_cursor = make_connection()
+    mock_connect.return_value = mock_connection
+
+    assert migration_sqlite_to_pg(batch_size=2) is None
+    assert progress_updates(mock_cursor) == []
+
+
+@patch('db.migration.execute_values')
+@patch('psycopg2.connect')
+def test_migration_creates_partitions_for_history(mock_connect, mock_execute_values, sqlite_db):
+    mock_connection, mock_cursor = make_connection()
+    mock_connect.return_value = mock_connection
+    loaded_before = []
+
+    def ensure(first, last):
+        loaded_before.append(mock_execute_values.call_count)
+        return True
+
+    with patch('db.migration.ensure_sleep_record_partitions_between', side_effect=ensure) as mock_ensure:
+        assert migration_sqlite_to_pg(batch_size=2) == {'users': 3, 'sleep_records': 2}
+
+    # Секции на весь диапазон истории (UTC) создаются до загрузки sleep_records
+    mock_ensure.assert_called_once_with(datetime(2024, 1, 1, 20, tzinfo=timezone.utc),
+                                        datetime(2024, 1, 2, 20, tzinfo=timezone.utc))
+    assert loaded_before == [2]
+
+
+@patch('db.migration.execute_values')
+@patch('psycopg2.connect')
+def test_migration_stops_without_partitions(mock_connect, mock_execute_values, sqlite_db):
+    mock_connection, mock_cursor = make_connection()
+    mock_connect.return_value = mock_connection
+
+    with patch('db.migration.ensure_sleep_record_partitions_between', return_value=False):
+        assert migration_sqlite_to_pg(batch_size=2) is None
+    assert progress_updates(mock_cursor) == [('users', 2, 2), ('users', 3, 1)]
+
+
+@patch('db.migration.execute_values')
+@patch('psycopg2.connect')
+def test_migration_refuses_sharded_database(mock_connect, mock_execute_values, sqlite_db):
+    set_shard_map(ShardMap.from_dict({'buckets': 4, 'shards': {'s0': None, 's1': 'dsn-s1'}}))
+    try:
+        assert migration_sqlite_to_pg(batch_size=2) is None
+    finally:
+        set_shard_map(None)
+
+    # Пользователи не переносятся в базу, где их не найдут функции доступа к данным
+    mock_connect.assert_not_called()
+    mock_execute_values.assert_not_called()
@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import threading
+from datetime import date
+
+import pytest
+
+from executors.cpu_tasks import render_sleep_chart
+from executors.offload import BoundedExecutor
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_runs_in_thread_with_context():
+    executor = BoundedExecutor('test', max_workers=2, max_queue=0)
+    request_id.set(42)
+
+    def work():
+        return threading.current_thread().name, request_id.get()
+
+    thread_name, value = await executor.run(work)
+    executor.shutdown()
+
+    assert thread_name.startswith('offload-test')
+    assert value == 42
+    assert executor.stats()['completed'] == 1
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_limits_in_flight_tasks():
+    executor = BoundedExecutor('test', max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    first = asyncio.create_task(executor.run(release.wait, 5))
+    await asyncio.sleep(0.05)
+    second = asyncio.create_task(executor.run(lambda: 'done'))
+    await asyncio.sleep(0.05)
+
+    stats = executor.stats()
+    assert stats['in_flight'] == 1
+    assert stats['saturation'] == 1.0
+    assert stats['waited'] == 1
+
+    release.set()
+    assert await second == 'done'
+    await first
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_counts_failures():
+    executor = BoundedExecutor('test', max_workers=1, max_queue=1)
+
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        await executor.run(fail)
+    executor.shutdown()
+
+    assert executor.stats()['failed'] == 1
+
+
+def test_render_sleep_chart_returns_png():
+    png = render_sleep_chart([date(2024, 12, 1), date(2024, 12, 2)], [7.5, 8.0])
+
+    assert png.startswith(b'\x89PNG')
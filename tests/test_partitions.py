@@ -0,0 +1,55 @@
+from datetime import date, datetime, timezone
+
+from unittest.mock import patch, MagicMock
+
+from db.partitions import add_months, create_partition_sql, ensure_sleep_record_partitions, \
+    drop_expired_sleep_record_partitions
+
+
+def test_month_arithmetic_and_partition_bounds():
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert create_partition_sql(date(2024, 12, 1)) == (
+        'CREATE TABLE IF NOT EXISTS public.sleep_records_2024_12 PARTITION OF public.sleep_records '
+        "FOR VALUES FROM ('2024-12-01 00:00:00+00') TO ('2025-01-01 00:00:00+00')"
+    )
+
+
+@patch("db.partitions.current_month", return_value=date(2024, 12, 1))
+@patch("db.partitions.execute_query_pg")
+def test_ensure_partitions_creates_months_ahead(mock_execute_query_pg, mock_current_month):
+    assert ensure_sleep_record_partitions(months_ahead=2) == \
+        ['sleep_records_2024_12', 'sleep_records_2025_01', 'sleep_records_2025_02']
+
+    mock_execute_query_pg.assert_called_once_with(';\n'.join(
+        create_partition_sql(month) for month in (date(2024, 12, 1), date(2025, 1, 1), date(2025, 2, 1))
+    ))
+
+
+@patch("db.partitions.invalidate_users")
+@patch("db.partitions.current_month", return_value=date(2025, 1, 1))
+@patch("db.partitions.execute_query_pg")
+def test_retention_drops_whole_partitions(mock_execute_query_pg, mock_current_month, mock_invalidate_users):
+    guards, partitions = MagicMock(), MagicMock()
+    guards.fetchall.return_value = [{'id': 5}]
+    partitions.fetchall.return_value = [{'relname': name} for name in (
+        'sleep_records_2024_05', 'sleep_records_2024_06', 'sleep_records_2024_07', 'sleep_records_2025_01'
+    )]
+    mock_execute_query_pg.side_effect = [guards, partitions, MagicMock()]
+
+    assert drop_expired_sleep_record_partitions(retention_months=6) == \
+        ['sleep_records_2024_05', 'sleep_records_2024_06']
+
+    assert mock_execute_query_pg.call_args_list[0].args[1] == {'cutoff': datetime(2024, 7, 1, tzinfo=timezone.utc)}
+    mock_invalidate_users.assert_called_once_with([5])
+    mock_execute_query_pg.assert_called_with(
+        'DROP TABLE IF EXISTS public.sleep_records_2024_05;\nDROP TABLE IF EXISTS public.sleep_records_2024_06'
+    )
+    # Без DELETE по строкам
+    assert not any('DELETE' in call.args[0] for call in mock_execute_query_pg.call_args_list)
+
+
+@patch("db.partitions.execute_query_pg")
+def test_retention_disabled_by_default(mock_execute_query_pg):
+    assert drop_expired_sleep_record_partitions(retention_months=0) == []
+    mock_execute_query_pg.assert_not_called()
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from pyrogram.types import User
+
+from db.db import save_user_to_db, save_reminder_time_db, start_sleep_session_db, finish_sleep_session_db, \
+    get_all_sleep_records, get_user_db, get_user_profile, get_all_user_profiles, get_daily_sleep_summary, \
+    get_sleep_record_last_db, delete_all_data_user_db
+from db.execute_query import execute_query_pg
+from db.execute_query.execute_pg import execute_transaction_pg
+from db.purge import purge_pending_users, purge_users
+from handlers.handlers import start_handler
+from handlers.user_valid import PURGE_IN_PROGRESS_TEXT
+
+SLEEP_TIME = datetime(2024, 12, 1, 20, 30, tzinfo=timezone.utc)
+
+
+def add_history(user_id: int, days: int):
+    save_user_to_db(user_id, 'sleeper')
+    save_reminder_time_db(user_id, '22:00')
+    for day in range(days):
+        start_sleep_session_db(user_id, SLEEP_TIME + timedelta(days=day))
+        finish_sleep_session_db(user_id, SLEEP_TIME + timedelta(days=day, hours=8))
+
+
+def stored_records(user_id: int) -> int:
+    return execute_query_pg('SELECT count(*) AS records FROM public.sleep_records WHERE user_id = %(user_id)s',
+                            {'user_id': user_id}).fetchone()['records']
+
+
+def queued_users() -> list[int]:
+    return [row['user_id'] for row in execute_query_pg('SELECT user_id FROM public.purge_queue').fetchall()]
+
+
+@patch("db.execute_query.execute_pg.get_pool")
+def test_transaction_commits_once(mock_get_pool):
+    conn = mock_get_pool.return_value.getconn.return_value
+    cursor = conn.cursor.return_value
+
+    assert execute_transaction_pg([('DELETE FROM public.reminders WHERE user_id = %(user_id)s', {'user_id': 1}),
+                                   ('DELETE FROM public.users WHERE id = %(user_id)s', {'user_id': 1})]) is cursor
+
+    assert cursor.execute.call_count == 2
+    conn.commit.assert_called_once()
+
+    cursor.execute.side_effect = [None, Exception('deadlock detected')]
+    assert execute_transaction_pg([('SELECT 1', None), ('SELECT 2', None)]) is None
+    assert conn.commit.call_count == 1
+    mock_get_pool.return_value.putconn.assert_called_with(conn, close=False)
+
+
+def test_small_history_is_deleted_by_cascade(sqlite_backend):
+    add_history(7401, days=3)
+
+    assert delete_all_data_user_db(7401) is True
+
+    assert get_user_db(7401) is None
+    assert get_all_sleep_records(7401) == []
+    assert get_daily_sleep_summary(7401, days=100_000) == []
+    assert execute_query_pg('SELECT * FROM public.reminders').fetchall() == []
+
+
+@patch("db.db.PURGE_INLINE_MAX_ROWS", 2)
+def test_large_history_is_hidden_and_purged_in_batches(sqlite_backend):
+    add_history(7402, days=5)
+    add_history(7403, days=1)
+
+    assert delete_all_data_user_db(7402) is False
+
+    # Пользователь скрыт сразу, записи о снах ждут фоновой задачи
+    assert get_user_profile(7402) is None
+    assert [profile['id'] for profile in get_all_user_profiles()] == [7403]
+    assert get_daily_sleep_summary(7402, days=100_000) == []
+    assert get_all_sleep_records(7402) == [] and get_sleep_record_last_db(7402) is None
+    assert stored_records(7402) == 5
+
+    # Бюджет одного запуска: две пачки по две записи
+    assert purge_pending_users(batch_size=2, max_batches=2) == []
+    assert stored_records(7402) == 1
+    assert queued_users() == [7402]
+
+    assert purge_pending_users(batch_size=2, max_batches=2) == [7402]
+    assert get_user_db(7402) is None
+    assert stored_records(7402) == 0
+    assert queued_users() == []
+    assert len(get_all_sleep_records(7403)) == 1
+
+
+def test_admin_bulk_purge(sqlite_backend):
+    for user_id in (7404, 7405, 7406):
+        add_history(user_id, days=2)
+
+    assert purge_users([7404, 7405, 7404, 7499]) == 3
+    assert sorted(queued_users()) == [7404, 7405]
+    assert [profile['id'] for profile in get_all_user_profiles()] == [7406]
+
+    assert sorted(purge_pending_users()) == [7404, 7405]
+    assert get_user_db(7404) is None and get_user_db(7405) is None
+    assert len(get_all_sleep_records(7406)) == 2
+
+
+@pytest.mark.asyncio
+@patch("db.db.PURGE_INLINE_MAX_ROWS", 2)
+async def test_start_while_queued_waits_for_purge(sqlite_backend):
+    add_history(7407, days=3)
+    assert delete_all_data_user_db(7407) is False
+
+    message = AsyncMock()
+    message.from_user = User(id=7407, first_name='Sleeper')
+    message.reply_text.return_value = AsyncMock(id=42)
+
+    # Пока история удаляется, пользователь не регистрируется заново и узнает об этом
+    assert await start_handler(AsyncMock(), message) == 42
+    message.reply_text.assert_called_once_with(PURGE_IN_PROGRESS_TEXT)
+    assert queued_users() == [7407]
+
+    assert purge_pending_users() == [7407]
+    message.reply_text.reset_mock()
+    await start_handler(AsyncMock(), message)
+    assert get_user_db(7407) == (7407,) and queued_users() == []
+    assert stored_records(7407) == 0
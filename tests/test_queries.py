@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+
+import pytest
+from unittest.mock import MagicMock
+
+from db.db import save_user_to_db, save_reminder_time_db, start_sleep_session_db, get_user_profile, \
+    get_sleep_record_last_db
+from db.queries import Query, Record
+
+profile_query = Query(
+    'get_profile',
+    '''
+        SELECT {columns} FROM public.users u
+        LEFT JOIN public.reminders r ON r.user_id = u.id
+        WHERE u.id = %(user_id)s
+    ''',
+    ('u.id', 'r.reminder_time', 'u.open_sleep_time AS sleep_time'),
+    param_types={'user_id': 'bigint'}
+)
+
+
+def test_query_declares_projection_and_bound():
+    assert profile_query.sql == '''
+        SELECT u.id, r.reminder_time, u.open_sleep_time AS sleep_time FROM public.users u
+        LEFT JOIN public.reminders r ON r.user_id = u.id
+        WHERE u.id = %(user_id)s
+        LIMIT 1'''
+    assert profile_query.record._fields == ('id', 'reminder_time', 'sleep_time')
+    # Prepared statement выполняет тот же ограниченный запрос
+    assert profile_query.statement.prepare_sql.endswith('WHERE u.id = $1\n        LIMIT 1')
+
+    scan = Query('get_ids', 'SELECT {columns} FROM public.users', ('id',), limit=None)
+    assert scan.sql == 'SELECT id FROM public.users' and scan.statement is None
+    assert Query('get_recent', 'SELECT {columns} FROM public.users', ('id',), limit=10).sql == \
+        'SELECT id FROM public.users LIMIT 10'
+    with pytest.raises(ValueError):
+        Query('get_none', 'SELECT {columns} FROM public.users', ('id',), limit=0)
+
+
+def test_load_returns_compact_records():
+    cursor = MagicMock()
+    cursor.fetchone.return_value = (1, '22:00', None)
+    record = profile_query.load(cursor)
+
+    assert isinstance(record, Record) and isinstance(record, tuple)
+    assert not hasattr(record, '__dict__')
+    assert record.reminder_time == record['reminder_time'] == record[1] == '22:00'
+    assert record.get('sleep_time', 'none') is None and record.get('city_name', 'none') == 'none'
+    assert dict(record) == {'id': 1, 'reminder_time': '22:00', 'sleep_time': None}
+    with pytest.raises(KeyError):
+        record['city_name']
+
+    cursor.fetchone.return_value = None
+    assert profile_query.load(cursor) is None
+
+    cursor.fetchall.return_value = [(1,), (2,)]
+    assert [row.id for row in Query('get_ids', 'SELECT {columns} FROM t', ('id',), limit=None).load(cursor)] == [1, 2]
+
+
+def test_records_on_sqlite(sqlite_backend):
+    sleep_time = datetime(2024, 12, 1, 20, 30, tzinfo=timezone.utc)
+    save_user_to_db(7601, 'sleeper', time_zone='Europe/Moscow')
+    save_reminder_time_db(7601, '22:00')
+    start_sleep_session_db(7601, sleep_time)
+
+    profile = get_user_profile(7601)
+    assert (profile.id, profile['time_zone'], profile.reminder_time) == (7601, 'Europe/Moscow', '22:00')
+    # Типы столбцов приводятся так же, как для строк-словарей
+    assert profile.open_sleep_time == sleep_time
+    assert get_sleep_record_last_db(7601) == (sleep_time, None)
@@ -0,0 +1,61 @@
+import pytest
+from unittest.mock import patch
+
+from db.db import exception_handler, get_all_users, get_user_db
+from db.metrics import get_query_stats, reset_query_stats, record_call, CallArgs
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    reset_query_stats()
+    yield
+    reset_query_stats()
+
+
+@exception_handler
+def failing_accessor(user_id):
+    raise ValueError('boom')
+
+
+@patch("db.db.execute_query_pg")
+def test_accessor_calls_rows_and_latency_are_recorded(mock_execute_query_pg):
+    mock_execute_query_pg.return_value.fetchall.return_value = [(1,) + (None,) * 9, (2,) + (None,) * 9]
+    mock_execute_query_pg.return_value.fetchone.return_value = (1,)
+
+    get_all_users()
+    get_all_users()
+    get_user_db(1)
+
+    stats = get_query_stats()
+    assert stats['db.get_all_users']['calls'] == 2
+    assert stats['db.get_all_users']['rows'] == 4
+    assert stats['db.get_all_users']['errors'] == 0
+    assert stats['db.get_user_db']['rows'] == 1
+    assert sum(stats['db.get_all_users']['histogram'].values()) == 2
+
+
+def test_accessor_errors_are_counted():
+    assert failing_accessor(1) is None
+    assert get_query_stats()['db.failing_accessor']['errors'] == 1
+
+
+def test_stats_sorted_by_total_time_and_percentiles():
+    for elapsed in (1, 1, 1, 300):
+        record_call('db.slow', elapsed)
+    record_call('db.fast', 0.5)
+
+    stats = get_query_stats(top=1)
+    assert list(stats) == ['db.slow']
+    assert stats['db.slow']['p50_ms'] == 1
+    assert stats['db.slow']['p99_ms'] == 300
+    assert stats['db.slow']['max_ms'] == 300
+
+
+@patch("db.metrics.slow_query_logger")
+def test_slow_call_is_logged_with_lazy_arguments(mock_logger):
+    record_call('db.get_user_db', 10, 1, call_args=CallArgs((1,), {}))
+    mock_logger.warning.assert_not_called()
+
+    record_call('db.get_user_db', 5000, 1, call_args=CallArgs((1,), {'full': True}))
+    message, *args = mock_logger.warning.call_args.args
+    assert message % tuple(args) == 'Медленный вызов db.get_user_db: 5000.0 мс, строк: 1, параметры: 1, full=True'
@@ -0,0 +1,79 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import psycopg2
+from psycopg2 import extensions
+
+from db.db import get_all_users, get_user_db, QUERIES
+from db.execute_query import execute_query_pg, read_from_primary, replica_read
+from db.execute_query.execute_pg import close_pool
+from db.execute_query.pool import ConnectionPool
+from db.execute_query.routing import ReplicaSet, set_replicas
+
+
+def make_connection(name):
+    mock_connection = MagicMock(name=name)
+    mock_connection.closed = 0
+    mock_connection.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    mock_connection.cursor.return_value.server = name
+    return mock_connection
+
+
+@pytest.fixture
+def servers():
+    close_pool()
+    connections = {name: make_connection(name) for name in ('primary', 'replica1', 'replica2')}
+    down = set()
+
+    def connect(dsn=None, **kwargs):
+        name = dsn or 'primary'
+        if name in down:
+            raise psycopg2.OperationalError(f'could not connect to {name}')
+        return connections[name]
+
+    replicas = ReplicaSet([ConnectionPool(dict(dsn=name)) for name in ('replica1', 'replica2')], cooldown=60)
+    set_replicas(replicas)
+    with patch("psycopg2.connect", side_effect=connect):
+        yield connections, down, replicas
+    set_replicas(None)
+    close_pool()
+
+
+@replica_read
+def read(query):
+    return execute_query_pg(query).server
+
+
+def test_replica_reads_are_round_robin(servers):
+    assert [read('SELECT 1') for _ in range(4)] == ['replica1', 'replica2', 'replica1', 'replica2']
+    # Запросы вне replica_read идут на основной сервер
+    assert execute_query_pg('SELECT 1').server == 'primary'
+
+
+def test_down_replica_is_skipped_and_primary_is_last_resort(servers):
+    connections, down, replicas = servers
+    down.add('replica1')
+    assert [read('SELECT 1') for _ in range(3)] == ['replica2', 'replica2', 'replica2']
+    assert replicas.stats()['failovers'] == 1
+    assert replicas.stats()['replicas'][0]['down']
+
+    down.add('replica2')
+    connections['replica2'].cursor.return_value.execute.side_effect = psycopg2.OperationalError('terminated')
+    assert read('SELECT 1') == 'primary'
+    assert replicas.stats()['fallbacks'] == 1
+
+
+def test_read_from_primary_overrides_replica_read(servers):
+    with read_from_primary():
+        assert read('SELECT 1') == 'primary'
+    assert read('SELECT 1') == 'replica1'
+
+
+def test_accessor_routing(servers):
+    connections, down, replicas = servers
+    get_all_users()
+    get_user_db(1)
+
+    assert connections['replica1'].cursor.return_value.execute.call_args.args[0].split() == \
+        QUERIES['get_all_users'].sql.split()
+    assert connections['primary'].cursor.return_value.execute.call_args.args[0] == \
+        'SELECT id FROM public.users WHERE id = %(user_id)s LIMIT 1'
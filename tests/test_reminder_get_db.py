@@ -1,15 +1,13 @@
 from unittest.mock import patch, MagicMock
 
 from db import get_all_reminders, get_reminder_db, get_reminder_time_db
+from db.db import PREPARED_STATEMENTS
 
 
 @patch("db.db.execute_query_pg")
 def test_get_all_reminders(mock_execute_query_pg):
     # Create MockMagic object
-    mock_execute_query_pg.return_value.fetchall.return_value = [
-        {'user_id': 1},
-        {'user_id': 2},
-    ]
+    mock_execute_query_pg.return_value.fetchall.return_value = [(1,), (2,)]
 
     query = 'SELECT user_id FROM public.reminders'
 
@@ -17,18 +15,15 @@ def test_get_all_reminders(mock_execute_query_pg):
     result = get_all_reminders()
 
     # Assert the query was executed
-    mock_execute_query_pg.assert_called_once_with(query)
+    mock_execute_query_pg.assert_called_once_with(query, None, row_factory=False)
 
     # Assert the result is as expected
-    assert result == [{'user_id': 1}, {'user_id': 2}]
+    assert [reminder['user_id'] for reminder in result] == [1, 2]
 
 @patch("db.db.execute_query_pg")
 def test_get_reminder_db(mock_execute_query_pg):
     # Mock response from execute_query_pg
-    mock_execute_query_pg.return_value.fetchone.return_value = {
-        'user_id': 1,
-        'reminder_time': '10:00'
-    }
+    mock_execute_query_pg.return_value.fetchone.return_value = (1, '10:00')
 
     # Call the function
     user_id = 1
@@ -36,32 +31,30 @@ def test_get_reminder_db(mock_execute_query_pg):
 
     # Assert the query was executed with the correct parameters
     mock_execute_query_pg.assert_called_once_with(
-        'SELECT * FROM public.reminders WHERE user_id = %(user_id)s',
-        {'user_id': user_id}
+        'SELECT user_id, reminder_time FROM public.reminders WHERE user_id = %(user_id)s LIMIT 1',
+        {'user_id': user_id}, row_factory=False
     )
 
     # Assert the result is as expected
-    assert result == {'user_id': 1, 'reminder_time': '10:00'}
+    assert dict(result) == {'user_id': 1, 'reminder_time': '10:00'}
 
-@patch("db.db.execute_query_pg")
-def test_get_reminder_time_db(mock_execute_query_pg):
-    # Mock response from execute_query_pg
-    mock_execute_query_pg.return_value.fetchone.return_value = {
-        'reminder_time': '10:00'
-    }
+@patch("db.db.execute_prepared_pg")
+def test_get_reminder_time_db(mock_execute_prepared_pg):
+    # Mock response from execute_prepared_pg
+    mock_execute_prepared_pg.return_value.fetchone.return_value = ('10:00',)
 
     # Call the function
     user_id = 1
     result = get_reminder_time_db(user_id)
 
-    # Assert the query was executed with the correct parameters
-    mock_execute_query_pg.assert_called_once_with(
-        'SELECT reminder_time FROM public.reminders WHERE user_id = %(user_id)s',
-        {'user_id': user_id}
+    # Assert the prepared statement was executed with the correct parameters
+    mock_execute_prepared_pg.assert_called_once_with(
+        PREPARED_STATEMENTS['get_reminder_time'],
+        {'user_id': user_id}, row_factory=False
     )
 
     # Assert the result is as expected
-    assert result == {'reminder_time': '10:00'}
+    assert result.reminder_time == '10:00'
 
 @patch("db.db.execute_query_pg")
 def test_get_all_reminders_exception(mock_execute_query_pg):
@@ -85,10 +78,10 @@ def test_get_reminder_db_exception(mock_execute_query_pg):
     # Assert the result is None
     assert result is None
 
-@patch("db.db.execute_query_pg")
-def test_get_reminder_time_db_exception(mock_execute_query_pg):
+@patch("db.db.execute_prepared_pg")
+def test_get_reminder_time_db_exception(mock_execute_prepared_pg):
     # Mock exception
-    mock_execute_query_pg.side_effect = Exception("Database error")
+    mock_execute_prepared_pg.side_effect = Exception("Database error")
 
     # Call the function and assert it handles the exception
     result = get_reminder_time_db(1)
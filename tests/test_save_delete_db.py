@@ -1,9 +1,10 @@
 import re
 
 import pytest
-from unittest.mock import patch
+from unittest.mock import patch, call
 from db.db import (
     save_user_to_db,
+    save_users_bulk,
     save_user_city,
     save_user_time_zone_db,
     save_phone_number,
@@ -11,6 +12,8 @@ from db.db import (
     save_wake_time_user_db,
     save_sleep_time_records_db,
     save_wake_time_records_db,
+    start_sleep_session_db,
+    finish_sleep_session_db,
     save_sleep_quality_db,
     save_mood_db,
     save_reminder_time_db,
@@ -27,9 +30,7 @@ def test_save_user_to_db(mock_execute_query_pg):
 
     expected_query = '''
         INSERT INTO public.users (id, username, city_name)
-        VALUES (
-            %(user_id)s, %(username)s, %(city_name)s
-        )
+        VALUES (%(user_id)s, %(username)s, %(city_name)s)
         ON CONFLICT(id) DO UPDATE SET
             username = %(username)s, city_name = %(city_name)s
     '''
@@ -43,6 +44,40 @@ def test_save_user_to_db(mock_execute_query_pg):
     assert re.sub(r'\s+', ' ', expected_query.strip()) == re.sub(r'\s+', ' ', actual_query.strip())
     assert actual_params == {'user_id': 1, 'username': "test_user", 'city_name': "TestCity"}
 
+@patch("db.db.execute_query_pg")
+def test_save_user_to_db_without_fields(mock_execute_query_pg):
+    save_user_to_db(1)
+
+    mock_execute_query_pg.assert_called_once_with(
+        'INSERT INTO public.users (id) VALUES (%(user_id)s)', {'user_id': 1}
+    )
+
+
+@patch("db.db.execute_values_pg")
+def test_save_users_bulk_groups_by_columns(mock_execute_values_pg):
+    assert save_users_bulk([
+        {'user_id': 1, 'username': 'a', 'first_name': 'A'},
+        {'user_id': 2, 'username': 'b', 'first_name': 'B'},
+        {'user_id': 1, 'username': 'a2', 'last_name': None},
+        {'user_id': 3},
+    ]) == 3
+
+    assert mock_execute_values_pg.call_args_list == [
+        call('INSERT INTO public.users (id, username, first_name) VALUES %s '
+             'ON CONFLICT(id) DO UPDATE SET username = EXCLUDED.username, first_name = EXCLUDED.first_name',
+             [{'user_id': 1, 'username': 'a2', 'first_name': 'A'}, {'user_id': 2, 'username': 'b', 'first_name': 'B'}],
+             '(%(user_id)s, %(username)s, %(first_name)s)'),
+        call('INSERT INTO public.users (id) VALUES %s ON CONFLICT(id) DO NOTHING',
+             [{'user_id': 3}], '(%(user_id)s)'),
+    ]
+
+
+@patch("db.db.execute_values_pg")
+def test_save_users_bulk_rejects_unknown_columns(mock_execute_values_pg):
+    assert save_users_bulk([{'user_id': 1, 'password': 'x'}]) is None
+    mock_execute_values_pg.assert_not_called()
+
+
 # Test for save_user_city
 @patch("db.db.execute_query_pg")
 def test_save_user_city(mock_execute_query_pg):
@@ -126,6 +161,35 @@ def test_save_wake_time_records_db(mock_execute_query_pg):
     ''', {'user_id': 1, 'wake_time': "2024-12-02T07:00:00"}
     )
 
+# Test for start_sleep_session_db
+@patch("db.db.execute_query_pg")
+def test_start_sleep_session_db(mock_execute_query_pg):
+    mock_execute_query_pg.return_value.rowcount = 0
+
+    cursor = start_sleep_session_db(1, "2024-12-01T23:00:00")
+
+    mock_execute_query_pg.assert_called_once_with('''
+        INSERT INTO public.sleep_records (user_id, sleep_time)
+        VALUES (%(user_id)s, %(sleep_time)s)
+        RETURNING id, sleep_time
+    ''', {'user_id': 1, 'sleep_time': "2024-12-01T23:00:00"}
+    )
+    assert cursor.rowcount == 0
+
+# Test for finish_sleep_session_db
+@patch("db.db.execute_query_pg")
+def test_finish_sleep_session_db(mock_execute_query_pg):
+    finish_sleep_session_db(1, "2024-12-02T07:00:00")
+
+    mock_execute_query_pg.assert_called_once_with('''
+        UPDATE public.sleep_records
+        SET wake_time = %(wake_time)s
+        WHERE user_id = %(user_id)s AND wake_time IS NULL
+        AND sleep_time = (SELECT open_sleep_time FROM public.users WHERE id = %(user_id)s)
+        RETURNING sleep_time, wake_time, wake_time - sleep_time AS duration
+    ''', {'user_id': 1, 'wake_time': "2024-12-02T07:00:00"}
+    )
+
 # Test for save_sleep_quality_db
 @patch("db.db.execute_query_pg")
 def test_save_sleep_quality_db(mock_execute_query_pg):
@@ -135,12 +199,12 @@ def test_save_sleep_quality_db(mock_execute_query_pg):
         '''
             UPDATE public.sleep_records
             SET sleep_quality = %(quality)s
-            WHERE sleep_time IN (
-                SELECT sleep_time FROM public.sleep_records 
+            WHERE id = (
+                SELECT id FROM public.sleep_records
                 WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
-                ORDER BY sleep_time DESC 
+                ORDER BY sleep_time DESC
                 LIMIT 1
-            );
+            )
         ''',
         {'user_id': 1, 'quality': 4}
     )
@@ -154,12 +218,12 @@ def test_save_mood_db(mock_execute_query_pg):
         '''
             UPDATE public.sleep_records
             SET mood = %(mood)s
-            WHERE sleep_time IN (
-                SELECT sleep_time FROM public.sleep_records 
+            WHERE id = (
+                SELECT id FROM public.sleep_records
                 WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
-                ORDER BY sleep_time DESC 
+                ORDER BY sleep_time DESC
                 LIMIT 1
-            );
+            )
         ''',
         {'user_id': 1, 'mood': 3}
     )
@@ -192,10 +256,10 @@ def test_delete_reminder_db(mock_execute_query_pg):
 def test_delete_sleep_records_db(mock_execute_query_pg):
     delete_sleep_records_db(1)
 
-    mock_execute_query_pg.assert_called_once_with(
-        'DELETE FROM public.sleep_records WHERE user_id = %(user_id)s',
-        {'user_id': 1}
-    )
+    assert mock_execute_query_pg.call_args_list == [
+        call('DELETE FROM public.sleep_records WHERE user_id = %(user_id)s', {'user_id': 1}),
+        call('DELETE FROM public.daily_sleep_summary WHERE user_id = %(user_id)s', {'user_id': 1}),
+    ]
 
 # Test for delete_user_db
 @patch("db.db.execute_query_pg")
@@ -208,12 +272,38 @@ def test_delete_user_db(mock_execute_query_pg):
     )
 
 # Test for delete_all_data_user_db
-@patch("db.db.delete_sleep_records_db")
-@patch("db.db.delete_reminder_db")
-@patch("db.db.delete_user_db")
-def test_delete_all_data_user_db(mock_delete_user, mock_delete_reminder, mock_delete_sleep_records):
-    delete_all_data_user_db(1)
-
-    mock_delete_sleep_records.assert_called_once_with(1)
-    mock_delete_reminder.assert_called_once_with(1)
-    mock_delete_user.assert_called_once_with(1)
+@patch("db.db.execute_transaction_pg")
+@patch("db.db.execute_query_pg")
+def test_delete_all_data_user_db(mock_execute_query_pg, mock_execute_transaction_pg):
+    mock_execute_query_pg.return_value.fetchone.return_value = (3,)
+
+    assert delete_all_data_user_db(1) is True
+
+    # Одна команда: reminders, sleep_records и daily_sleep_summary удаляются каскадно
+    assert mock_execute_query_pg.call_args_list[-1] == call(
+        'DELETE FROM public.users WHERE id = %(user_id)s', {'user_id': 1}
+    )
+    assert mock_execute_query_pg.call_count == 2
+    mock_execute_transaction_pg.assert_not_called()
+
+
+@patch("db.db.PURGE_INLINE_MAX_ROWS", 100)
+@patch("db.db.execute_transaction_pg")
+@patch("db.db.execute_query_pg")
+def test_delete_all_data_user_db_queues_large_history(mock_execute_query_pg, mock_execute_transaction_pg):
+    mock_execute_query_pg.return_value.fetchone.return_value = (101,)
+
+    assert delete_all_data_user_db(1) is False
+
+    assert mock_execute_query_pg.call_args.args[1] == {'user_id': 1, 'limit': 101}
+    statements = mock_execute_transaction_pg.call_args.args[0]
+    assert [query.split()[:3] for query, _ in statements] == [
+        ['INSERT', 'INTO', 'public.purge_queue'],
+        ['DELETE', 'FROM', 'public.reminders'],
+        ['DELETE', 'FROM', 'public.daily_sleep_summary'],
+    ]
+
+
+@patch("db.db.execute_query_pg", return_value=None)
+def test_delete_all_data_user_db_error_returns_none(mock_execute_query_pg):
+    assert delete_all_data_user_db(1) is None
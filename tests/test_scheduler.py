@@ -0,0 +1,70 @@
+from datetime import datetime, time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from psycopg2 import extensions
+from pytz import utc
+
+from db.db import QUERIES
+from db.execute_query.execute_pg import close_pool
+from db.execute_query.pool import ConnectionPool
+from db.execute_query.routing import ReplicaSet, set_replicas
+from handlers.scheduler import calculate_bedtime, calculate_wake_up_time, calculate_weather_reminder, \
+    setup_scheduler
+
+
+def make_profile(**fields):
+    profile = {
+        'id': 1, 'time_zone': 'Europe/Moscow', 'sleep_goal': 8.0, 'wake_time': None, 'city_name': 'Moscow',
+        'has_provided_location': 1, 'reminder_time': None, 'open_sleep_time': None
+    }
+    profile.update(fields)
+    return profile
+
+
+def test_calculate_weather_reminder():
+    assert calculate_weather_reminder(make_profile(reminder_time='21:15')) == time(21, 15)
+    assert calculate_weather_reminder(make_profile()) == time(20, 0)
+
+
+def test_calculate_bedtime_from_wake_time_and_goal():
+    assert calculate_bedtime(make_profile(wake_time='07:00', sleep_goal=7.5)) == time(23, 30)
+    assert calculate_bedtime(make_profile()) is None
+
+
+def test_calculate_wake_up_time_in_user_timezone():
+    profile = make_profile(open_sleep_time=datetime(2024, 12, 1, 20, 0, tzinfo=utc))
+
+    # 23:00 по Москве + 8 часов
+    assert calculate_wake_up_time(profile) == time(7, 0)
+    assert calculate_wake_up_time(make_profile()) is None
+
+
+def make_connection(name):
+    mock_connection = MagicMock(name=name)
+    mock_connection.closed = 0
+    mock_connection.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    mock_connection.cursor.return_value.fetchall.return_value = []
+    return mock_connection
+
+
+@pytest.mark.asyncio
+@patch("handlers.scheduler.AsyncIOScheduler")
+async def test_reminder_scans_read_from_replica(mock_scheduler):
+    close_pool()
+    connections = {name: make_connection(name) for name in ('primary', 'replica')}
+    set_replicas(ReplicaSet([ConnectionPool(dict(dsn='replica'))], cooldown=60))
+    try:
+        with patch("psycopg2.connect", side_effect=lambda dsn=None, **kwargs: connections[dsn or 'primary']):
+            setup_scheduler(AsyncMock())
+            jobs = {call.args[0].__name__: call.args[0] for call in mock_scheduler.return_value.add_job.call_args_list}
+            for name in ('send_sleep_reminder', 'send_wake_up_reminder', 'daily_weather_reminder'):
+                await jobs[name]()
+    finally:
+        set_replicas(None)
+        close_pool()
+
+    # Ежеминутный обход профилей всех пользователей не нагружает основной сервер
+    queries = [call.args[0].split() for call in connections['replica'].cursor.return_value.execute.call_args_list]
+    assert queries == [QUERIES['get_all_user_profiles'].sql.split()] * 3
+    connections['primary'].cursor.return_value.execute.assert_not_called()
@@ -0,0 +1,90 @@
+import logging
+from unittest.mock import patch
+
+from db.execute_query import execute_query_pg
+from db.execute_query.execute_sqlite import split_script_sl
+from db.init import Migration, SQLITE_MIGRATIONS, SCHEMA_MIGRATION_LOCK, SCHEMA_VERSION_EXISTS_SQL, \
+    SQLITE_SCHEMA_VERSION_EXISTS_SQL, apply_migrations, database_initialize, schema_version
+
+
+def test_initialized_schema_is_checked_once(sqlite_backend):
+    assert schema_version() == SQLITE_MIGRATIONS[-1].version
+
+    with patch("db.init.execute_query_pg", wraps=execute_query_pg) as mock_execute_query_pg:
+        database_initialize()
+
+    # Схема актуальна: проверка таблицы версий и запрос версии, без DDL
+    assert [call.args[0] for call in mock_execute_query_pg.call_args_list] == [
+        SQLITE_SCHEMA_VERSION_EXISTS_SQL, 'SELECT max(version) AS version FROM public.schema_version'
+    ]
+
+
+def test_fresh_database_has_version_zero_without_errors(sqlite_backend, caplog):
+    execute_query_pg('DROP TABLE schema_version')
+
+    with caplog.at_level(logging.ERROR):
+        assert schema_version() == 0
+        assert apply_migrations() == [migration.version for migration in SQLITE_MIGRATIONS]
+    # Первый запуск на новой базе - обычный путь: ошибок в логе нет
+    assert caplog.records == []
+    assert schema_version() == SQLITE_MIGRATIONS[-1].version
+
+
+@patch("db.execute_query.execute_pg.get_pool")
+def test_fresh_postgres_version_read_skips_missing_table(mock_get_pool):
+    cursor = mock_get_pool.return_value.getconn.return_value.cursor.return_value
+    cursor.fetchone.return_value = {'present': False}
+
+    assert schema_version() == 0
+    cursor.execute.assert_called_once_with(SCHEMA_VERSION_EXISTS_SQL)
+
+
+def test_pending_migrations_applied_in_order(sqlite_backend):
+    migrations = SQLITE_MIGRATIONS + (
+        Migration(3, 'user_note', 'ALTER TABLE users ADD COLUMN note TEXT;\nUPDATE users SET note = \'-\';'),
+        Migration(4, 'user_note_index', apply=lambda: execute_query_pg('CREATE INDEX users_note_idx ON users (note)')),
+    )
+
+    assert apply_migrations(migrations) == [3, 4]
+    assert apply_migrations(migrations) == []
+    rows = execute_query_pg('SELECT version, name FROM public.schema_version ORDER BY version').fetchall()
+    assert [(row['version'], row['name']) for row in rows] == [
+        (1, 'schema'), (2, 'users_of_sleep_records'), (3, 'user_note'), (4, 'user_note_index')
+    ]
+
+
+def test_failed_migration_rolled_back(sqlite_backend):
+    migrations = SQLITE_MIGRATIONS + (
+        Migration(3, 'broken', 'ALTER TABLE users ADD COLUMN note TEXT;\nSELECT missing FROM users;'),
+        Migration(4, 'after_broken', 'ALTER TABLE users ADD COLUMN other TEXT;'),
+    )
+
+    assert apply_migrations(migrations) == []
+    assert schema_version() == 2
+    # Столбец первой половины миграции откатился вместе с ней
+    columns = [row['name'] for row in execute_query_pg('PRAGMA table_info(users)').fetchall()]
+    assert 'note' not in columns and 'other' not in columns
+
+
+@patch("db.execute_query.execute_pg.get_pool")
+def test_migration_takes_advisory_lock(mock_get_pool):
+    cursor = mock_get_pool.return_value.getconn.return_value.cursor.return_value
+    migrations = (Migration(1, 'users', 'CREATE TABLE IF NOT EXISTS public.users (id bigint)'),)
+
+    # Первая проверка: таблицы schema_version еще нет; под блокировкой - версия 0
+    with patch("db.init.schema_version", side_effect=[None, 0]):
+        assert apply_migrations(migrations) == [1]
+
+    queries = [call.args[0] for call in cursor.execute.call_args_list]
+    assert queries[0] == 'SELECT pg_advisory_xact_lock(%(key)s)'
+    assert cursor.execute.call_args_list[0].args[1] == {'key': SCHEMA_MIGRATION_LOCK}
+    assert 'CREATE TABLE IF NOT EXISTS public.schema_version' in queries[1]
+    assert queries[2] == migrations[0].sql
+    assert 'INSERT INTO public.schema_version' in queries[3]
+    mock_get_pool.return_value.getconn.return_value.commit.assert_called_once()
+
+
+def test_split_script_sl():
+    assert split_script_sl('CREATE TABLE a(x TEXT DEFAULT \';\');\n\n    CREATE TABLE b(y);\n') == [
+        "CREATE TABLE a(x TEXT DEFAULT ';');", 'CREATE TABLE b(y);'
+    ]
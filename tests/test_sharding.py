@@ -0,0 +1,163 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from unittest.mock import patch, MagicMock, call
+from psycopg2 import extensions
+from psycopg2.extensions import cursor as TupleCursor
+
+from db.db import get_all_users, get_user_db, save_users_bulk
+from db.execute_query.execute_pg import close_pool
+from db.execute_query.sharding import ShardMap, bucket_of, set_shard_map, shard_for_user, current_shard
+from db.queries import USER_COLUMNS
+from db.reshard import move_bucket, copy_users
+
+
+def make_connection(name):
+    mock_connection = MagicMock(name=name)
+    mock_connection.closed = 0
+    mock_connection.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    return mock_connection
+
+
+@pytest.fixture
+def shards():
+    close_pool()
+    connections = {name: make_connection(name) for name in ('s0', 's1')}
+    shard_map = ShardMap.from_dict({'buckets': 4, 'shards': {'s0': 'dsn-s0', 's1': 'dsn-s1'}})
+    set_shard_map(shard_map)
+    with patch("psycopg2.connect", side_effect=lambda dsn, **kwargs: connections[dsn[4:]]):
+        yield shard_map, connections
+    set_shard_map(None)
+    close_pool()
+
+
+def user_row(user_id):
+    return (user_id,) + (None,) * len(USER_COLUMNS)
+
+
+def users_on(shard_map, shard):
+    return [user_id for user_id in range(1, 100) if shard_map.shard_for(user_id) == shard]
+
+
+def test_shard_map_round_trip():
+    shard_map = ShardMap.from_dict({'buckets': 8, 'shards': {'s0': None, 's1': 'dsn'},
+                                    'assignments': {'s0': ['0-3', '6'], 's1': ['4-5', 7]}})
+    assert shard_map.assignments == ['s0'] * 4 + ['s1', 's1', 's0', 's1']
+    assert shard_map.to_dict()['assignments'] == {'s0': ['0-3', '6'], 's1': ['4-5', '7']}
+    assert ShardMap.from_dict(shard_map.to_dict()).assignments == shard_map.assignments
+
+    with pytest.raises(ValueError):
+        ShardMap.from_dict({'buckets': 4, 'shards': {'s0': None}, 'assignments': {'s0': ['0-2']}})
+
+
+def test_bucket_is_stable():
+    # Значение не должно меняться между процессами и версиями: от него зависит размещение данных
+    assert [bucket_of(user_id, 256) for user_id in (1, 42, 123456789)] == [255, 191, 105]
+    assert 0 <= bucket_of(-5, 4) < 4
+
+
+def test_user_accessor_routes_to_user_shard(shards):
+    shard_map, connections = shards
+    user_id = users_on(shard_map, 's1')[0]
+
+    get_user_db(user_id)
+
+    connections['s1'].cursor.return_value.execute.assert_called_once_with(
+        'SELECT id FROM public.users WHERE id = %(user_id)s LIMIT 1', {'user_id': user_id})
+    # Строки читаются кортежами, без словаря на строку
+    connections['s1'].cursor.assert_called_once_with(cursor_factory=TupleCursor)
+    connections['s0'].cursor.return_value.execute.assert_not_called()
+
+
+def test_scan_fans_out_and_merges(shards):
+    shard_map, connections = shards
+    connections['s0'].cursor.return_value.fetchall.return_value = [user_row(1)]
+    connections['s1'].cursor.return_value.fetchall.return_value = [user_row(2), user_row(3)]
+
+    assert sorted(row['id'] for row in get_all_users()) == [1, 2, 3]
+
+    # Недоступный шард не скрывает данные остальных
+    connections['s1'].cursor.return_value.execute.side_effect = Exception('shard is down')
+    assert get_all_users() == [user_row(1)]
+
+
+@patch("db.db.execute_values_pg")
+def test_bulk_save_is_split_by_shard(mock_execute_values_pg, shards):
+    shard_map, connections = shards
+    s0_user, s1_user = users_on(shard_map, 's0')[0], users_on(shard_map, 's1')[0]
+
+    save_users_bulk([{'user_id': s0_user}, {'user_id': s1_user}])
+
+    assert [c.args[1] for c in mock_execute_values_pg.call_args_list] == \
+        [[{'user_id': s0_user}], [{'user_id': s1_user}]]
+
+
+@patch("db.reshard.execute_values")
+def test_copy_users_replaces_target_rows(mock_execute_values):
+    source, target = make_connection('source'), make_connection('target')
+    source.cursor.return_value.fetchall.side_effect = [
+        [{'id': 1, 'username': 'a'}],
+        [],
+        [{'id': 10, 'user_id': 1, 'sleep_time': 'x'}],
+        [],
+        [],
+    ]
+
+    assert copy_users(source, target, [1]) == 2
+
+    target_cursor = target.cursor.return_value
+    target_cursor.execute.assert_called_once_with('DELETE FROM public.users WHERE id = ANY(%s)', ([1],))
+    assert mock_execute_values.call_args_list == [
+        call(target_cursor, 'INSERT INTO public.users (id, username) VALUES %s', [(1, 'a')], page_size=1),
+        call(target_cursor, 'INSERT INTO public.sleep_records (user_id, sleep_time) VALUES %s', [(1, 'x')],
+             page_size=1),
+    ]
+    target.commit.assert_called_once()
+
+
+@patch("db.reshard.copy_users", return_value=3)
+def test_move_bucket_switches_map_before_deleting(mock_copy_users, shards, tmp_path):
+    shard_map, connections = shards
+    path = tmp_path / 'shards.json'
+    path.write_text(json.dumps(shard_map.to_dict()))
+    bucket = shard_map.assignments.index('s0')
+    user_ids = [user_id for user_id in range(1, 100) if bucket_of(user_id, 4) == bucket]
+    connections['s0'].cursor.return_value.fetchall.return_value = [{'id': user_id} for user_id in range(1, 100)]
+    connections['s0'].cursor.return_value.fetchone.return_value = {'first': None, 'last': None}
+
+    assert move_bucket(bucket, 's1', str(path), batch_size=1000) == len(user_ids)
+
+    mock_copy_users.assert_called_once_with(connections['s0'], connections['s1'], user_ids)
+    assert json.loads(path.read_text())['assignments']['s1'][0].startswith(str(bucket))
+    assert shard_for_user(user_ids[0]) == 's1'
+    connections['s0'].cursor.return_value.execute.assert_called_with(
+        'DELETE FROM public.users WHERE id = ANY(%s)', (user_ids,))
+
+
+@patch("db.reshard.copy_users", return_value=3)
+def test_move_bucket_creates_partitions_for_history(mock_copy_users, shards, tmp_path):
+    shard_map, connections = shards
+    path = tmp_path / 'shards.json'
+    path.write_text(json.dumps(shard_map.to_dict()))
+    bucket = shard_map.assignments.index('s0')
+    first, last = datetime(2021, 3, 5, tzinfo=timezone.utc), datetime(2024, 11, 30, tzinfo=timezone.utc)
+    connections['s0'].cursor.return_value.fetchall.return_value = [{'id': user_id} for user_id in range(1, 100)]
+    connections['s0'].cursor.return_value.fetchone.return_value = {'first': first, 'last': last}
+    ensured = []
+
+    def ensure(*args):
+        ensured.append((current_shard(), args, mock_copy_users.call_count))
+        return True
+
+    with patch("db.reshard.ensure_sleep_record_partitions_between", side_effect=ensure):
+        move_bucket(bucket, 's1', str(path), batch_size=1000)
+
+    # Секции на всю историю корзины созданы на получателе до копирования
+    assert ensured == [('s1', (first, last), 0)]
+
+    # Без секций корзина не переносится и остается за прежним шардом
+    with patch("db.reshard.ensure_sleep_record_partitions_between", return_value=False), \
+            pytest.raises(RuntimeError):
+        move_bucket(shard_map.assignments.index('s0', bucket + 1), 's1', str(path), batch_size=1000)
+    assert mock_copy_users.call_count == 1
@@ -5,7 +5,8 @@ from db.db import (
     get_sleep_records_per_week,
     get_sleep_record_last_db,
     get_sleep_time_without_wake_db,
-    get_wake_time_null
+    get_wake_time_null,
+    PREPARED_STATEMENTS
 )
 
 @pytest.fixture
@@ -17,38 +18,44 @@ def mock_execute_query_pg():
 @patch("db.db.execute_query_pg")
 def test_get_all_sleep_records(mock_execute_query_pg):
     mock_execute_query_pg.return_value.fetchall.return_value = [
-        {"user_id": 1, "sleep_time": "2024-12-01T23:00:00", "wake_time": "2024-12-02T07:00:00"},
-        {"user_id": 1, "sleep_time": "2024-11-30T23:30:00", "wake_time": "2024-12-01T06:30:00"}
+        (2, "2024-12-01T23:00:00", "2024-12-02T07:00:00", None, None),
+        (1, "2024-11-30T23:30:00", "2024-12-01T06:30:00", 4, 5)
     ]
 
     result = get_all_sleep_records(1)
 
-    mock_execute_query_pg.assert_called_once_with(
-        'SELECT * FROM public.sleep_records WHERE user_id = %(user_id)s',
-        {'user_id': 1}
+    mock_execute_query_pg.assert_called_once_with('''
+                SELECT id, sleep_time, wake_time, sleep_quality, mood FROM public.sleep_records
+                WHERE user_id = %(user_id)s
+                AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+                ORDER BY sleep_time DESC''', {'user_id': 1}, row_factory=False
     )
-    assert result == [
-        {"user_id": 1, "sleep_time": "2024-12-01T23:00:00", "wake_time": "2024-12-02T07:00:00"},
-        {"user_id": 1, "sleep_time": "2024-11-30T23:30:00", "wake_time": "2024-12-01T06:30:00"}
+    assert [dict(record) for record in result] == [
+        {"id": 2, "sleep_time": "2024-12-01T23:00:00", "wake_time": "2024-12-02T07:00:00",
+         "sleep_quality": None, "mood": None},
+        {"id": 1, "sleep_time": "2024-11-30T23:30:00", "wake_time": "2024-12-01T06:30:00",
+         "sleep_quality": 4, "mood": 5}
     ]
 
 # Test for get_sleep_records_per_week
 @patch("db.db.execute_query_pg")
 def test_get_sleep_records_per_week(mock_execute_query_pg):
     mock_execute_query_pg.return_value.fetchall.return_value = [
-        {"sleep_time": "2024-12-01T23:00:00", "wake_time": "2024-12-02T07:00:00"},
-        {"sleep_time": "2024-11-30T23:30:00", "wake_time": "2024-12-01T06:30:00"}
+        ("2024-12-01T23:00:00", "2024-12-02T07:00:00"),
+        ("2024-11-30T23:30:00", "2024-12-01T06:30:00")
     ]
 
     result = get_sleep_records_per_week(1)
 
     mock_execute_query_pg.assert_called_once_with('''
-        SELECT sleep_time, wake_time FROM public.sleep_records
-        WHERE user_id = %(user_id)s AND wake_time IS NOT NULL
-        ORDER BY sleep_time DESC LIMIT 7
-    ''', {'user_id': 1}
+                SELECT sleep_time, wake_time FROM public.sleep_records
+                WHERE user_id = %(user_id)s
+                AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+                AND wake_time IS NOT NULL
+                ORDER BY sleep_time DESC
+                LIMIT 7''', {'user_id': 1}, row_factory=False
     )
-    assert result == [
+    assert [dict(record) for record in result] == [
         {"sleep_time": "2024-12-01T23:00:00", "wake_time": "2024-12-02T07:00:00"},
         {"sleep_time": "2024-11-30T23:30:00", "wake_time": "2024-12-01T06:30:00"}
     ]
@@ -56,37 +63,33 @@ def test_get_sleep_records_per_week(mock_execute_query_pg):
 # Test for get_sleep_record_last_db
 @patch("db.db.execute_query_pg")
 def test_get_sleep_record_last_db(mock_execute_query_pg):
-    mock_execute_query_pg.return_value.fetchone.return_value = {
-        "sleep_time": "2024-12-01T23:00:00", "wake_time": "2024-12-02T07:00:00"
-    }
+    mock_execute_query_pg.return_value.fetchone.return_value = ("2024-12-01T23:00:00", "2024-12-02T07:00:00")
 
     result = get_sleep_record_last_db(1)
 
+    # Читается одна строка: LIMIT 1, а не сортировка и передача всей истории
     mock_execute_query_pg.assert_called_once_with('''
-        SELECT sleep_time, wake_time FROM public.sleep_records
-        WHERE user_id = %(user_id)s
-        ORDER BY sleep_time DESC
-    ''',{'user_id': 1}
+                SELECT sleep_time, wake_time FROM public.sleep_records
+                WHERE user_id = %(user_id)s
+                AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+                ORDER BY sleep_time DESC
+                LIMIT 1''', {'user_id': 1}, row_factory=False
     )
-    assert result == {
-        "sleep_time": "2024-12-01T23:00:00", "wake_time": "2024-12-02T07:00:00"
-    }
+    mock_execute_query_pg.return_value.fetchall.assert_not_called()
+    assert result.sleep_time == "2024-12-01T23:00:00"
+    assert result['wake_time'] == "2024-12-02T07:00:00"
 
 # Test for get_sleep_time_without_wake_db
-@patch("db.db.execute_query_pg")
-def test_get_sleep_time_without_wake_db(mock_execute_query_pg):
-    mock_execute_query_pg.return_value.fetchone.return_value = {
-        "sleep_time": "2024-12-01T23:00:00"
-    }
+@patch("db.db.execute_prepared_pg")
+def test_get_sleep_time_without_wake_db(mock_execute_prepared_pg):
+    mock_execute_prepared_pg.return_value.fetchone.return_value = ("2024-12-01T23:00:00",)
 
     result = get_sleep_time_without_wake_db(1)
 
-    mock_execute_query_pg.assert_called_once_with('''
-        SELECT sleep_time FROM public.sleep_records 
-        WHERE user_id = %(user_id)s AND wake_time IS NULL
-    ''', {'user_id': 1}
+    mock_execute_prepared_pg.assert_called_once_with(
+        PREPARED_STATEMENTS['get_sleep_time_without_wake'], {'user_id': 1}, row_factory=False
     )
-    assert result == {
+    assert dict(result) == {
         "sleep_time": "2024-12-01T23:00:00"
     }
 
@@ -94,17 +97,17 @@ def test_get_sleep_time_without_wake_db(mock_execute_query_pg):
 @patch("db.db.execute_query_pg")
 def test_get_wake_time_null(mock_execute_query_pg):
     mock_execute_query_pg.return_value.fetchall.return_value = [
-        {"wake_time": None}
+        (None,)
     ]
 
     result = get_wake_time_null(1)
 
     mock_execute_query_pg.assert_called_once_with('''
-        SELECT wake_time FROM public.sleep_records
-        WHERE user_id = %(user_id)s
-        AND wake_time IS NULL
-    ''', {'user_id': 1}
+                SELECT wake_time FROM public.sleep_records
+                WHERE user_id = %(user_id)s
+                AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = %(user_id)s)
+                AND wake_time IS NULL''', {'user_id': 1}, row_factory=False
     )
-    assert result == [
+    assert [dict(record) for record in result] == [
         {"wake_time": None}
     ]
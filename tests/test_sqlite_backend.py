@@ -0,0 +1,119 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from unittest.mock import patch
+
+from db.db import get_user_db, get_reminder_time_db, get_all_user_profiles, get_sleep_records_per_week, \
+    get_all_users, save_user_to_db, save_users_bulk, save_reminder_time_db, start_sleep_session_db, \
+    finish_sleep_session_db, delete_all_data_user_db, save_user_city, save_mood_db, get_all_reminders
+from db.execute_query.execute_sqlite import get_connection_sl, translate_sl
+from db.write_behind import WriteBehindBuffer, USERS, USER_UPDATES, SLEEP_RECORDS, set_write_buffer
+from executors import run_db
+
+
+def test_translate_postgres_dialect():
+    assert translate_sl('''
+        SELECT sleep_time, wake_time - sleep_time AS duration FROM public.sleep_records
+        WHERE user_id = %(user_id)s::bigint AND sleep_time >= now() - interval '7 days'
+    ''') == '''
+        SELECT sleep_time, timestamp_diff(wake_time, sleep_time) AS "duration [interval]" FROM sleep_records
+        WHERE user_id = :user_id AND sleep_time >= datetime('now', '-7 days')
+    '''
+
+
+def test_connection_is_persistent_per_thread(sqlite_backend):
+    conn = get_connection_sl()
+    assert get_connection_sl() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone() == {'journal_mode': 'wal'}
+    assert conn.execute('PRAGMA synchronous').fetchone() == {'synchronous': 1}
+    assert conn.execute('PRAGMA foreign_keys').fetchone() == {'foreign_keys': 1}
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_connection_sl()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_accessors_on_sqlite(sqlite_backend):
+    sleep_time = datetime.now(timezone(timedelta(hours=3))) - timedelta(hours=9)
+
+    save_user_to_db(7001, 'sleeper', time_zone='Europe/Moscow')
+    save_reminder_time_db(7001, '22:00')
+    save_reminder_time_db(7001, '22:30')
+    assert get_user_db(7001) == (7001,)
+    assert get_reminder_time_db(7001).reminder_time == '22:30'
+
+    assert start_sleep_session_db(7001, sleep_time).rowcount == 1
+    assert start_sleep_session_db(7001, sleep_time).rowcount == 0
+    assert get_all_user_profiles()[0]['open_sleep_time'] == sleep_time
+
+    finished = finish_sleep_session_db(7001, sleep_time + timedelta(hours=8)).fetchone()
+    assert finished['duration'] == timedelta(hours=8)
+    assert [dict(record) for record in get_sleep_records_per_week(7001)] == \
+        [{'sleep_time': sleep_time, 'wake_time': sleep_time + timedelta(hours=8)}]
+
+    save_users_bulk([{'user_id': 7002, 'city_name': 'Kazan'}, {'user_id': 7001, 'city_name': 'Moscow'}])
+    assert {user['id']: user['city_name'] for user in get_all_users()} == {7001: 'Moscow', 7002: 'Kazan'}
+
+    delete_all_data_user_db(7001)
+    assert [user['id'] for user in get_all_users()] == [7002]
+
+
+@pytest.mark.asyncio
+async def test_offloaded_accessors_on_sqlite(sqlite_backend):
+    save_user_to_db(7003)
+    save_reminder_time_db(7003, '23:00')
+
+    # Поток исполнителя БД читает на своем соединении (WAL) то, что записано в основном потоке
+    assert [reminder['user_id'] for reminder in await run_db(get_all_reminders)] == [7003]
+
+
+def test_write_behind_flush_on_sqlite(sqlite_backend):
+    save_user_to_db(7004)
+    start_sleep_session_db(7004, datetime(2024, 12, 1, 23, tzinfo=timezone.utc))
+    finish_sleep_session_db(7004, datetime(2024, 12, 2, 7, tzinfo=timezone.utc))
+
+    record = get_connection_sl().execute('SELECT id, sleep_time FROM sleep_records').fetchone()
+
+    with patch("db.write_behind.DATABASE_BACKEND", 'sqlite'):
+        WriteBehindBuffer._write({
+            7004: {USER_UPDATES: {'city_name': 'Omsk'}, (SLEEP_RECORDS, record['id'], record['sleep_time']): {'mood': 4}},
+            7005: {USERS: {'username': 'new'}},
+            # Изменение столбцов не создает строку пользователя
+            7006: {USER_UPDATES: {'city_name': 'Tver'}},
+        })
+
+    conn = get_connection_sl()
+    assert conn.execute('SELECT id, city_name, username FROM users ORDER BY id').fetchall() == [
+        {'id': 7004, 'city_name': 'Omsk', 'username': None}, {'id': 7005, 'city_name': None, 'username': 'new'}]
+    assert conn.execute('SELECT mood, sleep_quality FROM sleep_records').fetchall() == [
+        {'mood': 4, 'sleep_quality': None}]
+
+
+def test_write_behind_keeps_targets(sqlite_backend):
+    sleep_time = datetime(2024, 12, 1, 23, tzinfo=timezone.utc)
+    save_user_to_db(7007)
+    start_sleep_session_db(7007, sleep_time)
+    finish_sleep_session_db(7007, sleep_time + timedelta(hours=8))
+
+    buffer = WriteBehindBuffer(flush_interval_ms=60_000, max_items=100)
+    set_write_buffer(buffer)
+    try:
+        with patch("db.write_behind.DATABASE_BACKEND", 'sqlite'):
+            save_mood_db(7007, 4)
+            save_user_city(7008, 'Omsk')
+            # Следующая сессия завершилась до записи пачки (например, в другом процессе)
+            conn = get_connection_sl()
+            conn.execute('INSERT INTO sleep_records (user_id, sleep_time, wake_time) VALUES (?, ?, ?)',
+                         (7007, sleep_time + timedelta(days=1), sleep_time + timedelta(days=1, hours=8)))
+            conn.commit()
+            assert buffer.flush() == 2
+    finally:
+        set_write_buffer(None)
+
+    # Оценка записана в оцененную сессию, а не в последнюю на момент записи пачки
+    assert conn.execute('SELECT mood FROM sleep_records ORDER BY sleep_time').fetchall() == [{'mood': 4}, {'mood': None}]
+    # Отложенное изменение города удаленного пользователя не создает его заново
+    assert get_user_db(7008) is None
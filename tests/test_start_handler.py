@@ -19,21 +19,15 @@ async def test_start_handler_user_without_location():
 
     # Замокируем зависимости
     with patch("handlers.handlers.add_new_user") as mock_add_new_user, \
-         patch("handlers.handlers.get_has_provided_location", return_value=None) as mock_get_has_location, \
-         patch("handlers.handlers.get_user_time_zone_db", return_value={"time_zone": None}) as mock_get_time_zone_db, \
-         patch("handlers.handlers.get_user_time_zone", return_value="UTC") as mock_get_user_time_zone, \
-         patch("handlers.handlers.get_local_time", return_value=datetime(2024, 11, 10, 10, 0, 0)) as mock_get_local_time, \
+         patch("handlers.handlers.get_user_profile", return_value=None) as mock_get_user_profile, \
          patch("handlers.handlers.logger") as mock_logger:
 
         # Вызов функции
         msg_id = await start_handler(mock_client, mock_message)
 
         # Проверяем вызовы функций
+        mock_get_user_profile.assert_called_once_with(12345)
         mock_add_new_user.assert_called_once_with(mock_message.from_user)
-        mock_get_has_location.assert_called_once_with(12345)
-        mock_get_time_zone_db.assert_called_once_with(12345)
-        mock_get_user_time_zone.assert_called_once_with(12345)
-        mock_get_local_time.assert_called_once()
 
         # Проверяем отправку сообщения с запросом локации
         mock_message.reply_text.assert_any_call(
@@ -56,20 +50,19 @@ async def test_start_handler_user_with_location():
     mock_message.reply_text.return_value = AsyncMock(id=42)  # Устанавливаем id как число
 
     # Замокируем зависимости
+    profile = {"id": 12345, "has_provided_location": 1, "time_zone": "UTC"}
     with patch("handlers.handlers.add_new_user") as mock_add_new_user, \
-         patch("handlers.handlers.get_has_provided_location", return_value={"has_provided_location": True}) as mock_get_has_location, \
-         patch("handlers.handlers.get_user_time_zone_db", return_value={"time_zone": "UTC"}) as mock_get_time_zone_db, \
-         patch("handlers.handlers.get_local_time", return_value=datetime(2024, 11, 10, 10, 0, 0)) as mock_get_local_time, \
+         patch("handlers.handlers.get_user_profile", return_value=profile) as mock_get_user_profile, \
+         patch("handlers.handlers.datetime") as mock_datetime, \
          patch("handlers.handlers.logger") as mock_logger:
+        mock_datetime.now.return_value = datetime(2024, 11, 10, 10, 0, 0)
 
         # Вызов функции
         msg_id = await start_handler(mock_client, mock_message)
 
-        # Проверяем вызовы функций
-        mock_add_new_user.assert_called_once_with(mock_message.from_user)
-        mock_get_has_location.assert_called_once_with(12345)
-        mock_get_time_zone_db.assert_called_once_with(12345)
-        mock_get_local_time.assert_called_once()
+        # Проверяем вызовы функций: для известного пользователя достаточно одного запроса профиля
+        mock_get_user_profile.assert_called_once_with(12345)
+        mock_add_new_user.assert_not_called()
 
         # Проверяем отправку приветственного сообщения
         mock_message.reply_text.assert_any_call(
@@ -0,0 +1,125 @@
+from datetime import timedelta, timezone
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from db.db import save_user_to_db, save_user_city, get_city_name, start_sleep_session_db, finish_sleep_session_db, \
+    get_all_sleep_records, get_daily_sleep_summary, get_user_time_zone_db
+from db.execute_query import execute_query_pg, unit_of_work, current_session
+from executors.cpu_tasks import timezone_at
+from handlers.requests import save_location
+from handlers.user_valid import save_sleep_event_now
+
+
+@patch("db.execute_query.execute_pg.get_pool")
+def test_statements_share_one_connection_and_commit(mock_get_pool):
+    pool = mock_get_pool.return_value
+    conn = pool.getconn.return_value
+
+    with unit_of_work(1) as session:
+        execute_query_pg('UPDATE public.users SET city_name = %(city_name)s WHERE id = %(user_id)s',
+                         {'user_id': 1, 'city_name': 'Kazan'})
+        execute_query_pg('SELECT city_name FROM public.users WHERE id = %(user_id)s', {'user_id': 1})
+        # Вложенный блок становится частью внешнего
+        with unit_of_work(1) as inner:
+            assert inner is session
+        conn.commit.assert_not_called()
+
+    assert session.committed and current_session() is None
+    pool.getconn.assert_called_once()
+    assert conn.cursor.return_value.execute.call_count == 2
+    conn.commit.assert_called_once()
+    pool.putconn.assert_called_once_with(conn, close=False)
+
+
+@patch("db.execute_query.execute_pg.get_pool")
+def test_failed_statement_rolls_back(mock_get_pool):
+    conn = mock_get_pool.return_value.getconn.return_value
+    cursor = conn.cursor.return_value
+    cursor.execute.side_effect = [Exception('duplicate key'), None]
+
+    with unit_of_work(1) as session:
+        assert execute_query_pg('INSERT INTO public.users (id) VALUES (%(user_id)s)', {'user_id': 1}) is None
+        # Транзакция прервана: следующие запросы не выполняются
+        assert execute_query_pg('SELECT 1') is None
+
+    assert session.failed and not session.committed
+    assert cursor.execute.call_count == 1
+    conn.commit.assert_not_called()
+    conn.rollback.assert_called_once()
+
+
+def test_unit_of_work_on_sqlite(sqlite_backend):
+    save_user_to_db(7501, 'sleeper', city_name='Moscow')
+
+    with pytest.raises(ValueError):
+        with unit_of_work(7501):
+            save_user_city(7501, 'Kazan')
+            # Внутри транзакции видна своя запись, кэш не используется
+            assert get_city_name(7501).city_name == 'Kazan'
+            raise ValueError
+    assert get_city_name(7501).city_name == 'Moscow'
+
+    with unit_of_work(7501) as session:
+        save_user_city(7501, 'Kazan')
+    assert session.committed
+    assert get_city_name(7501).city_name == 'Kazan'
+
+
+def test_sleep_events_in_one_transaction(sqlite_backend):
+    save_user_to_db(7502, 'sleeper', time_zone='Europe/Moscow')
+
+    sleep_time_dt, cursor = save_sleep_event_now(7502, start_sleep_session_db)
+    assert cursor.rowcount == 1
+    assert str(sleep_time_dt.tzinfo) == 'Europe/Moscow'
+
+    with patch("handlers.user_valid.datetime") as mock_datetime:
+        mock_datetime.now.return_value = sleep_time_dt + timedelta(hours=8)
+        wake_time_dt, cursor = save_sleep_event_now(7502, finish_sleep_session_db)
+    assert cursor.fetchone()['duration'] == timedelta(hours=8)
+
+    assert get_all_sleep_records(7502)[0]['wake_time'] == wake_time_dt.astimezone(timezone.utc)
+    assert [summary['total_seconds'] for summary in get_daily_sleep_summary(7502)] == [8 * 3600]
+
+
+def test_failed_summary_does_not_roll_back_wake(sqlite_backend):
+    save_user_to_db(7503, 'sleeper', time_zone='Europe/Moscow')
+    sleep_time_dt, _ = save_sleep_event_now(7503, start_sleep_session_db)
+
+    # Запрос сводки завершается ошибкой: сводка пересчитывается после фиксации, пробуждение сохраняется
+    with patch("db.summary.DAY_RECORDS_SQL", 'SELECT missing FROM public.sleep_records'), \
+            patch("handlers.user_valid.datetime") as mock_datetime:
+        mock_datetime.now.return_value = sleep_time_dt + timedelta(hours=8)
+        wake_time_dt, cursor = save_sleep_event_now(7503, finish_sleep_session_db)
+
+    assert cursor.rowcount == 1
+    assert get_all_sleep_records(7503)[0]['wake_time'] == wake_time_dt.astimezone(timezone.utc)
+    assert get_daily_sleep_summary(7503) == []
+
+
+def test_commit_callbacks_skip_rollback(sqlite_backend):
+    calls = []
+    with unit_of_work() as session:
+        session.on_commit(lambda: calls.append('committed'))
+    with pytest.raises(ValueError):
+        with unit_of_work() as session:
+            session.on_commit(lambda: calls.append('rolled back'))
+            raise ValueError
+    assert calls == ['committed']
+
+
+@pytest.mark.asyncio
+@patch("handlers.requests.run_cpu", new_callable=AsyncMock, return_value='Europe/Samara')
+@patch("handlers.requests.run_io", new_callable=AsyncMock, return_value='Kazan')
+async def test_location_resolved_before_transaction(mock_run_io, mock_run_cpu, sqlite_backend):
+    save_user_to_db(7106, 'sleeper', time_zone='Europe/Moscow')
+    message = AsyncMock()
+    message.from_user.id = 7106
+    message.location.latitude, message.location.longitude = 55.79, 49.12
+
+    await save_location(AsyncMock(), message)
+
+    # Часовой пояс определяется в пуле процессов, транзакция только записывает результат
+    mock_run_cpu.assert_awaited_once_with(timezone_at, 55.79, 49.12)
+    assert get_user_time_zone_db(7106)['time_zone'] == 'Europe/Samara'
+    assert get_city_name(7106)['city_name'] == 'Kazan'
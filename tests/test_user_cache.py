@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+from cache import get_cache
+from db.db import get_city_name, get_sleep_goal_user, save_user_city
+
+
+@patch("db.db.execute_query_pg")
+def test_cached_getter_reads_once_and_write_invalidates(mock_execute_query_pg):
+    mock_execute_query_pg.return_value.fetchone.return_value = ('Moscow',)
+
+    assert get_city_name(1) == ('Moscow',)
+    assert get_city_name(1) == ('Moscow',)
+    assert mock_execute_query_pg.call_count == 1
+
+    save_user_city(1, 'Kazan')
+    mock_execute_query_pg.return_value.fetchone.return_value = ('Kazan',)
+
+    assert get_city_name(1) == ('Kazan',)
+    assert mock_execute_query_pg.call_count == 3
+    assert get_cache().stats()['deletes'] == 1
+
+
+@patch("db.db.execute_query_pg")
+def test_cached_getter_does_not_cache_none(mock_execute_query_pg):
+    mock_execute_query_pg.return_value.fetchone.return_value = None
+
+    assert get_city_name(1) is None
+    assert get_city_name(1) is None
+    assert mock_execute_query_pg.call_count == 2
+
+
+@patch("db.db.execute_query_pg")
+def test_cached_getter_skips_value_read_during_write(mock_execute_query_pg):
+    def read_then_write(query, params, row_factory=True):
+        # Запись другого потока завершилась, пока чтение ждало ответа базы
+        if 'SELECT' in query:
+            save_user_city(1, 'Kazan')
+        return mock_execute_query_pg.return_value
+
+    mock_execute_query_pg.side_effect = read_then_write
+    mock_execute_query_pg.return_value.fetchone.return_value = ('Moscow',)
+
+    assert get_city_name(1) == ('Moscow',)
+    assert get_cache().stats()['size'] == 0
+
+
+@patch("db.db.execute_query_pg")
+def test_cached_getters_use_separate_keys(mock_execute_query_pg):
+    mock_execute_query_pg.return_value.fetchone.return_value = ('Moscow',)
+    assert get_city_name(1) == ('Moscow',)
+
+    mock_execute_query_pg.return_value.fetchone.return_value = (8.0,)
+    assert get_sleep_goal_user(1) == (8.0,)
+
+
+@patch("db.db.execute_query_pg")
+def test_cached_record_survives_json_cache(mock_execute_query_pg):
+    # Кэш с сериализацией в JSON (Redis) возвращает запись списком значений
+    mock_execute_query_pg.return_value.fetchone.return_value = ('Moscow',)
+    record = get_city_name(1)
+    get_cache().set('user:1:get_city_name', ['Kazan'])
+
+    cached = get_city_name(1)
+
+    assert type(cached) is type(record) and cached.city_name == 'Kazan'
+    assert mock_execute_query_pg.call_count == 1
@@ -9,108 +9,136 @@ from db.db import (
     get_sleep_goal_user,
     get_user_wake_time,
     get_has_provided_location,
+    get_user_profile,
+    PREPARED_STATEMENTS,
+    QUERIES,
 )
 
 # Test for get_all_users
 @patch("db.db.execute_query_pg")
 def test_get_all_users(mock_execute_query_pg):
     mock_execute_query_pg.return_value.fetchall.return_value = [
-        {"id": 1, "name": "User1", "city_name": "City1", "time_zone": "UTC"},
-        {"id": 2, "name": "User2", "city_name": "City2", "time_zone": "UTC+1"},
+        (1, "user1", "User", None, None, "City1", 8.0, None, 1, "UTC"),
+        (2, "user2", "User", None, None, "City2", 8.0, None, 1, "UTC+1"),
     ]
 
     result = get_all_users()
 
-    mock_execute_query_pg.assert_called_once_with('SELECT * FROM public.users')
-    assert result == [
-        {"id": 1, "name": "User1", "city_name": "City1", "time_zone": "UTC"},
-        {"id": 2, "name": "User2", "city_name": "City2", "time_zone": "UTC+1"},
+    mock_execute_query_pg.assert_called_once_with(QUERIES['get_all_users'].sql, None, row_factory=False)
+    assert 'SELECT id, username, first_name' in QUERIES['get_all_users'].sql
+    assert [(user['id'], user['city_name'], user['time_zone']) for user in result] == [
+        (1, "City1", "UTC"),
+        (2, "City2", "UTC+1"),
     ]
 
 # Test for get_all_users_city_name
 @patch("db.db.execute_query_pg")
 def test_get_all_users_city_name(mock_execute_query_pg):
     mock_execute_query_pg.return_value.fetchall.return_value = [
-        {"id": 1, "city_name": "City1", "time_zone": "UTC"},
-        {"id": 2, "city_name": "City2", "time_zone": "UTC+1"},
+        (1, "City1", "UTC"),
+        (2, "City2", "UTC+1"),
     ]
 
     result = get_all_users_city_name()
 
-    mock_execute_query_pg.assert_called_once_with('SELECT id, city_name, time_zone FROM public.users')
-    assert result == [
+    mock_execute_query_pg.assert_called_once_with('''
+                SELECT id, city_name, time_zone FROM public.users u
+                WHERE NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = u.id)''',
+                                                  None, row_factory=False)
+    assert [dict(user) for user in result] == [
         {"id": 1, "city_name": "City1", "time_zone": "UTC"},
         {"id": 2, "city_name": "City2", "time_zone": "UTC+1"},
     ]
 
 # Test for get_user_time_zone_db
-@patch("db.db.execute_query_pg")
-def test_get_user_time_zone_db(mock_execute_query_pg):
-    mock_execute_query_pg.return_value.fetchone.return_value = {"time_zone": "UTC"}
+@patch("db.db.execute_prepared_pg")
+def test_get_user_time_zone_db(mock_execute_prepared_pg):
+    mock_execute_prepared_pg.return_value.fetchone.return_value = ("UTC",)
 
     result = get_user_time_zone_db(1)
 
-    mock_execute_query_pg.assert_called_once_with(
-        'SELECT time_zone FROM public.users WHERE id = %(user_id)s', {'user_id': 1}
+    mock_execute_prepared_pg.assert_called_once_with(
+        PREPARED_STATEMENTS['get_user_time_zone'], {'user_id': 1}, row_factory=False
     )
-    assert result == {"time_zone": "UTC"}
+    assert result['time_zone'] == "UTC"
 
 # Test for get_user_db
 @patch("db.db.execute_query_pg")
 def test_get_user_db(mock_execute_query_pg):
-    mock_execute_query_pg.return_value.fetchone.return_value = {"id": 1, "name": "User1"}
+    mock_execute_query_pg.return_value.fetchone.return_value = (1,)
 
     result = get_user_db(1)
 
     mock_execute_query_pg.assert_called_once_with(
-        'SELECT * FROM public.users WHERE id = %(user_id)s', {'user_id': 1}
+        'SELECT id FROM public.users WHERE id = %(user_id)s LIMIT 1', {'user_id': 1}, row_factory=False
     )
-    assert result == {"id": 1, "name": "User1"}
+    assert result.id == 1
 
 # Test for get_city_name
 @patch("db.db.execute_query_pg")
 def test_get_city_name(mock_execute_query_pg):
-    mock_execute_query_pg.return_value.fetchone.return_value = {"city_name": "City1"}
+    mock_execute_query_pg.return_value.fetchone.return_value = ("City1",)
 
     result = get_city_name(1)
 
     mock_execute_query_pg.assert_called_once_with(
-        'SELECT city_name FROM public.users WHERE id = %(user_id)s', {'user_id': 1}
+        'SELECT city_name FROM public.users WHERE id = %(user_id)s LIMIT 1', {'user_id': 1},
+        row_factory=False
     )
-    assert result == {"city_name": "City1"}
+    assert result['city_name'] == "City1"
 
 # Test for get_sleep_goal_user
 @patch("db.db.execute_query_pg")
 def test_get_sleep_goal_user(mock_execute_query_pg):
-    mock_execute_query_pg.return_value.fetchone.return_value = {"sleep_goal": 8}
+    mock_execute_query_pg.return_value.fetchone.return_value = (8,)
 
     result = get_sleep_goal_user(1)
 
     mock_execute_query_pg.assert_called_once_with(
-        'SELECT sleep_goal FROM public.users WHERE id = %(user_id)s', {'user_id': 1}
+        QUERIES['get_sleep_goal_user'].sql, {'user_id': 1}, row_factory=False
     )
-    assert result == {"sleep_goal": 8}
+    assert result['sleep_goal'] == 8
 
 # Test for get_user_wake_time
 @patch("db.db.execute_query_pg")
 def test_get_user_wake_time(mock_execute_query_pg):
-    mock_execute_query_pg.return_value.fetchone.return_value = {"id": 1, "wake_time": "07:00:00"}
+    mock_execute_query_pg.return_value.fetchone.return_value = ("07:00:00",)
 
     result = get_user_wake_time(1)
 
     mock_execute_query_pg.assert_called_once_with(
-        'SELECT id, wake_time FROM public.users WHERE id = %(user_id)s', {'user_id': 1}
+        QUERIES['get_user_wake_time'].sql, {'user_id': 1}, row_factory=False
     )
-    assert result == {"id": 1, "wake_time": "07:00:00"}
+    assert result['wake_time'] == "07:00:00"
 
 # Test for get_has_provided_location
 @patch("db.db.execute_query_pg")
 def test_get_has_provided_location(mock_execute_query_pg):
-    mock_execute_query_pg.return_value.fetchone.return_value = {"id": 1, "has_provided_location": True}
+    mock_execute_query_pg.return_value.fetchone.return_value = (True,)
 
     result = get_has_provided_location(1)
 
     mock_execute_query_pg.assert_called_once_with(
-        'SELECT id, has_provided_location FROM public.users WHERE id = %(user_id)s', {'user_id': 1}
+        QUERIES['get_has_provided_location'].sql, {'user_id': 1}, row_factory=False
+    )
+    assert result['has_provided_location'] is True
+
+# Test for get_user_profile
+@patch("db.db.execute_query_pg")
+def test_get_user_profile(mock_execute_query_pg):
+    profile = {
+        "id": 1, "time_zone": "UTC", "sleep_goal": 8.0, "wake_time": "07:00", "city_name": "City1",
+        "has_provided_location": 1, "reminder_time": "22:30", "open_sleep_time": None
+    }
+    mock_execute_query_pg.return_value.fetchone.return_value = tuple(profile.values())
+
+    result = get_user_profile(1)
+
+    mock_execute_query_pg.assert_called_once_with('''
+                SELECT u.id, u.time_zone, u.sleep_goal, u.wake_time, u.city_name, u.has_provided_location, r.reminder_time, u.open_sleep_time
+                FROM public.users u
+                LEFT JOIN public.reminders r ON r.user_id = u.id
+                WHERE u.id = %(user_id)s AND NOT EXISTS (SELECT 1 FROM public.purge_queue q WHERE q.user_id = u.id)
+                LIMIT 1''', {'user_id': 1}, row_factory=False
     )
-    assert result == {"id": 1, "has_provided_location": True}
+    assert dict(result) == profile
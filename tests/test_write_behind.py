@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+
+import pytest
+from unittest.mock import patch, MagicMock, call
+import psycopg2
+from psycopg2 import extensions
+
+from db.db import save_user_city, save_sleep_goal_db, save_mood_db, save_sleep_quality_db, get_city_name, \
+    get_all_users, finish_sleep_session_db
+from db.execute_query.execute_pg import close_pool
+from db.queries import SLEEP_RECORD_RATINGS_SQL, SLEEP_RECORD_RATINGS_TEMPLATE
+from db.write_behind import WriteBehindBuffer, set_write_buffer, get_write_buffer
+
+SLEEP_TIME = datetime(2024, 12, 1, 23, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def buffer():
+    close_pool()
+    # Фоновая запись не успеет сработать: пачки записываются только явным flush или чтением
+    buffer = WriteBehindBuffer(flush_interval_ms=60_000, max_items=100)
+    set_write_buffer(buffer)
+    yield buffer
+    set_write_buffer(None)
+    close_pool()
+
+
+@pytest.fixture
+def mock_connection():
+    mock_connection = MagicMock()
+    mock_connection.closed = 0
+    mock_connection.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    with patch("psycopg2.connect", return_value=mock_connection):
+        yield mock_connection
+
+
+@patch("db.write_behind.refresh_daily_summary")
+@patch("db.write_behind.execute_values")
+@patch("db.db.execute_query_pg")
+def test_writes_are_coalesced_and_flushed_before_read(mock_execute_query_pg, mock_execute_values,
+                                                      mock_refresh_daily_summary, buffer, mock_connection):
+    # Оцененные записи (id, sleep_time) читаются при оценке, затем - город пользователя
+    mock_execute_query_pg.return_value.fetchone.side_effect = [(10, SLEEP_TIME), (10, SLEEP_TIME), (20, SLEEP_TIME),
+                                                               ('Kazan',)]
+
+    save_user_city(1, 'Moscow')
+    save_user_city(1, 'Kazan')
+    save_sleep_goal_db(1, 7.5)
+    save_mood_db(1, 4)
+    save_sleep_quality_db(1, 5)
+    save_mood_db(2, 3)
+
+    assert mock_execute_query_pg.call_count == 3
+    assert buffer.stats()['pending'] == 2
+    assert buffer.stats()['coalesced'] == 4
+
+    # Чтение своего пользователя сначала дописывает только его изменения
+    assert get_city_name(1).city_name == 'Kazan'
+    cursor = mock_connection.cursor.return_value
+    assert mock_execute_values.call_args_list == [
+        # Изменения столбцов не создают строку users (пользователь мог быть удален)
+        call(cursor,
+             'UPDATE public.users u SET city_name = v.city_name, sleep_goal = v.sleep_goal, '
+             'has_provided_location = v.has_provided_location '
+             'FROM (VALUES %s) AS v(id, city_name, sleep_goal, has_provided_location) WHERE u.id = v.id',
+             [{'user_id': 1, 'city_name': 'Kazan', 'has_provided_location': 1, 'sleep_goal': 7.5}],
+             '(%(user_id)s::bigint, %(city_name)s::text, %(sleep_goal)s::real, %(has_provided_location)s::integer)',
+             page_size=1),
+        call(cursor, SLEEP_RECORD_RATINGS_SQL, [{'id': 10, 'sleep_time': SLEEP_TIME, 'mood': 4, 'sleep_quality': 5}],
+             SLEEP_RECORD_RATINGS_TEMPLATE, page_size=1),
+    ]
+    mock_connection.commit.assert_called_once()
+    # Записанные оценки пересчитывают дневную сводку даты оцененной сессии
+    mock_refresh_daily_summary.assert_called_once_with(1, SLEEP_TIME)
+    assert buffer.has_pending(2) and not buffer.has_pending(1)
+
+    # Запрос по всем пользователям дописывает все изменения
+    get_all_users()
+    assert mock_execute_values.call_args.args[2] == [{'id': 20, 'sleep_time': SLEEP_TIME, 'mood': 3,
+                                                      'sleep_quality': None}]
+    assert buffer.stats()['pending'] == 0
+    assert buffer.stats()['flushed_users'] == 2
+
+
+@patch("db.db.fetch", return_value=(10, SLEEP_TIME))
+@patch("db.write_behind.execute_values")
+@patch("db.db.execute_query_pg")
+def test_synchronous_write_flushes_pending_first(mock_execute_query_pg, mock_execute_values, mock_fetch, buffer,
+                                                 mock_connection):
+    order = []
+    mock_execute_values.side_effect = lambda *args, **kwargs: order.append('flush')
+    mock_execute_query_pg.side_effect = lambda *args: order.append('finish')
+
+    save_mood_db(1, 4)
+    finish_sleep_session_db(1, MagicMock())
+
+    assert order == ['flush', 'finish']
+
+
+@patch("db.write_behind.execute_values")
+def test_failed_flush_is_retried_and_close_flushes_everything(mock_execute_values, buffer, mock_connection):
+    mock_execute_values.side_effect = psycopg2.OperationalError('server closed the connection')
+    save_sleep_goal_db(1, 7.0)
+
+    assert buffer.flush() == 0
+    save_sleep_goal_db(1, 8.0)
+    assert buffer.stats()['errors'] == 1
+    assert buffer.stats()['pending'] == 1
+
+    mock_execute_values.side_effect = None
+    set_write_buffer(None)
+    assert mock_execute_values.call_args.args[2] == [{'user_id': 1, 'sleep_goal': 8.0}]
+    assert buffer.stats()['pending'] == 0
+    assert buffer.stats()['closed']
+
+    # После закрытия буфера запись выполняется сразу
+    with patch("db.db.execute_query_pg") as mock_execute_query_pg:
+        assert buffer.put(1, 'users', {}) is False
+        save_sleep_goal_db(1, 9.0)
+        assert get_write_buffer() is None
+        mock_execute_query_pg.assert_called_once()
+
+
+@patch("db.write_behind.execute_values")
+def test_bad_data_is_dropped(mock_execute_values, buffer, mock_connection):
+    mock_execute_values.side_effect = psycopg2.DataError('invalid input syntax for type real')
+    save_sleep_goal_db(1, 'много')
+
+    assert buffer.flush() == 0
+    assert buffer.stats()['dropped'] == 1
+    assert not buffer.has_pending()